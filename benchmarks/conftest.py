@@ -0,0 +1,162 @@
+"""
+Benchmarks for the parsing and routing code, driven by synthetic streams. These are kept out of
+the default test run (see `testpaths` in pyproject.toml) and need `pytest-benchmark`, installed
+with the `benchmarks` extra.
+
+Record a baseline (e.g. before upgrading)::
+
+    pytest benchmarks --benchmark-autosave
+
+Then compare against it, failing if any benchmark's mean time has regressed by more than 15%::
+
+    pytest benchmarks --benchmark-compare --benchmark-compare-fail=mean:15%
+
+As well as timings, each benchmark reports events/s, per-event latency and peak memory (in the
+summary at the end of the run, and under `extra_info` in `--benchmark-json` output).
+"""
+
+import random
+import tracemalloc
+
+# results of each benchmark, for the summary
+_results = []
+
+
+class StreamPort:
+    """
+    In-process stand-in for a serial port which hands out a fixed stream of data in reads of
+    preset sizes, so that where lines get split between reads can be controlled.
+
+    Parameters
+    ----------
+    data : bytes
+        Data to hand out
+    chunkSizes : list[int]
+        Number of bytes available at each read
+    """
+    def __init__(self, data, chunkSizes):
+        self.data = data
+        self.chunkSizes = chunkSizes
+        self.rewind()
+
+    def rewind(self):
+        self._pos = 0
+        self._chunk = 0
+
+    @property
+    def in_waiting(self):
+        if self._chunk >= len(self.chunkSizes):
+            return 0
+        return self.chunkSizes[self._chunk]
+
+    def read(self, size=1):
+        data = self.data[self._pos:self._pos + size]
+        self._pos += len(data)
+        self._chunk += 1
+
+        return data
+
+    @property
+    def remaining(self):
+        return len(self.data) - self._pos
+
+
+def getChunkSizes(data, pattern, seed=0):
+    """
+    Get the sizes of reads to split a stream into, according to a splice pattern.
+
+    Parameters
+    ----------
+    data : bytes
+        Stream to split
+    pattern : str
+        One of:
+        - "lines": every read ends on a line break, so no lines are split
+        - "fixed": reads of 64 bytes, so most reads split a line
+        - "random": reads of 1-512 bytes
+    seed : int
+        Seed for random read sizes
+
+    Returns
+    -------
+    list[int]
+        Size of each read
+    """
+    if pattern == "lines":
+        # 64 whole lines per read
+        ends = [i + 1 for i, char in enumerate(data) if char == 0x0A][63::64]
+        if not ends or ends[-1] != len(data):
+            ends.append(len(data))
+        return [end - start for start, end in zip([0] + ends[:-1], ends)]
+    if pattern == "fixed":
+        return [64] * (len(data) // 64 + 1)
+    if pattern == "random":
+        rng = random.Random(seed)
+        sizes = []
+        total = 0
+        while total < len(data):
+            sizes.append(rng.randint(1, 512))
+            total += sizes[-1]
+        return sizes
+    raise ValueError(f"Unknown splice pattern: {pattern}")
+
+
+def runBenchmark(benchmark, func, nEvents, setup=None, rounds=None):
+    """
+    Benchmark a function which handles `nEvents` events, recording events/s, per-event latency
+    and peak memory alongside the timings.
+
+    Parameters
+    ----------
+    benchmark : pytest_benchmark.fixture.BenchmarkFixture
+        Fixture from the test
+    func : callable
+        Function to benchmark
+    nEvents : int
+        Number of events handled by each call to `func`
+    setup : callable or None
+        Function to call before each call to `func`, untimed
+    rounds : int or None
+        Number of rounds, or None to choose according to `nEvents`
+
+    Returns
+    -------
+    *
+        Return value of the last call to `func`
+    """
+    # with --benchmark-disable, just run func once (as a smoke test) as there's nothing to report
+    if benchmark.disabled:
+        return benchmark.pedantic(func, setup=setup, rounds=1, iterations=1)
+    if rounds is None:
+        rounds = int(min(20, max(1, 1e6 // nEvents)))
+    # measure peak memory on a separate call, as tracemalloc slows everything down
+    if setup is not None:
+        setup()
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    # time
+    result = benchmark.pedantic(func, setup=setup, rounds=rounds, iterations=1)
+    mean = benchmark.stats.stats.mean
+    benchmark.extra_info.update({
+        'events': nEvents,
+        'eventsPerSecond': nEvents / mean,
+        'latencyPerEvent': mean / nEvents,
+        'peakMemory': peak,
+    })
+    _results.append((benchmark.name, benchmark.extra_info))
+
+    return result
+
+
+def pytest_terminal_summary(terminalreporter):
+    if not _results:
+        return
+    terminalreporter.section("events/s, per-event latency and peak memory")
+    for name, info in _results:
+        terminalreporter.write_line(
+            f"{name:<60} {info['eventsPerSecond']:>14,.0f} ev/s "
+            f"{info['latencyPerEvent'] * 1e6:>10.3f} us/ev "
+            f"{info['peakMemory'] / 2**20:>10.2f} MiB"
+        )
@@ -0,0 +1,30 @@
+"""
+Throughput of decoding BlackBoxToolkit data dumps (the data between SDAT and EDAT).
+"""
+
+import pytest
+
+from psychopy_bbtk import decodeEvents
+from psychopy_bbtk.emulator import makeDumpBBTK, makeDumpBytes
+
+from .conftest import runBenchmark
+
+
+@pytest.mark.parametrize("nLines", [1000, 10000, 100000, 1000000])
+def test_decode(benchmark, nLines):
+    benchmark.group = "bbtk decode"
+    data = makeDumpBytes(nLines)
+    runBenchmark(benchmark, lambda: decodeEvents(data), nLines)
+
+
+@pytest.mark.parametrize("nLines", [1000, 100000])
+@pytest.mark.parametrize("asArray", [True, False], ids=["array", "dicts"])
+def test_getEvents(benchmark, nLines, asArray):
+    benchmark.group = "bbtk getEvents"
+    data = makeDumpBytes(nLines)
+    state = {}
+
+    def setup():
+        state['bbtk'] = makeDumpBBTK(data, maxRead=4096)
+
+    runBenchmark(benchmark, lambda: state['bbtk'].getEvents(asArray=asArray), nLines, setup=setup)
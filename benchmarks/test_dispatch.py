@@ -0,0 +1,126 @@
+"""
+Throughput and latency of TPad.dispatchMessages, reading from a TPad emulator or from an
+in-process stream, with different numbers of attached nodes and patterns of split lines.
+"""
+
+import sys
+import time
+
+import pytest
+
+from psychopy_bbtk.emulator import EmulatedTPad, TPadEmulator, emulatedPorts, makeEventBytes
+from psychopy_bbtk.tpad import TPadButtonGroup, TPadLightSensorGroup, TPadSoundSensorGroup
+
+from .conftest import StreamPort, getChunkSizes, runBenchmark
+
+pytestmark = pytest.mark.skipif(
+    sys.platform == "win32", reason="TPadEmulator needs a pseudo-terminal"
+)
+
+# node classes to attach, in turn
+nodeClasses = (TPadButtonGroup, TPadLightSensorGroup, TPadSoundSensorGroup)
+
+
+@pytest.fixture(scope="module")
+def pad():
+    emulator = TPadEmulator()
+    pad = EmulatedTPad(port=emulator.port)
+    yield pad
+    pad.close()
+    emulator.close()
+
+
+@pytest.fixture
+def attachNodes(pad):
+    """
+    Attach a given number of nodes to the pad (removing them again after the test)
+    """
+    nodes = []
+
+    def _attach(n):
+        for i in range(n):
+            cls = nodeClasses[i % len(nodeClasses)]
+            nodes.append(cls(pad, channels=2))
+        return nodes
+
+    yield _attach
+    for node in nodes:
+        pad.removeNode(node)
+
+
+def benchmarkDispatch(benchmark, pad, nodes, nEvents, pattern):
+    """
+    Benchmark dispatching a synthetic stream of button, opto and voice key events, read from an
+    in-process stream split according to a splice pattern (see `getChunkSizes`)
+    """
+    data = makeEventBytes(nEvents, devices=("A", "C", "M"), channels=(1, 2), seed=0)
+    port = StreamPort(data, getChunkSizes(data, pattern))
+    realPort = pad.com
+
+    def setup():
+        port.rewind()
+        pad._lastLine = b""
+        pad.messages.clear()
+        for node in nodes:
+            node.responses = []
+
+    def dispatch():
+        while port.remaining:
+            pad.dispatchMessages()
+
+    pad.com = port
+    try:
+        runBenchmark(benchmark, dispatch, nEvents, setup=setup)
+    finally:
+        pad.com = realPort
+    # make sure everything got through
+    assert sum(len(node.responses) for node in nodes if isinstance(node, nodeClasses[0])) > 0
+    assert len(pad.messages) == min(nEvents, pad.messages.capacity)
+
+
+@pytest.mark.parametrize("nNodes", [1, 3, 10])
+def test_dispatch_nodes(benchmark, pad, attachNodes, nNodes):
+    benchmark.group = "dispatch by nodes"
+    benchmarkDispatch(benchmark, pad, attachNodes(nNodes), 100000, "random")
+
+
+@pytest.mark.parametrize("pattern", ["lines", "fixed", "random"])
+def test_dispatch_splice(benchmark, pad, attachNodes, pattern):
+    benchmark.group = "dispatch by splice pattern"
+    benchmarkDispatch(benchmark, pad, attachNodes(3), 100000, pattern)
+
+
+@pytest.mark.parametrize("nEvents", [1000, 10000, 100000, 1000000])
+def test_dispatch_events(benchmark, pad, attachNodes, nEvents):
+    benchmark.group = "dispatch by events"
+    benchmarkDispatch(benchmark, pad, attachNodes(3), nEvents, "random")
+
+
+@pytest.mark.parametrize("threaded", [False, True], ids=["polled", "threaded"])
+def test_latency(benchmark, pad, attachNodes, threaded):
+    """
+    Time from the emulator sending an event to it arriving at a node, through a real
+    (pseudo-terminal) serial port
+    """
+    benchmark.group = "end-to-end latency"
+    buttons, = attachNodes(1)
+    emulator = emulatedPorts[pad.portString]
+
+    def setup():
+        buttons.responses = []
+
+    def roundTrip():
+        emulator.emit("A", 1, state=not buttons.state[0])
+        deadline = time.perf_counter() + 1
+        while not buttons.responses:
+            assert time.perf_counter() < deadline, "Event never arrived"
+            pad.dispatchMessages()
+            # yield, as a frame loop would, so a reader thread isn't starved of the GIL
+            time.sleep(0)
+
+    if threaded:
+        pad.startReader()
+    try:
+        runBenchmark(benchmark, roundTrip, 1, setup=setup, rounds=200)
+    finally:
+        pad.stopReader()
@@ -0,0 +1,42 @@
+"""
+Throughput of the single-pass byte parser `psychopy_bbtk.tpad.parseTPadBytes`, against the
+str/regex pipeline which TPad.dispatchMessages used to use.
+"""
+
+import re
+
+import pytest
+
+from psychopy_bbtk.emulator import makeEventBytes
+from psychopy_bbtk.tpad import messageFormat, parseTPadBytes, splitTPadMessage
+
+from .conftest import runBenchmark
+
+
+def parseLegacy(data):
+    """
+    The pipeline TPad.dispatchMessages used before parseTPadBytes: decode, split into lines, match
+    each line against messageFormat twice and convert with int/float.
+    """
+    events = []
+    for line in data.decode("utf-8").splitlines(keepends=True):
+        if re.match(messageFormat, line):
+            device, state, channel, time = splitTPadMessage(line)
+            events.append((device, state, int(channel), float(time) / 1000))
+
+    return events
+
+
+def parseBytes(data):
+    return [
+        (device, state, channel, ms / 1000) for device, state, channel, ms in parseTPadBytes(data)
+    ]
+
+
+@pytest.mark.parametrize("nEvents", [1000, 10000, 100000, 1000000])
+@pytest.mark.parametrize("parser", [parseLegacy, parseBytes], ids=["legacy", "bytes"])
+def test_parse(benchmark, parser, nEvents):
+    benchmark.group = f"parse {nEvents}"
+    data = makeEventBytes(nEvents, devices=("A", "C", "M"), channels=(1, 2), seed=0)
+    events = runBenchmark(benchmark, lambda: parser(data), nEvents)
+    assert len(events) == nEvents
@@ -0,0 +1,301 @@
+"""
+asyncio interface to BBTK devices, so they can be driven from an event loop without blocking it
+(e.g. several devices at once from one lab-control service).
+
+Serial I/O is never done on the event loop. A TPad is read by its background reader thread,
+which wakes the loop (via `call_soon_threadsafe`) whenever it has buffered new events. Anything
+else which talks to a device (opening it, commands, BBTK dumps) runs on a single worker thread
+per device, so commands to one device stay in order while different devices run concurrently.
+
+Usage
+-----
+```
+async with AsyncTPad(port="COM3") as pad:
+    buttons = await pad.makeNode(TPadButtonGroup, channels=10)
+    await pad.resetTimer()
+    async for evt in pad.iterEvents():
+        print(evt)
+
+async with AsyncBlackBoxToolkit(port="COM4") as bbtk:
+    await bbtk.clearMemory()
+    await bbtk.recordStimulusData(duration=10)
+    async for chunk in bbtk.iterEvents(chunkSize=1024):
+        ...
+```
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import functools
+
+from psychopy_bbtk.bbtk import BlackBoxToolkit
+from psychopy_bbtk.buffers import TPadEvent
+from psychopy_bbtk.tpad import TPad
+
+# marks the end of a generator run on a worker thread
+_exhausted = object()
+
+
+class AsyncDevice:
+    """
+    Base class for asyncio wrappers around a blocking device. Use as an async context manager,
+    which opens the device (on its worker thread) on entry and closes it on exit.
+
+    Parameters
+    ----------
+    device : BaseDevice or None
+        An already open device to wrap. If None, a device of class `deviceClass` is opened with
+        the given keyword arguments.
+    **kwargs
+        Arguments to open the device with
+    """
+    # class of device to open
+    deviceClass = None
+
+    def __init__(self, device=None, **kwargs):
+        self.device = device
+        self._kwargs = kwargs
+        # one worker thread, so calls to the device happen one at a time and in order
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix=type(self).__name__
+        )
+
+    async def __aenter__(self):
+        await self.open()
+
+        return self
+
+    async def __aexit__(self, excType, excVal, excTb):
+        await self.close()
+
+    async def run(self, func, *args, **kwargs):
+        """
+        Call a blocking function on this device's worker thread.
+
+        Parameters
+        ----------
+        func : callable
+            Function to call, e.g. a method of the device or of one of its nodes
+        *args, **kwargs
+            Arguments to call it with
+
+        Returns
+        -------
+        *
+            Return value of the function
+        """
+        loop = asyncio.get_running_loop()
+
+        return await loop.run_in_executor(
+            self._executor, functools.partial(func, *args, **kwargs)
+        )
+
+    async def open(self):
+        """
+        Open the device, if not already open.
+        """
+        if self.device is None:
+            self.device = await self.run(self.deviceClass, **self._kwargs)
+
+    async def close(self):
+        """
+        Close the device and stop its worker thread.
+        """
+        if self.device is not None:
+            await self.run(self.device.close)
+        self._executor.shutdown(wait=False)
+
+    async def _iterBlocking(self, gen):
+        """
+        Iterate over a blocking generator, fetching each item on the worker thread.
+        """
+        while True:
+            item = await self.run(next, gen, _exhausted)
+            if item is _exhausted:
+                return
+            yield item
+
+
+class AsyncTPad(AsyncDevice):
+    """
+    asyncio wrapper around a `TPad`. Its background reader thread is started if it isn't running
+    already, so events are read off the serial port without involving the event loop.
+
+    Parameters
+    ----------
+    device : TPad or None
+        An already open TPad to wrap. If None, a TPad is opened with the given keyword arguments.
+    bufferSize : int
+        Maximum number of events for the reader thread (and for the tap which events are read
+        from, see `TPad.addTap`) to hold between calls to `events`
+    **kwargs
+        Arguments to open the TPad with (see `TPad`)
+    """
+    deviceClass = TPad
+
+    def __init__(self, device=None, bufferSize=4096, **kwargs):
+        AsyncDevice.__init__(self, device=device, **kwargs)
+        self.bufferSize = bufferSize
+        self._loop = None
+        self._newEvents = None
+        self._wakePending = False
+        self._tap = None
+
+    async def open(self):
+        await AsyncDevice.open(self)
+        self._loop = asyncio.get_running_loop()
+        self._newEvents = asyncio.Event()
+        # get a copy of every event dispatched, by any thread, waking the loop when there are new
+        # ones
+        self._tap = self.device.addTap(capacity=self.bufferSize, onPush=self._onRead)
+        # start reading in the background, waking the loop when there are new events to dispatch
+        await self.run(self.device.startReader, bufferSize=self.bufferSize, onRead=self._onRead)
+
+    async def close(self):
+        if self.device is not None:
+            self.device.onRead = None
+            if self._tap is not None:
+                self.device.removeTap(self._tap)
+        await AsyncDevice.close(self)
+
+    def _onRead(self):
+        # called on the reader thread (or whichever thread dispatched), so only schedule a wake
+        # up (once per batch of reads)
+        if self._wakePending:
+            return
+        self._wakePending = True
+        self._loop.call_soon_threadsafe(self._wake)
+
+    def _wake(self):
+        self._wakePending = False
+        self._newEvents.set()
+
+    async def events(self, timeout=None):
+        """
+        Wait for events from the TPad, dispatch them to its nodes and return them. Events
+        dispatched by another thread (e.g. by a node polled elsewhere) are returned too.
+
+        Parameters
+        ----------
+        timeout : float or None
+            Time (s) to wait for events, or None to wait indefinitely
+
+        Returns
+        -------
+        list[TPadEvent]
+            New events, in the order they were received (an empty list if timed out)
+        """
+        pad = self.device
+        deadline = None if timeout is None else self._loop.time() + timeout
+        while True:
+            self._newEvents.clear()
+            # dispatch to nodes (only popping what the reader thread has parsed, so this never
+            # touches the port), unless another thread is already dispatching - either way, the
+            # events reach the tap
+            pad.tryDispatchMessages()
+            events = self._tap.popAll()
+            if events:
+                break
+            remaining = None if deadline is None else deadline - self._loop.time()
+            if remaining is not None and remaining <= 0:
+                return []
+            try:
+                await asyncio.wait_for(self._newEvents.wait(), remaining)
+            except asyncio.TimeoutError:
+                return []
+
+        return [TPadEvent(t, device, channel, state) for device, state, channel, t in events]
+
+    async def iterEvents(self):
+        """
+        Iterate over events from the TPad as they arrive, dispatching them to its nodes (see
+        `events`).
+
+        Yields
+        ------
+        TPadEvent
+            Each event
+        """
+        while True:
+            for evt in await self.events():
+                yield evt
+
+    async def makeNode(self, nodeClass, **kwargs):
+        """
+        Make a node (e.g. `TPadButtonGroup`) attached to this TPad.
+
+        Parameters
+        ----------
+        nodeClass : type
+            Class of node to make
+        **kwargs
+            Arguments to make the node with, other than `pad`
+
+        Returns
+        -------
+        BaseDevice
+            The new node
+        """
+        return await self.run(nodeClass, self.device, **kwargs)
+
+    async def setMode(self, mode):
+        """
+        See `TPad.setMode`.
+        """
+        return await self.run(self.device.setMode, mode)
+
+    async def resetTimer(self, **kwargs):
+        """
+        See `TPad.resetTimer`.
+        """
+        return await self.run(self.device.resetTimer, **kwargs)
+
+    async def profileLatency(self, **kwargs):
+        """
+        See `TPad.profileLatency`.
+        """
+        return await self.run(self.device.profileLatency, **kwargs)
+
+
+class AsyncBlackBoxToolkit(AsyncDevice):
+    """
+    asyncio wrapper around a `BlackBoxToolkit`, running each command on a worker thread so that
+    long waits (e.g. for memory to clear) don't block the event loop.
+
+    Parameters
+    ----------
+    device : BlackBoxToolkit or None
+        An already open BlackBoxToolkit to wrap. If None, one is opened with the given keyword
+        arguments.
+    **kwargs
+        Arguments to open the BlackBoxToolkit with (see `BlackBoxToolkit`)
+    """
+    deviceClass = BlackBoxToolkit
+
+    async def clearMemory(self):
+        """
+        See `BlackBoxToolkit.clearMemory`.
+        """
+        return await self.run(self.device.clearMemory)
+
+    async def recordStimulusData(self, duration):
+        """
+        See `BlackBoxToolkit.recordStimulusData`.
+        """
+        return await self.run(self.device.recordStimulusData, duration)
+
+    async def getEvents(self, timeout=10, asArray=False):
+        """
+        See `BlackBoxToolkit.getEvents`.
+        """
+        return await self.run(self.device.getEvents, timeout=timeout, asArray=asArray)
+
+    async def iterEvents(self, timeout=10, chunkSize=None):
+        """
+        Iterate over events as they come off the port, see `BlackBoxToolkit.iterEvents`. Each
+        item is fetched on the worker thread, so for long recordings give a `chunkSize` to keep
+        the number of round trips down.
+        """
+        gen = self.device.iterEvents(timeout=timeout, chunkSize=chunkSize)
+        async for item in self._iterBlocking(gen):
+            yield item
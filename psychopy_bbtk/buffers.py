@@ -0,0 +1,353 @@
+"""
+Buffer classes used to pass events received from a TPad between threads and to store them.
+"""
+
+from array import array
+from bisect import bisect_left, bisect_right
+
+
+class EventRingBuffer:
+    """
+    Fixed-size, single-producer/single-consumer ring buffer.
+
+    One thread (the producer) calls `push` and one thread (the consumer) calls `pop`/`popAll`.
+    Each side only ever writes its own index, so no lock is needed: under the GIL, assigning a
+    slot and then advancing an int index is atomic as far as the other side can observe. If the
+    buffer is full, new items are dropped (rather than overwriting unread ones) and counted in
+    `dropped`.
+
+    Parameters
+    ----------
+    capacity : int
+        Maximum number of items which can be held before new items are dropped.
+    """
+    def __init__(self, capacity=4096):
+        if capacity < 1:
+            raise ValueError(f"EventRingBuffer capacity must be at least 1, not {capacity}")
+        self.capacity = capacity
+        # preallocate slots
+        self._slots = [None] * capacity
+        # total number of items ever written (only modified by producer)
+        self._head = 0
+        # total number of items ever read (only modified by consumer)
+        self._tail = 0
+        # number of items dropped because the buffer was full (only modified by producer)
+        self.dropped = 0
+
+    def __len__(self):
+        return self._head - self._tail
+
+    def push(self, item):
+        """
+        Add an item to the buffer (producer side).
+
+        Parameters
+        ----------
+        item : *
+            Item to add
+
+        Returns
+        -------
+        bool
+            True if the item was added, False if the buffer was full and it was dropped
+        """
+        head = self._head
+        # if full, drop
+        if head - self._tail >= self.capacity:
+            self.dropped += 1
+            return False
+        # write slot before advancing head, so the consumer never sees an unwritten slot
+        self._slots[head % self.capacity] = item
+        self._head = head + 1
+
+        return True
+
+    def pop(self):
+        """
+        Remove and return the oldest item in the buffer (consumer side).
+
+        Returns
+        -------
+        *
+            The oldest item, or None if the buffer is empty
+        """
+        tail = self._tail
+        if tail >= self._head:
+            return None
+        # get item and release the slot
+        i = tail % self.capacity
+        item = self._slots[i]
+        self._slots[i] = None
+        self._tail = tail + 1
+
+        return item
+
+    def popAll(self):
+        """
+        Remove and return every item currently in the buffer (consumer side).
+
+        Returns
+        -------
+        list
+            All items in the buffer, oldest first
+        """
+        tail = self._tail
+        # take a snapshot of head, anything pushed after this is left for the next call
+        head = self._head
+        items = []
+        for n in range(tail, head):
+            i = n % self.capacity
+            items.append(self._slots[i])
+            self._slots[i] = None
+        self._tail = head
+
+        return items
+
+
+class EventTap(EventRingBuffer):
+    """
+    Ring buffer which a TPad pushes a copy of every event it dispatches into (see
+    `TPad.addTap`), whichever thread dispatched them. This lets something other than the TPad's
+    nodes (e.g. a `TPadPool`) see every event without becoming a second consumer of the TPad's
+    own buffers.
+
+    Dispatches are serialised by the TPad, so they act as the single producer. Whoever added the
+    tap is its single consumer.
+
+    Parameters
+    ----------
+    capacity : int
+        Maximum number of events which can be held before new events are dropped.
+    onPush : callable or None
+        Function to call (from the dispatching thread, with no arguments) each time new events
+        have been pushed, e.g. to wake up an event loop.
+    """
+    def __init__(self, capacity=4096, onPush=None):
+        EventRingBuffer.__init__(self, capacity=capacity)
+        self.onPush = onPush
+
+    def extend(self, items):
+        """
+        Add several items to the buffer (producer side), then call `onPush` if given.
+
+        Parameters
+        ----------
+        items : list
+            Items to add, oldest first
+        """
+        for item in items:
+            self.push(item)
+        if items and self.onPush is not None:
+            self.onPush()
+
+
+class TPadEvent:
+    """
+    A single event stored in an `EventStore`.
+
+    Parameters
+    ----------
+    t : float
+        Time (s) of the event
+    device : str
+        Device code, see `psychopy_bbtk.tpad.channelCodes`
+    channel : int
+        Channel number
+    state : str
+        State code, see `psychopy_bbtk.tpad.stateCodes`
+    """
+    __slots__ = ("t", "device", "channel", "state")
+
+    def __init__(self, t, device, channel, state):
+        self.t = t
+        self.device = device
+        self.channel = channel
+        self.state = state
+
+    def __repr__(self):
+        return (
+            f"<TPadEvent: t={self.t}, device={self.device}, channel={self.channel}, "
+            f"state={self.state}>"
+        )
+
+    def __eq__(self, other):
+        if not isinstance(other, TPadEvent):
+            return NotImplemented
+        return (self.t, self.device, self.channel, self.state) == (
+            other.t, other.device, other.channel, other.state
+        )
+
+
+class EventStore:
+    """
+    Compact, time-ordered store of TPad events, backed by parallel typed arrays (time, device
+    code, channel, state) rather than a dict, so simultaneous events are never lost and memory
+    per event is small and fixed.
+
+    Parameters
+    ----------
+    capacity : int or None
+        Maximum number of events to keep, oldest events are evicted first. None for no limit.
+    maxAge : float or None
+        Maximum age (s) of events to keep, relative to the newest event. None for no limit.
+    """
+    def __init__(self, capacity=None, maxAge=None):
+        self.capacity = capacity
+        self.maxAge = maxAge
+        # parallel arrays
+        self._t = array("d")
+        self._device = array("B")
+        self._channel = array("B")
+        self._state = array("B")
+        # index of the oldest live event (evicted events are only removed from the arrays in
+        # bulk, so eviction stays cheap)
+        self._start = 0
+        # total number of events evicted
+        self.evicted = 0
+
+    def __len__(self):
+        return len(self._t) - self._start
+
+    def __iter__(self):
+        for i in range(self._start, len(self._t)):
+            yield self._record(i)
+
+    def __getitem__(self, i):
+        n = len(self)
+        if i < 0:
+            i += n
+        if not 0 <= i < n:
+            raise IndexError(f"EventStore index {i} out of range for {n} events")
+
+        return self._record(self._start + i)
+
+    def _record(self, i):
+        return TPadEvent(
+            t=self._t[i],
+            device=chr(self._device[i]),
+            channel=self._channel[i],
+            state=chr(self._state[i]),
+        )
+
+    def append(self, t, device, channel, state):
+        """
+        Add an event to the store, keeping it in time order.
+
+        Parameters
+        ----------
+        t : float
+            Time (s) of the event
+        device : str
+            Device code, see `psychopy_bbtk.tpad.channelCodes`
+        channel : int
+            Channel number
+        state : str
+            State code, see `psychopy_bbtk.tpad.stateCodes`
+        """
+        times = self._t
+        if len(times) > self._start and t < times[-1]:
+            # if out of order (e.g. straight after a timer reset), insert after any events at
+            # the same time
+            i = bisect_right(times, t, self._start)
+            times.insert(i, t)
+            self._device.insert(i, ord(device))
+            self._channel.insert(i, channel)
+            self._state.insert(i, ord(state))
+        else:
+            # otherwise just append
+            times.append(t)
+            self._device.append(ord(device))
+            self._channel.append(channel)
+            self._state.append(ord(state))
+        # evict any events outside of the limits
+        self._evict()
+
+    def _evict(self):
+        n = len(self._t)
+        start = self._start
+        # evict by count
+        if self.capacity is not None and n - start > self.capacity:
+            start = n - self.capacity
+        # evict by age
+        if self.maxAge is not None and start < n:
+            cutoff = self._t[-1] - self.maxAge
+            if self._t[start] < cutoff:
+                start = bisect_left(self._t, cutoff, start)
+        if start == self._start:
+            return
+        self.evicted += start - self._start
+        self._start = start
+        # once evicted events outnumber live ones, remove them from the arrays
+        if start > max(1024, n - start):
+            for arr in (self._t, self._device, self._channel, self._state):
+                del arr[:start]
+            self._start = 0
+
+    def _indices(self, start=None, stop=None):
+        """
+        Get the array indices of events with `start <= t < stop`, by binary search.
+        """
+        lo = self._start
+        hi = len(self._t)
+        if start is not None:
+            lo = bisect_left(self._t, start, lo, hi)
+        if stop is not None:
+            hi = bisect_left(self._t, stop, lo, hi)
+
+        return lo, hi
+
+    def between(self, start=None, stop=None):
+        """
+        Get all events in a time range.
+
+        Parameters
+        ----------
+        start : float or None
+            Time (s) from which to get events (inclusive), or None to get from the oldest event.
+        stop : float or None
+            Time (s) until which to get events (exclusive), or None to get until the newest
+            event.
+
+        Returns
+        -------
+        list[TPadEvent]
+            Events in the given range, in time order
+        """
+        lo, hi = self._indices(start, stop)
+
+        return [self._record(i) for i in range(lo, hi)]
+
+    def getArrays(self, start=None, stop=None):
+        """
+        Get the stored events in a time range as typed arrays.
+
+        Parameters
+        ----------
+        start : float or None
+            Time (s) from which to get events (inclusive), or None to get from the oldest event.
+        stop : float or None
+            Time (s) until which to get events (exclusive), or None to get until the newest
+            event.
+
+        Returns
+        -------
+        dict[str:array.array]
+            Copies of the arrays for `t` (s), `device` (device code as a byte), `channel` and
+            `state` (state code as a byte)
+        """
+        lo, hi = self._indices(start, stop)
+
+        return {
+            't': self._t[lo:hi],
+            'device': self._device[lo:hi],
+            'channel': self._channel[lo:hi],
+            'state': self._state[lo:hi],
+        }
+
+    def clear(self):
+        """
+        Remove all events from the store.
+        """
+        for arr in (self._t, self._device, self._channel, self._state):
+            del arr[:]
+        self._start = 0
@@ -0,0 +1,693 @@
+"""
+Fast threshold calibration for TPad sensors. Rather than switching mode and sleeping for every
+probe, a calibration:
+
+- Stays in command mode (mode 0) for the whole search.
+- Probes every channel at once, sending one threshold command per channel and reading all the
+  replies together.
+- Waits only as long as the sensors take to respond to a change of screen, rather than a fixed
+  time.
+- Searches each channel's level by bracketing then bisecting, starting from the last good result
+  for the same port and display if there is one, so recalibrating an unchanged rig takes only a
+  few probes.
+
+Calibrations can also be saved to disk (see `CalibrationStore`), by the identity of the TPad, so
+that a later session on the same rig can check them with a single probe rather than calibrating
+from scratch.
+
+Levels are in the TPad's own units: thresholds are sent as an integer from 0 to 255, and a sensor
+reads 1 if what it sees is above the threshold. The "level" of a channel is the highest threshold
+at which it still reads 1 (-1 if it never does).
+"""
+
+import json
+import os
+from pathlib import Path
+import threading
+import time
+
+from psychopy import logging
+
+# highest threshold the TPad accepts
+maxLevel = 255
+
+
+def toLevel(threshold):
+    """
+    Convert a threshold (0-1) to the integer level (0-255) sent to the TPad.
+    """
+    return min(max(round(threshold * maxLevel), 0), maxLevel)
+
+
+class ThresholdProber:
+    """
+    Probes sensor channels within a command session, by setting a threshold on each and reading
+    back whether the sensor is above it.
+
+    Parameters
+    ----------
+    session : psychopy_bbtk.tpad.TPadCommandSession
+        Session to send commands through
+    command : str
+        Threshold command, e.g. `AAO` for optos or `AAVK` for voice keys
+    timeout : float
+        Time (s) to wait for each reply
+    retries : int
+        Number of times to probe again if a channel doesn't reply
+    """
+    def __init__(self, session, command="AAO", timeout=0.1, retries=2):
+        self.session = session
+        self.command = command
+        self.timeout = timeout
+        self.retries = retries
+        # number of rounds of probes sent, for reporting
+        self.nProbes = 0
+
+    def probe(self, levels):
+        """
+        Set a threshold on each of some channels at once, and read back whether each sensor is
+        above it.
+
+        Parameters
+        ----------
+        levels : dict[int:int]
+            Threshold (0-255) to set, by channel (numbered from 0)
+
+        Returns
+        -------
+        dict[int:bool or None]
+            Whether each sensor read above its threshold, by channel. Channels which never replied
+            read as None.
+        """
+        results = {}
+        remaining = dict(levels)
+        for attempt in range(self.retries + 1):
+            # send a command per channel, then read all the replies together
+            replies = {
+                channel: self.session.send(f"{self.command}{channel + 1} {int(level)}")
+                for channel, level in remaining.items()
+            }
+            self.session.flush(timeout=self.timeout)
+            self.nProbes += 1
+            # keep any which replied, retry any which didn't
+            for channel, reply in replies.items():
+                if reply.measurement is not None:
+                    results[channel] = reply.measurement
+                    del remaining[channel]
+            if not remaining:
+                break
+        for channel in remaining:
+            logging.warning(
+                f"TPad on {self.session.pad.portString} didn't reply to threshold probes on "
+                f"channel {channel}."
+            )
+            results[channel] = None
+
+        return results
+
+    def awaitSettled(self, levels, expected=None, timeout=0.1, nStable=2, minTime=0.02):
+        """
+        Probe repeatedly until the sensors have responded to a change (e.g. of screen color),
+        rather than waiting a fixed time.
+
+        Parameters
+        ----------
+        levels : dict[int:int]
+            Threshold (0-255) to probe each channel at, by channel
+        expected : dict[int:bool] or None
+            What each channel should read once settled. Channels without an expected reading are
+            settled once they've read the same `nStable` times in a row for at least `minTime`.
+        timeout : float
+            Maximum time (s) to wait
+        nStable : int
+            Number of matching readings in a row for a channel to count as settled
+        minTime : float
+            Minimum time (s) to wait for channels without an expected reading, as there's no way
+            to tell whether they've seen the change yet (this only needs to cover a frame or so)
+
+        Returns
+        -------
+        float
+            Time (s) taken to settle, or None if timed out
+        """
+        if expected is None:
+            expected = {}
+        start = time.perf_counter()
+        last = {}
+        streak = {channel: 0 for channel in levels}
+        while True:
+            readings = self.probe(levels)
+            for channel, value in readings.items():
+                if channel in expected and value != expected[channel]:
+                    # not changed yet
+                    streak[channel] = 0
+                elif value == last.get(channel):
+                    streak[channel] += 1
+                else:
+                    streak[channel] = 1
+            last = readings
+            elapsed = time.perf_counter() - start
+            if all(n >= nStable for n in streak.values()):
+                if elapsed >= minTime or all(channel in expected for channel in levels):
+                    return elapsed
+            if elapsed >= timeout:
+                return None
+
+
+class LevelSearch:
+    """
+    Search for the level of one channel (the highest threshold at which it reads 1), by
+    bracketing outwards from a guess and then bisecting.
+
+    Parameters
+    ----------
+    guess : int or None
+        Expected level, e.g. from a previous calibration. If None, bisects the whole range.
+    step : int
+        Distance either side of the guess to probe first, doubled each time the level turns out
+        to be further away
+    """
+    def __init__(self, guess=None, step=4):
+        # highest threshold known to read 1, and lowest known to read 0
+        self.lo = -1
+        self.hi = maxLevel + 1
+        self.step = step
+        # next threshold to probe while bracketing (None once bracketed)
+        self._next = None
+        if guess is not None:
+            self._next = min(max(int(guess), 0), maxLevel)
+
+    @property
+    def done(self):
+        return self.hi - self.lo <= 1
+
+    @property
+    def level(self):
+        """
+        Level found (or the best estimate so far)
+        """
+        return self.lo
+
+    def nextThreshold(self):
+        """
+        Threshold to probe next, or None if the level has been found
+        """
+        if self.done:
+            return None
+        if self._next is not None:
+            return self._next
+
+        return (self.lo + self.hi) // 2
+
+    def update(self, threshold, value):
+        """
+        Narrow the search according to a probe.
+
+        Parameters
+        ----------
+        threshold : int
+            Threshold probed
+        value : bool
+            Whether the sensor read 1
+        """
+        if value:
+            self.lo = max(self.lo, threshold)
+        else:
+            self.hi = min(self.hi, threshold)
+        if self._next is None:
+            return
+        # keep stepping outwards until the level is bracketed on both sides
+        if value and self.hi > maxLevel:
+            self._next = min(threshold + self.step, maxLevel)
+        elif not value and self.lo < 0:
+            self._next = max(threshold - self.step, 0)
+        else:
+            self._next = None
+        self.step *= 2
+
+
+def findLevels(prober, channels, guesses=None, step=4):
+    """
+    Find the level of each of some channels at once, probing all channels in each round.
+
+    Parameters
+    ----------
+    prober : ThresholdProber
+        Prober to probe with
+    channels : list[int]
+        Channels to search (numbered from 0)
+    guesses : dict[int:int] or None
+        Expected level of each channel, if known
+    step : int
+        Initial bracketing step when there's a guess, see `LevelSearch`
+
+    Returns
+    -------
+    dict[int:int]
+        Level of each channel (-1 if it never reads 1)
+    """
+    if guesses is None:
+        guesses = {}
+    searches = {channel: LevelSearch(guesses.get(channel), step=step) for channel in channels}
+    while True:
+        # next threshold for every channel still searching
+        levels = {
+            channel: search.nextThreshold()
+            for channel, search in searches.items() if not search.done
+        }
+        if not levels:
+            break
+        for channel, value in prober.probe(levels).items():
+            searches[channel].update(levels[channel], value)
+
+    return {channel: search.level for channel, search in searches.items()}
+
+
+class ThresholdCache:
+    """
+    The levels last found for each channel under each condition (e.g. a black and a white screen),
+    by port and display, to start the next calibration from.
+    """
+    def __init__(self):
+        self._levels = {}
+        self._lock = threading.Lock()
+
+    def get(self, port, display, channel):
+        """
+        Get the levels last found for a channel.
+
+        Parameters
+        ----------
+        port : str
+            Port of the TPad
+        display : str
+            Key of the display calibrated against, see `getDisplayKey`
+        channel : int
+            Channel (numbered from 0)
+
+        Returns
+        -------
+        dict[str:int] or None
+            Level under each condition, or None if this channel hasn't been calibrated
+        """
+        with self._lock:
+            return self._levels.get((port, display, channel))
+
+    def set(self, port, display, channel, levels):
+        """
+        Store the levels found for a channel.
+
+        Parameters
+        ----------
+        port : str
+            Port of the TPad
+        display : str
+            Key of the display calibrated against, see `getDisplayKey`
+        channel : int
+            Channel (numbered from 0)
+        levels : dict[str:int]
+            Level under each condition
+        """
+        with self._lock:
+            self._levels[(port, display, channel)] = dict(levels)
+
+    def clear(self):
+        """
+        Forget all stored levels.
+        """
+        with self._lock:
+            self._levels.clear()
+
+
+# levels found by previous calibrations in this session
+thresholdCache = ThresholdCache()
+
+
+def getDisplayKey(win):
+    """
+    Get a key identifying the display a window is on, so that levels found on one display
+    aren't used as a starting point for another.
+
+    Parameters
+    ----------
+    win : psychopy.visual.Window or None
+        Window to identify the display of
+
+    Returns
+    -------
+    str
+        Key made from the screen number, window size and monitor name
+    """
+    if win is None:
+        return ""
+    screen = getattr(win, "screen", 0)
+    size = "x".join(str(int(n)) for n in getattr(win, "size", ()))
+    monitor = getattr(getattr(win, "monitor", None), "name", "")
+
+    return f"{screen}:{size}:{monitor}"
+
+
+def calibrateOptos(pad, channels, present, display="", cache=thresholdCache, settle=0.1,
+                   minContrast=2):
+    """
+    Find a threshold for each of some optos, between the levels they read for a black and a
+    white screen, in one command session.
+
+    Parameters
+    ----------
+    pad : psychopy_bbtk.tpad.TPad
+        TPad the optos are connected to
+    channels : list[int]
+        Opto channels to calibrate (numbered from 0)
+    present : callable
+        Function which, given a color name ("black" or "white"), shows that color under the
+        optos
+    display : str
+        Key of the display being calibrated against (see `getDisplayKey`), for caching
+    cache : ThresholdCache or None
+        Cache to start from and store results in, or None to always do a full search
+    settle : float
+        Maximum time (s) to wait for the optos to respond to a change of screen
+    minContrast : int
+        Minimum difference between the black and white levels for an opto to count as working
+
+    Returns
+    -------
+    dict[int:float or None]
+        Threshold (0-1) for each channel, or None for any which didn't respond to the screen
+    """
+    start = time.perf_counter()
+    # starting points from the last calibration
+    cached = {}
+    if cache is not None:
+        for channel in channels:
+            levels = cache.get(pad.portString, display, channel)
+            if levels is not None:
+                cached[channel] = levels
+    found = {}
+    with pad.commandSession() as session:
+        prober = ThresholdProber(session, command="AAO")
+        for color in ("black", "white"):
+            present(color)
+            # wait for the optos to see the new color
+            if color == "black":
+                # should no longer read 1 at the white level, if known
+                reference = {
+                    channel: cached[channel]['white'] if channel in cached else maxLevel // 2
+                    for channel in channels
+                }
+                expected = {channel: False for channel in cached}
+            else:
+                # should now read 1 just above the black level
+                reference = {
+                    channel: min(found['black'][channel] + 1, maxLevel) for channel in channels
+                }
+                expected = {channel: True for channel in channels}
+            if prober.awaitSettled(reference, expected=expected, timeout=settle) is None:
+                logging.debug(f"Optos on {pad.portString} didn't settle on {color} within {settle}s")
+            # search
+            guesses = {channel: cached[channel][color] for channel in cached}
+            found[color] = findLevels(prober, channels, guesses=guesses)
+        # pick a threshold between black and white for each working channel
+        thresholds = {}
+        for channel in channels:
+            black, white = found['black'][channel], found['white'][channel]
+            logging.debug(
+                f"Opto {channel} on {pad.portString} has level {black} on black and {white} on "
+                f"white"
+            )
+            if white - black < minContrast:
+                logging.debug(
+                    f"Could not detect a reasonable threshold for opto {channel} on "
+                    f"{pad.portString}, sensor may be unplugged."
+                )
+                thresholds[channel] = None
+                session.send(f"AAO{channel + 1} 0")
+                continue
+            level = (black + white + 1) // 2
+            thresholds[channel] = level / maxLevel
+            session.send(f"AAO{channel + 1} {level}")
+            # remember for next time
+            if cache is not None:
+                cache.set(pad.portString, display, channel, {'black': black, 'white': white})
+        session.flush()
+    logging.debug(
+        f"Calibrated optos {channels} on {pad.portString} in {prober.nProbes} probes "
+        f"({time.perf_counter() - start:.3f}s)"
+    )
+
+    return thresholds
+
+
+def applyThresholds(pad, thresholds, command="AAO"):
+    """
+    Set thresholds on each of some channels in one round of commands, and check that every
+    channel replied.
+
+    Parameters
+    ----------
+    pad : psychopy_bbtk.tpad.TPad
+        TPad the sensors are connected to
+    thresholds : dict[int:float]
+        Threshold (0-1) for each channel (numbered from 0)
+    command : str
+        Threshold command, e.g. `AAO` for optos or `AAVK` for voice keys
+
+    Returns
+    -------
+    dict[int:bool or None]
+        Whether each sensor read above its new threshold, None for any which didn't reply
+    """
+    with pad.commandSession() as session:
+        prober = ThresholdProber(session, command=command, retries=0)
+        return prober.probe(
+            {channel: toLevel(threshold) for channel, threshold in thresholds.items()}
+        )
+
+
+def verifyThresholds(pad, thresholds, present, conditions, command="AAO", settle=0.1):
+    """
+    Check that thresholds for some sensors (e.g. from a previous session) still tell apart a
+    set of conditions, with one probe per condition (plus however long the sensors take to
+    respond to each). Leaves the thresholds set on the TPad.
+
+    Parameters
+    ----------
+    pad : psychopy_bbtk.tpad.TPad
+        TPad the sensors are connected to
+    thresholds : dict[int:float]
+        Threshold (0-1) for each channel (numbered from 0) to check
+    present : callable
+        Function which, given the name of a condition, puts the sensors under it
+    conditions : list[tuple[str, bool]]
+        Name of each condition, in the order to present them, and whether every sensor should
+        read above its threshold under it
+    command : str
+        Threshold command, e.g. `AAO` for optos or `AAVK` for voice keys
+    settle : float
+        Maximum time (s) to wait for the sensors to respond to each condition
+
+    Returns
+    -------
+    bool
+        True if every sensor read as expected under every condition
+    """
+    levels = {channel: toLevel(threshold) for channel, threshold in thresholds.items()}
+    if not levels:
+        return False
+    with pad.commandSession() as session:
+        prober = ThresholdProber(session, command=command)
+        for condition, expected in conditions:
+            present(condition)
+            settled = prober.awaitSettled(
+                levels, expected={channel: expected for channel in levels}, timeout=settle,
+                nStable=1
+            )
+            if settled is None:
+                logging.debug(
+                    f"Stored thresholds ({command}) on {pad.portString} didn't read as "
+                    f"expected under {condition}"
+                )
+                return False
+
+    return True
+
+
+def verifyOptos(pad, thresholds, present, settle=0.1):
+    """
+    Check that thresholds for some optos still tell black from white, see `verifyThresholds`.
+
+    Parameters
+    ----------
+    pad : psychopy_bbtk.tpad.TPad
+        TPad the optos are connected to
+    thresholds : dict[int:float]
+        Threshold (0-1) for each channel (numbered from 0) to check
+    present : callable
+        Function which, given a color name ("black" or "white"), shows that color under the
+        optos
+    settle : float
+        Maximum time (s) to wait for the optos to see each color
+
+    Returns
+    -------
+    bool
+        True if every opto read 1 on white and 0 on black
+    """
+    return verifyThresholds(
+        pad, thresholds, present, conditions=(("white", True), ("black", False)), command="AAO",
+        settle=settle
+    )
+
+
+def verifyVoiceKeys(pad, thresholds, play, settle=0.5):
+    """
+    Check that thresholds for some voice keys still tell a test sound from silence, see
+    `verifyThresholds`.
+
+    Parameters
+    ----------
+    pad : psychopy_bbtk.tpad.TPad
+        TPad the voice keys are connected to
+    thresholds : dict[int:float]
+        Threshold (0-1) for each channel (numbered from 0) to check
+    play : callable
+        Function which, given "sound" or "silence", starts or stops the test sound
+    settle : float
+        Maximum time (s) to wait for the voice keys to hear the sound (or its end)
+
+    Returns
+    -------
+    bool
+        True if every voice key read 1 with the sound playing and 0 in silence
+    """
+    return verifyThresholds(
+        pad, thresholds, play, conditions=(("sound", True), ("silence", False)), command="AAVK",
+        settle=settle
+    )
+
+
+def getStorePath():
+    """
+    Get the default location of the calibration store, in the PsychoPy user folder.
+
+    Returns
+    -------
+    pathlib.Path
+        Path to the store
+    """
+    from psychopy import prefs
+
+    return Path(prefs.paths['userPrefsDir']) / "bbtkCalibrations.json"
+
+
+class CalibrationStore:
+    """
+    Calibrations (thresholds and sensor positions) saved to disk as JSON, so that they can be
+    reused by later sessions on the same rig. Calibrations are stored by the identity of the TPad
+    (see `TPad.getIdentity`), then by the name of the sensor group.
+
+    Parameters
+    ----------
+    filename : str, pathlib.Path or None
+        File to store calibrations in, or None to use the default (see `getStorePath`)
+    """
+    def __init__(self, filename=None):
+        self.filename = filename
+        # contents of the file, loaded when first needed
+        self._data = None
+        self._lock = threading.Lock()
+
+    @property
+    def path(self):
+        if self.filename is None:
+            return getStorePath()
+        return Path(self.filename)
+
+    def _load(self):
+        if self._data is not None:
+            return self._data
+        self._data = {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self._data = json.load(f)
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as err:
+            logging.warning(f"Could not read BBTK calibrations from {self.path}: {err}")
+
+        return self._data
+
+    def _save(self):
+        path = self.path
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # write to a temporary file and swap it in, so a crash can't leave half a file
+            temp = path.with_name(path.name + ".tmp")
+            with open(temp, "w", encoding="utf-8") as f:
+                json.dump(self._data, f, indent=2)
+            os.replace(temp, path)
+        except OSError as err:
+            logging.warning(f"Could not save BBTK calibrations to {path}: {err}")
+
+    def get(self, identity, node):
+        """
+        Get the stored calibration of a sensor group.
+
+        Parameters
+        ----------
+        identity : str
+            Identity of the TPad
+        node : str
+            Name of the sensor group, e.g. `TPadLightSensorGroup`
+
+        Returns
+        -------
+        dict
+            Stored values (empty if there are none)
+        """
+        with self._lock:
+            entry = self._load().get(identity, {}).get(node, {})
+            # copy, so changes aren't stored without saving
+            return json.loads(json.dumps(entry))
+
+    def update(self, identity, node, values):
+        """
+        Store values in the calibration of a sensor group, and save to disk.
+
+        Parameters
+        ----------
+        identity : str
+            Identity of the TPad
+        node : str
+            Name of the sensor group, e.g. `TPadLightSensorGroup`
+        values : dict
+            Values to store (must be JSON serializable), replacing any stored under the same keys
+        """
+        with self._lock:
+            entry = self._load().setdefault(identity, {}).setdefault(node, {})
+            entry.update(json.loads(json.dumps(values)))
+            self._save()
+
+    def remove(self, identity, node=None):
+        """
+        Forget the stored calibration of a TPad, or of one of its sensor groups.
+
+        Parameters
+        ----------
+        identity : str
+            Identity of the TPad
+        node : str or None
+            Name of the sensor group to forget, or None for all of them
+        """
+        with self._lock:
+            data = self._load()
+            if node is None:
+                data.pop(identity, None)
+            else:
+                data.get(identity, {}).pop(node, None)
+            self._save()
+
+
+# store used by TPads unless given another
+calibrationStore = CalibrationStore()
@@ -0,0 +1,228 @@
+"""
+Estimate drift between a TPad's hardware clock and the PsychoPy clock, so that timestamps from the
+TPad can be corrected as a session goes on.
+
+The TPad can't be asked what time its clock says, only told to reset it, so the clocks are related
+using two sources:
+
+- The round trip of each timer reset, which anchors TPad time 0 to a PsychoPy time.
+- The time each message is read from the serial port. A message can never arrive before it
+  happened, so `received - (anchor + deviceTime)` is the transport latency plus any drift. Taking
+  the minimum of this per time window picks out the fastest arrivals, whose latency is near
+  constant, and a running linear regression through those minima gives the drift (skew) between
+  the clocks as its slope.
+
+This is a passive fit, so it's only as good as the traffic it's fed: if messages are rare, the
+fastest arrival in each window may not be all that fast. A fitted skew is therefore only applied
+once its standard error is small (see `maxSkewError`), and correction is off by default on a
+`TPad` (`correctDrift=False`). When a new skew is applied, times are kept continuous from the
+newest time already converted, so a correction never makes event times jump or go backwards.
+"""
+
+from collections import deque
+import math
+
+
+class ClockSync:
+    """
+    Online estimate of the offset and skew between a TPad's clock and the PsychoPy clock.
+
+    Parameters
+    ----------
+    window : float
+        Length (s, TPad time) of the windows over which to take the minimum arrival delay. Each
+        window contributes one point to the fit.
+    maxPoints : int
+        Maximum number of windows to fit over, older windows are dropped from the fit.
+    minPoints : int
+        Minimum number of windows needed before the fitted skew is trusted.
+    maxSkew : float
+        Largest skew (as a proportion, e.g. 500e-6 for 500ppm) which is considered plausible. Fits
+        with a larger skew are assumed to be noise and not applied.
+    maxSkewError : float
+        Largest standard error (as a proportion) of the fitted skew for it to be applied, fits
+        less certain than this aren't applied.
+    correct : bool
+        Whether to apply the fitted skew when converting TPad times (if False, the fit is still
+        made so it can be inspected).
+    """
+    def __init__(self, window=1.0, maxPoints=600, minPoints=10, maxSkew=500e-6,
+                 maxSkewError=5e-6, correct=True):
+        self.window = window
+        self.maxPoints = maxPoints
+        self.minPoints = minPoints
+        self.maxSkew = maxSkew
+        self.maxSkewError = maxSkewError
+        self.correct = correct
+        # PsychoPy time at which the TPad clock was last reset, and the round trip of that reset
+        self.anchor = 0.0
+        self.roundTrip = None
+        # PsychoPy time which TPad time 0 converts to (the anchor, shifted whenever a new skew is
+        # applied so that converted times stay continuous)
+        self.offset = 0.0
+        # skew currently applied (kept across resets, as it's a property of the crystal)
+        self.skew = 0.0
+        # intercept, RMS residual and standard error of the skew of the current fit
+        self.latency = None
+        self.jitter = None
+        self.skewError = None
+        self._clearPoints()
+
+    def _clearPoints(self):
+        # points in the fit, and running sums for the regression
+        self._points = deque()
+        self._sx = self._sy = self._sxx = self._sxy = self._syy = 0.0
+        # window currently collecting samples, and the minimum sample in it
+        self._window = None
+        self._windowMin = None
+        # newest TPad time given to `addSample` (so, the newest time already converted)
+        self._lastDeviceTime = 0.0
+
+    @property
+    def scale(self):
+        """
+        Factor to multiply TPad times (s since reset) by to get PsychoPy seconds since reset.
+        """
+        if self.correct:
+            return 1.0 + self.skew
+        return 1.0
+
+    def toHost(self, deviceTime):
+        """
+        Convert a TPad time into PsychoPy time.
+
+        Parameters
+        ----------
+        deviceTime : float
+            Time (s) since the TPad clock was last reset, according to the TPad
+
+        Returns
+        -------
+        float
+            Corresponding time according to the PsychoPy clock
+        """
+        return self.offset + deviceTime * self.scale
+
+    def reset(self, anchor, roundTrip=None):
+        """
+        Start a new fit after the TPad clock has been reset.
+
+        Parameters
+        ----------
+        anchor : float
+            PsychoPy time at which the TPad clock was reset
+        roundTrip : float or None
+            How long (s) the reset command took to be acknowledged, this bounds how accurately
+            the anchor is known
+        """
+        self.anchor = anchor
+        self.offset = anchor
+        self.roundTrip = roundTrip
+        self.latency = None
+        self.jitter = None
+        self.skewError = None
+        self._clearPoints()
+
+    def addSample(self, deviceTime, hostTime):
+        """
+        Add an observation of a message's TPad timestamp and the PsychoPy time it was read.
+
+        Parameters
+        ----------
+        deviceTime : float
+            Time (s) of the message according to the TPad, since its clock was reset
+        hostTime : float
+            PsychoPy time at which the message was read from the serial port
+        """
+        delay = hostTime - (self.anchor + deviceTime)
+        window = int(deviceTime // self.window)
+        if window == self._window:
+            # keep the fastest arrival in this window
+            if delay < self._windowMin[1]:
+                self._windowMin = (deviceTime, delay)
+        else:
+            # entering a new window, so the previous one is complete (any new skew is applied
+            # from the newest time converted before this sample)
+            if self._windowMin is not None:
+                self._addPoint(*self._windowMin)
+            self._window = window
+            self._windowMin = (deviceTime, delay)
+        self._lastDeviceTime = max(self._lastDeviceTime, deviceTime)
+
+    def _addPoint(self, x, y):
+        self._points.append((x, y))
+        self._sx += x
+        self._sy += y
+        self._sxx += x * x
+        self._sxy += x * y
+        self._syy += y * y
+        # drop oldest point from the fit if there are too many
+        if len(self._points) > self.maxPoints:
+            x, y = self._points.popleft()
+            self._sx -= x
+            self._sy -= y
+            self._sxx -= x * x
+            self._sxy -= x * y
+            self._syy -= y * y
+        self._fit()
+
+    def _fit(self):
+        n = len(self._points)
+        if n < 2:
+            return
+        sxx = self._sxx - self._sx * self._sx / n
+        if sxx <= 0:
+            return
+        sxy = self._sxy - self._sx * self._sy / n
+        syy = self._syy - self._sy * self._sy / n
+        slope = sxy / sxx
+        residual = max(syy - slope * sxy, 0)
+        self.latency = (self._sy - slope * self._sx) / n
+        self.jitter = math.sqrt(residual / n)
+        if n < 3:
+            return
+        self.skewError = math.sqrt(residual / (n - 2) / sxx)
+        # only apply skew once there's enough data for it to be plausible and certain
+        if (
+            n >= self.minPoints
+            and abs(slope) <= self.maxSkew
+            and self.skewError <= self.maxSkewError
+        ):
+            self._applySkew(slope)
+
+    def _applySkew(self, skew):
+        """
+        Start using a new skew, shifting the offset so that the newest time already converted
+        converts to the same PsychoPy time as before (so times after it carry on from it).
+        """
+        lastScale = self.scale
+        self.skew = skew
+        self.offset += self._lastDeviceTime * (lastScale - self.scale)
+
+    def getFit(self):
+        """
+        Get the current state of the fit, for quality assurance.
+
+        Returns
+        -------
+        dict
+            With keys:
+            - `anchor`: PsychoPy time (s) at which the TPad clock was last reset
+            - `roundTrip`: Round trip time (s) of the last reset
+            - `skew`: Skew (as a proportion) applied to TPad times
+            - `latency`: Fitted minimum transport latency (s) from the TPad
+            - `jitter`: RMS residual (s) of the fastest arrivals around the fit
+            - `skewError`: Standard error (as a proportion) of the fitted skew
+            - `nPoints`: Number of windows in the fit
+            - `correcting`: Whether skew is being applied to TPad times
+        """
+        return {
+            'anchor': self.anchor,
+            'roundTrip': self.roundTrip,
+            'skew': self.skew,
+            'latency': self.latency,
+            'jitter': self.jitter,
+            'skewError': self.skewError,
+            'nPoints': len(self._points),
+            'correcting': self.correct,
+        }
@@ -25,10 +25,11 @@ def getTPadPorts():
     """
     Get a list of ports which have TPad devices connected.
     """
-    from psychopy_bbtk.tpad import TPad
+    # list via discovery rather than the TPad class, so Builder doesn't import the hardware stack
+    from psychopy_bbtk.discovery import getTPadProfiles
     ports = [""]
     # iterate through available button boxes
-    for profile in TPad.getAvailableDevices():
+    for profile in getTPadProfiles():
         # add this box's port
         ports.append(
             profile['port']
@@ -0,0 +1,164 @@
+"""
+Cached enumeration of serial ports. Listing ports can take hundreds of ms on machines with many
+USB serial adapters, and is done every time a TPad is made or a Builder dialog lists its port
+choices, so results are reused for a short time (or until a device is plugged in or removed, if
+watching for hotplug events).
+"""
+
+import threading
+import time
+
+from psychopy import logging
+
+
+def _listPorts():
+    import serial.tools.list_ports
+
+    return list(serial.tools.list_ports.comports())
+
+
+class PortCache:
+    """
+    Time-limited cache of the serial ports on this machine.
+
+    Parameters
+    ----------
+    ttl : float
+        Time (s) for which a list of ports is reused before ports are listed again
+    listPorts : callable or None
+        Function returning a list of `serial.tools.list_ports_common.ListPortInfo`, uses
+        `serial.tools.list_ports.comports` if None
+    """
+    def __init__(self, ttl=5.0, listPorts=None):
+        self.ttl = ttl
+        if listPorts is None:
+            listPorts = _listPorts
+        self.listPorts = listPorts
+        # last list of ports and when it was made (monotonic time)
+        self._ports = None
+        self._time = None
+        # only list ports in one thread at a time
+        self._lock = threading.Lock()
+        # background refresh (if watching)
+        self._watcher = None
+        self._watchStop = threading.Event()
+
+    def getPorts(self, refresh=False):
+        """
+        Get the serial ports on this machine, listing them again only if the cached list is older
+        than `ttl` (or has been invalidated).
+
+        Parameters
+        ----------
+        refresh : bool
+            If True, list ports again regardless of the cache
+
+        Returns
+        -------
+        list[serial.tools.list_ports_common.ListPortInfo]
+            Info on each port
+        """
+        with self._lock:
+            if refresh or self._ports is None or time.monotonic() - self._time >= self.ttl:
+                self._ports = self.listPorts()
+                self._time = time.monotonic()
+                for port in self._ports:
+                    logging.debug(
+                        f"Found serial device on {port.device} (vid={port.vid}, pid={port.pid})"
+                    )
+
+            return list(self._ports)
+
+    def invalidate(self):
+        """
+        Discard the cached list of ports, so they're listed again next time they're needed (e.g.
+        after plugging in a device).
+        """
+        with self._lock:
+            self._ports = None
+
+    def watch(self, interval=2.0):
+        """
+        Keep the cache up to date in the background. On Linux with `pyudev` installed, the cache
+        is invalidated as soon as a serial device is plugged in or removed. Otherwise, ports are
+        listed again every `interval` seconds on a background thread, so that listing them in the
+        foreground is always quick.
+
+        Parameters
+        ----------
+        interval : float
+            Time (s) between refreshes, if polling
+        """
+        if self._watcher is not None:
+            return
+        self._watchStop.clear()
+        try:
+            import pyudev
+        except ImportError:
+            pyudev = None
+        if pyudev is not None:
+            # invalidate on hotplug events
+            monitor = pyudev.Monitor.from_netlink(pyudev.Context())
+            monitor.filter_by(subsystem="tty")
+            self._watcher = pyudev.MonitorObserver(
+                monitor, callback=lambda device: self.invalidate(), name="PortCacheWatcher"
+            )
+        else:
+            # poll
+            self._watcher = threading.Thread(
+                target=self._poll, args=(interval,), name="PortCacheWatcher", daemon=True
+            )
+        self._watcher.start()
+
+    def _poll(self, interval):
+        while not self._watchStop.wait(interval):
+            self.getPorts(refresh=True)
+
+    def stopWatching(self):
+        """
+        Stop keeping the cache up to date in the background.
+        """
+        if self._watcher is None:
+            return
+        self._watchStop.set()
+        if hasattr(self._watcher, "send_stop"):
+            self._watcher.send_stop()
+        self._watcher = None
+
+
+# cache used for finding TPads
+portCache = PortCache()
+
+# USB vendor and product IDs of a TPad
+tpadVendorID = 1027
+tpadProductIDs = (1000, 1001, 1002, 1003, 1004)
+
+
+def getTPadProfiles(refresh=False):
+    """
+    Get profiles of all connected TPads, from the cached list of ports. This doesn't need the
+    TPad classes (or the PsychoPy hardware modules they're built on), so is cheap to call from
+    places like Builder which only want to list ports.
+
+    Parameters
+    ----------
+    refresh : bool
+        If True, list ports again rather than using the cache
+
+    Returns
+    -------
+    list[dict]
+        Profile of each TPad
+    """
+    profiles = []
+    for device in portCache.getPorts(refresh=refresh):
+        # filter only for those which look like a tpad
+        if device.vid == tpadVendorID and device.pid in tpadProductIDs:
+            # construct profile
+            profiles.append({
+                'deviceName': f"TPad@{device.device}",
+                'deviceClass': "psychopy_bbtk.tpad.TPad",
+                'port': device.device
+            })
+
+    return profiles
@@ -0,0 +1,523 @@
+"""
+Software emulator of a TPad, for testing without hardware.
+
+The emulator opens a pseudo-terminal and serves the TPad's command set on one end of it, so the
+other end is a real serial port (e.g. `/dev/pts/3`) which a `TPad` can open as normal. Everything
+from `serial.Serial` up is exercised exactly as it would be with a real device, so dispatch
+throughput and latency can be load tested on a plain Linux or macOS machine.
+
+Usage
+-----
+```
+emulator = TPadEmulator()
+pad = EmulatedTPad(port=emulator.port)
+buttons = TPadButtonGroup(pad, channels=10)
+emulator.startStream(rate=2000, devices=("A",), channels=range(1, 11), burst=4, splitProb=0.2)
+...
+emulator.close()
+```
+
+The replies to commands are modelled on the TPad's, but aren't byte-for-byte identical to any
+particular firmware version.
+
+For the BlackBoxToolkit, which is only read in bulk, there's no need to emulate a live device:
+`makeDumpBBTK` makes one which reads a synthetic data dump (see `makeDumpBytes`) from memory.
+"""
+
+import io
+import os
+import random
+import select
+import threading
+import time
+
+from psychopy_bbtk import BlackBoxToolkit
+from psychopy_bbtk.tpad import TPad
+
+try:
+    import tty
+except ImportError:
+    # no pseudo-terminals on Windows
+    tty = None
+
+# running emulators, by port
+emulatedPorts = {}
+
+
+def formatEvent(device, state, channel, ms):
+    """
+    Format an event as the TPad would send it.
+
+    Parameters
+    ----------
+    device : str
+        Device code, see `psychopy_bbtk.tpad.channelCodes`
+    state : str or bool
+        State code (see `psychopy_bbtk.tpad.stateCodes`), or True/False for pressed/released
+    channel : int
+        Channel number
+    ms : int
+        Timestamp (ms since the TPad's timer was reset)
+
+    Returns
+    -------
+    bytes
+        The message, including its end-of-line
+    """
+    if isinstance(state, bool):
+        state = "P" if state else "R"
+
+    return b"%s %s %i %i\r\n" % (device.encode("utf-8"), state.encode("utf-8"), channel, ms)
+
+
+def makeEventBytes(nEvents, devices=("A",), channels=(1,), rate=1000, start=0, seed=None):
+    """
+    Make a stream of TPad events, alternating between pressed and released on each channel.
+
+    Parameters
+    ----------
+    nEvents : int
+        Number of events to make
+    devices : tuple[str]
+        Device codes to pick from at random for each event
+    channels : tuple[int]
+        Channel numbers to pick from at random for each event
+    rate : float
+        Events per second, used to space out timestamps
+    start : float
+        Time (s) of the first event
+    seed : int or None
+        Seed for the random choice of device and channel
+
+    Returns
+    -------
+    bytes
+        The events, one per line
+    """
+    rng = random.Random(seed)
+    devices = tuple(devices)
+    channels = tuple(channels)
+    # current state of each device/channel
+    states = {}
+    lines = []
+    for n in range(nEvents):
+        key = (rng.choice(devices), rng.choice(channels))
+        states[key] = not states.get(key, False)
+        lines.append(formatEvent(key[0], states[key], key[1], int((start + n / rate) * 1000)))
+
+    return b"".join(lines)
+
+
+class TPadEmulator:
+    """
+    Emulated TPad, served on a pseudo-terminal.
+
+    Parameters
+    ----------
+    firmware : str
+        Reply to `FIRM` (which can run over several lines), also used to tell emulated rigs apart
+        (e.g. for calibration caches)
+    lightLevels : dict[int:float] or None
+        Light level (0-1) currently seen by each opto channel (numbered from 1), compared against
+        the threshold in `AAO` commands. Defaults to 0 on channels 1-4.
+    soundLevels : dict[int:float] or None
+        Sound level (0-1) currently heard by each voice key channel (numbered from 1), compared
+        against the threshold in `AAVK` commands. Defaults to 0 on channels 1-2.
+    replyDelay : float
+        Time (s) to wait before replying to each command, to emulate a slower device.
+    skew : float
+        How much faster (as a proportion, e.g. 100e-6 for 100ppm) the emulated TPad's timer runs
+        than real time, to emulate clock drift.
+    """
+    def __init__(self, firmware="TPad emulator 1.0", lightLevels=None, soundLevels=None,
+                 replyDelay=0, skew=0):
+        if tty is None:
+            raise OSError(
+                "TPadEmulator needs a POSIX pseudo-terminal, which is only available on Linux and "
+                "macOS."
+            )
+        self.firmware = firmware
+        if lightLevels is None:
+            lightLevels = {ch: 0.0 for ch in range(1, 5)}
+        self.lightLevels = lightLevels
+        if soundLevels is None:
+            soundLevels = {ch: 0.0 for ch in range(1, 3)}
+        self.soundLevels = soundLevels
+        self.replyDelay = replyDelay
+        self.skew = skew
+        # mode the emulated TPad is in (it starts in command mode)
+        self.mode = 0
+        # every command received, for inspection in tests
+        self.commands = []
+        # number of events sent
+        self.nEmitted = 0
+        # time at which the emulated timer was last reset
+        self._timerStart = time.perf_counter()
+        # open a pseudo-terminal, in raw mode so nothing is echoed or translated
+        self._master, self._slave = os.openpty()
+        tty.setraw(self._slave)
+        os.set_blocking(self._master, False)
+        self.port = os.ttyname(self._slave)
+        # input waiting for an end-of-line
+        self._inBuffer = b""
+        # only one thread writes to the terminal at a time, so lines are never interleaved
+        self._writeLock = threading.Lock()
+        # start serving commands
+        self._closed = threading.Event()
+        self._server = threading.Thread(
+            target=self._serve, name=f"TPadEmulator@{self.port}", daemon=True
+        )
+        self._server.start()
+        # event stream (if started)
+        self._stream = None
+        self._streamStop = threading.Event()
+        # register
+        emulatedPorts[self.port] = self
+
+    def __repr__(self):
+        return f"<TPadEmulator: port={self.port}, mode={self.mode}>"
+
+    def getTime(self):
+        """
+        Time (s) according to the emulated TPad's timer.
+        """
+        return (time.perf_counter() - self._timerStart) * (1 + self.skew)
+
+    def resetTimer(self):
+        """
+        Reset the emulated TPad's timer, as `R`/`REST` would.
+        """
+        self._timerStart = time.perf_counter()
+
+    def write(self, data):
+        """
+        Write raw bytes to the serial port, as if sent by the TPad.
+
+        Parameters
+        ----------
+        data : bytes
+            Data to write
+
+        Returns
+        -------
+        bool
+            True if all of the data was written, False if the emulator was closed first
+        """
+        view = memoryview(data)
+        with self._writeLock:
+            while view:
+                if self._closed.is_set():
+                    return False
+                # wait until the other end has room for more
+                _, writable, _ = select.select([], [self._master], [], 0.05)
+                if writable:
+                    try:
+                        view = view[os.write(self._master, view):]
+                    except BlockingIOError:
+                        continue
+
+        return True
+
+    def emit(self, device, channel, state=True, t=None):
+        """
+        Send an event, as if it had been detected by the TPad. Events are only sent in data
+        collection mode (mode 3).
+
+        Parameters
+        ----------
+        device : str
+            Device code, see `psychopy_bbtk.tpad.channelCodes`
+        channel : int
+            Channel number
+        state : str or bool
+            State code (see `psychopy_bbtk.tpad.stateCodes`), or True/False for pressed/released
+        t : float or None
+            Time (s, according to the emulated timer) of the event, or None for now
+
+        Returns
+        -------
+        bool
+            True if the event was sent
+        """
+        if self.mode != 3:
+            return False
+        if t is None:
+            t = self.getTime()
+        if not self.write(formatEvent(device, state, channel, int(t * 1000))):
+            return False
+        self.nEmitted += 1
+
+        return True
+
+    def startStream(self, rate=1000, devices=("A",), channels=(1,), burst=1, splitProb=0.0,
+                    nEvents=None, seed=None):
+        """
+        Start sending a stream of events in the background, alternating between pressed and
+        released on each channel. Events are only sent while in data collection mode (mode 3).
+
+        Parameters
+        ----------
+        rate : float
+            Events per second
+        devices : tuple[str]
+            Device codes to pick from at random for each event
+        channels : tuple[int]
+            Channel numbers to pick from at random for each event
+        burst : int
+            Number of events to send in each write
+        splitProb : float
+            Probability (0-1) of splitting each write partway through a line, with a short pause
+            between the two halves, as happens when a read catches the TPad mid-message.
+        nEvents : int or None
+            Number of events to send before stopping, or None to keep going until `stopStream`
+        seed : int or None
+            Seed for the random choice of device, channel and split points
+        """
+        self.stopStream()
+        self._streamStop.clear()
+        self._stream = threading.Thread(
+            target=self._streamLoop,
+            args=(rate, tuple(devices), tuple(channels), burst, splitProb, nEvents, seed),
+            name=f"TPadEmulatorStream@{self.port}",
+            daemon=True,
+        )
+        self._stream.start()
+
+    def stopStream(self, timeout=1):
+        """
+        Stop sending the stream of events started by `startStream`.
+        """
+        if self._stream is None:
+            return
+        self._streamStop.set()
+        self._stream.join(timeout)
+        self._stream = None
+
+    def awaitStream(self, timeout=None):
+        """
+        Wait for a stream started with `nEvents` to finish.
+
+        Returns
+        -------
+        bool
+            True if the stream finished, False if timed out
+        """
+        if self._stream is None:
+            return True
+        self._stream.join(timeout)
+
+        return not self._stream.is_alive()
+
+    def _streamLoop(self, rate, devices, channels, burst, splitProb, nEvents, seed):
+        rng = random.Random(seed)
+        states = {}
+        interval = burst / rate
+        due = time.perf_counter()
+        sent = 0
+        while not self._streamStop.is_set() and (nEvents is None or sent < nEvents):
+            # wait until the next burst is due
+            due += interval
+            wait = due - time.perf_counter()
+            if wait > 0:
+                time.sleep(wait)
+            if self.mode != 3:
+                continue
+            # make burst
+            lines = []
+            t = self.getTime()
+            for n in range(burst if nEvents is None else min(burst, nEvents - sent)):
+                key = (rng.choice(devices), rng.choice(channels))
+                states[key] = not states.get(key, False)
+                lines.append(formatEvent(key[0], states[key], key[1], int(t * 1000)))
+            data = b"".join(lines)
+            # send, possibly in two halves
+            if splitProb and rng.random() < splitProb:
+                i = rng.randrange(1, len(data))
+                self.write(data[:i])
+                time.sleep(0.001)
+                self.write(data[i:])
+            else:
+                self.write(data)
+            sent += len(lines)
+            self.nEmitted += len(lines)
+
+    def _serve(self):
+        while not self._closed.is_set():
+            readable, _, _ = select.select([self._master], [], [], 0.05)
+            if not readable:
+                continue
+            try:
+                data = os.read(self._master, 4096)
+            except (BlockingIOError, OSError):
+                continue
+            self._handleInput(data)
+
+    def _handleInput(self, data):
+        buff = self._inBuffer + data
+        while True:
+            buff = buff.lstrip(b"\r\n")
+            # X and Z are sent as single characters, without an end-of-line
+            if buff[:1] in (b"X", b"Z"):
+                self._handleCommand(buff[:1])
+                buff = buff[1:]
+                continue
+            # anything else waits for an end-of-line
+            i = buff.find(b"\n")
+            if i < 0:
+                break
+            self._handleCommand(buff[:i].strip())
+            buff = buff[i + 1:]
+        self._inBuffer = buff
+
+    def _handleCommand(self, command):
+        self.commands.append(command.decode("utf-8", errors="replace"))
+        if self.replyDelay:
+            time.sleep(self.replyDelay)
+        if command == b"X":
+            # exit to command mode
+            self.mode = 0
+            reply = b"0"
+        elif command == b"Z":
+            # report mode
+            reply = b"%i" % self.mode
+        elif command.startswith(b"MOD"):
+            # change mode
+            self.mode = int(command[3:])
+            reply = b"%i" % self.mode
+        elif command == b"FIRM":
+            # firmware may be reported over several lines
+            reply = self.firmware.encode("utf-8").replace(b"\n", b"\r\n")
+        elif command in (b"R", b"REST"):
+            # reset timer
+            self.resetTimer()
+            reply = command
+        elif command.startswith(b"AAVK"):
+            # set voice key threshold, replying whether the current level is above it
+            channel, value = command[4:].split()
+            level = self.soundLevels.get(int(channel), 0)
+            reply = b"1" if level * 255 > int(value) else b"0"
+        elif command.startswith(b"AAO"):
+            # set opto threshold, replying whether the current level is above it
+            channel, value = command[3:].split()
+            level = self.lightLevels.get(int(channel), 0)
+            reply = b"1" if level * 255 > int(value) else b"0"
+        else:
+            reply = b"?"
+        self.write(reply + b"\r\n")
+
+    def close(self):
+        """
+        Stop the emulator and close its pseudo-terminal.
+        """
+        self.stopStream()
+        self._closed.set()
+        self._server.join(1)
+        emulatedPorts.pop(self.port, None)
+        for fd in (self._master, self._slave):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+
+class EmulatedTPad(TPad):
+    """
+    TPad connected to a `TPadEmulator` rather than a real device. Takes the same parameters as
+    `TPad`, with `port` being the port of a running emulator (or None for the first one).
+    """
+    @staticmethod
+    def getAvailableDevices():
+        profiles = []
+        for port in emulatedPorts:
+            profiles.append({
+                'deviceName': f"TPad@{port}",
+                'deviceClass': "psychopy_bbtk.emulator.EmulatedTPad",
+                'port': port
+            })
+
+        return profiles
+
+    @staticmethod
+    def _detectComPort(refresh=False):
+        # no driver needed, just look for running emulators
+        return list(emulatedPorts)
+
+
+def makeDumpBytes(nLines, seed=0):
+    """
+    Make the data lines of a synthetic BlackBoxToolkit data dump (the data between SDAT and
+    EDAT), flipping a random channel on each line.
+
+    Parameters
+    ----------
+    nLines : int
+        Number of lines to make
+    seed : int or None
+        Seed for the random choice of channel and time between lines
+
+    Returns
+    -------
+    bytes
+        The lines, each ending with an end-of-line
+    """
+    rng = random.Random(seed)
+    state = ["0"] * 12
+    us = 0
+    lines = []
+    for n in range(nLines):
+        if n:
+            i = rng.randrange(12)
+            state[i] = "1" if state[i] == "0" else "0"
+        us += rng.randint(1, 5000)
+        lines.append("".join(state).encode() + b"," + b"%012i" % us + b"\r\n")
+
+    return b"".join(lines)
+
+
+class DumpPort(io.BytesIO):
+    """
+    Readable stand-in for a serial port holding a full SDAT...EDAT dump, which only returns a few
+    bytes per read (as a real port would mid-transfer).
+
+    Parameters
+    ----------
+    data : bytes
+        Data lines of the dump, see `makeDumpBytes`
+    maxRead : int
+        Most bytes to report as waiting at once
+    """
+    timeout = None
+
+    def __init__(self, data, maxRead=97):
+        nLines = data.count(b"\n")
+        io.BytesIO.__init__(
+            self, b"SDAT;\r\n%i;\r\n0;\r\n0;\r\n" % nLines + data + b"EDAT;\r\n"
+        )
+        self.maxRead = maxRead
+
+    @property
+    def in_waiting(self):
+        return min(self.maxRead, len(self.getbuffer()) - self.tell())
+
+
+def makeDumpBBTK(data, maxRead=97):
+    """
+    Make a BlackBoxToolkit which reads a data dump from a `DumpPort`, without opening a real port.
+
+    Parameters
+    ----------
+    data : bytes
+        Data lines of the dump, see `makeDumpBytes`
+    maxRead : int
+        Most bytes to read at once
+
+    Returns
+    -------
+    BlackBoxToolkit
+        BlackBoxToolkit whose next dump (e.g. from `getEvents`) is `data`
+    """
+    bbtk = BlackBoxToolkit.__new__(BlackBoxToolkit)
+    bbtk.com = DumpPort(data, maxRead=maxRead)
+    bbtk.pauseDuration = 0
+
+    return bbtk
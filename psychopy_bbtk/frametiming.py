@@ -0,0 +1,230 @@
+"""
+Analysis of display timing from an opto (photodiode) on a TPad, by matching the edges it saw to
+the timestamps returned by `win.flip()`. Every step is vectorised over the whole run, so a long
+run is analysed in one go rather than by searching for each frame's edge in turn.
+
+Each flip is expected to leave the patch under the opto either light or dark (by default,
+alternating light and dark every frame). Frames which change the patch from the frame before
+are transitions, and each transition should give one edge of the same polarity, some latency
+after its flip. From these, each frame is checked for being:
+
+- Dropped: its flip came a whole refresh (or more) later than it should have, so PsychoPy knows
+  a frame was skipped.
+- Missed: it was a transition but the opto never saw it, so it never reached the screen.
+- Duplicated: it stayed on screen for an extra refresh (or more) which its flips don't account
+  for, i.e. the next transition reached the screen half a frame or more later than it should
+  have, relative to the frame before.
+"""
+
+import numpy as np
+
+
+class FrameTimingReport:
+    """
+    Timing of each frame in a run, as measured by an opto, see `analyseFrameTiming`.
+
+    Parameters
+    ----------
+    flipTimes : np.ndarray
+        Time (s) returned by `win.flip()` for each frame
+    expected : np.ndarray
+        Whether each frame should have left the patch under the opto light (True) or dark (False)
+    onsets : np.ndarray
+        Time (s) at which the opto saw each transition, NaN for frames which weren't a transition
+        or were missed
+    frameDur : float
+        Duration (s) of one refresh
+    isTransition : np.ndarray
+        Whether each frame changed the patch from the frame before
+    nDropped : np.ndarray
+        Number of refreshes skipped just before each frame's flip
+    duplicated : np.ndarray
+        Whether each frame stayed on screen for longer than its flips account for
+    """
+    def __init__(self, flipTimes, expected, onsets, frameDur, isTransition, nDropped, duplicated):
+        self.flipTimes = flipTimes
+        self.expected = expected
+        self.onsets = onsets
+        self.frameDur = frameDur
+        self.isTransition = isTransition
+        self.nDropped = nDropped
+        self.duplicated = duplicated
+
+    def __len__(self):
+        return len(self.flipTimes)
+
+    def __repr__(self):
+        stats = self.getStats()
+        if stats['latencyMean'] is None:
+            return f"<FrameTimingReport: {stats['nFrames']} frames, no transitions seen>"
+        return (
+            f"<FrameTimingReport: {stats['nFrames']} frames, "
+            f"latency={stats['latencyMean'] * 1000:.2f}+/-{stats['latencyStd'] * 1000:.2f}ms, "
+            f"dropped={stats['nDropped']}, missed={stats['nMissed']}, "
+            f"duplicated={stats['nDuplicated']}>"
+        )
+
+    @property
+    def latency(self):
+        """
+        Time (s) from each frame's flip to the opto seeing it, NaN for frames which weren't a
+        transition or were missed.
+        """
+        return self.onsets - self.flipTimes
+
+    @property
+    def intervals(self):
+        """
+        Time (s) between each flip and the one before.
+        """
+        return np.diff(self.flipTimes)
+
+    @property
+    def dropped(self):
+        """
+        Whether one or more refreshes were skipped just before each frame's flip.
+        """
+        return self.nDropped > 0
+
+    @property
+    def missed(self):
+        """
+        Whether each frame was a transition which the opto never saw.
+        """
+        return self.isTransition & np.isnan(self.onsets)
+
+    def getStats(self):
+        """
+        Summarise the timing of the whole run.
+
+        Returns
+        -------
+        dict
+            With keys:
+            - `nFrames`/`nTransitions`: Number of frames, and how many of them were transitions
+            - `nDropped`: Number of refreshes skipped between flips
+            - `nMissed`/`nDuplicated`: Number of frames missed and duplicated
+            - `frameDur`: Duration (s) of one refresh
+            - `latencyMean`/`latencyMedian`/`latencyStd`/`latencyMin`/`latencyMax`/
+              `latencyP95`: Distribution of latency (s) from flip to the opto seeing the frame,
+              None if no transitions were seen
+            - `flipJitter`: Standard deviation (s) of the intervals between flips which didn't
+              drop a frame, None if there were none
+        """
+        latency = self.latency
+        latency = latency[~np.isnan(latency)]
+        stats = {
+            'nFrames': len(self),
+            'nTransitions': int(self.isTransition.sum()),
+            'nDropped': int(self.nDropped.sum()),
+            'nMissed': int(self.missed.sum()),
+            'nDuplicated': int(self.duplicated.sum()),
+            'frameDur': self.frameDur,
+        }
+        if len(latency):
+            stats.update({
+                'latencyMean': float(latency.mean()),
+                'latencyMedian': float(np.median(latency)),
+                'latencyStd': float(latency.std()),
+                'latencyMin': float(latency.min()),
+                'latencyMax': float(latency.max()),
+                'latencyP95': float(np.percentile(latency, 95)),
+            })
+        else:
+            for key in (
+                "latencyMean", "latencyMedian", "latencyStd", "latencyMin", "latencyMax",
+                "latencyP95"
+            ):
+                stats[key] = None
+        # jitter of flips which came on time
+        intervals = self.intervals[~self.dropped[1:]]
+        stats['flipJitter'] = float(intervals.std()) if len(intervals) else None
+
+        return stats
+
+
+def analyseFrameTiming(
+        flipTimes, edgeTimes, edgeValues, expected=None, initial=None, frameDur=None,
+        minLatency=0
+):
+    """
+    Match the edges seen by an opto to the flips of a window, giving the timing of every frame.
+
+    Parameters
+    ----------
+    flipTimes : list[float] or np.ndarray
+        Time (s) returned by `win.flip()` for each frame, on the same clock as the edges
+    edgeTimes : list[float] or np.ndarray
+        Time (s) of each edge seen by the opto, in time order
+    edgeValues : list[bool] or np.ndarray
+        Whether each edge was the opto going light (True) or dark (False)
+    expected : list[bool] or np.ndarray or None
+        Whether each frame should leave the patch under the opto light (True) or dark (False).
+        If None, frames are taken to alternate, starting with light.
+    initial : bool or None
+        Whether the patch was light before the first flip. If None, the first frame is taken to
+        be a transition.
+    frameDur : float or None
+        Duration (s) of one refresh. If None, uses the median interval between flips.
+    minLatency : float
+        Shortest possible time (s) from a flip to the opto seeing it. Edges are matched to the
+        first flip of the same polarity at least this long before them, so for displays with
+        more than two frames of latency, set this to roughly the display's latency.
+
+    Returns
+    -------
+    FrameTimingReport
+        Timing of each frame
+    """
+    flipTimes = np.asarray(flipTimes, dtype=float)
+    edgeTimes = np.asarray(edgeTimes, dtype=float)
+    edgeValues = np.asarray(edgeValues, dtype=bool)
+    nFrames = len(flipTimes)
+    # expected state of each frame
+    if expected is None:
+        expected = np.arange(nFrames) % 2 == 0
+    expected = np.asarray(expected, dtype=bool)
+    if len(expected) != nFrames:
+        raise ValueError(
+            f"Got {len(expected)} expected states for {nFrames} flips, there should be one "
+            f"per flip."
+        )
+    # estimate refresh duration from flips
+    intervals = np.diff(flipTimes)
+    if frameDur is None:
+        frameDur = float(np.median(intervals)) if len(intervals) else np.nan
+    # count refreshes skipped before each flip
+    nDropped = np.zeros(nFrames, dtype=int)
+    if len(intervals):
+        nDropped[1:] = np.maximum(np.rint(intervals / frameDur).astype(int) - 1, 0)
+    # find frames which change the patch
+    if initial is None:
+        initial = not expected[0] if nFrames else False
+    isTransition = expected != np.concatenate([[initial], expected[:-1]])
+    # match transitions of each polarity to edges of the same polarity
+    onsets = np.full(nFrames, np.nan)
+    for value in (True, False):
+        frames = np.flatnonzero(isTransition & (expected == value))
+        times = edgeTimes[edgeValues == value]
+        # first edge after each frame's flip
+        i = np.searchsorted(times, flipTimes[frames] + minLatency, side="left")
+        found = i < len(times)
+        # if several frames found the same edge, only the last of them reached the screen
+        found[:-1] &= i[:-1] != i[1:]
+        onsets[frames[found]] = times[i[found]]
+    # a frame was duplicated if the next transition seen reached the screen late, relative to
+    # the one before
+    duplicated = np.zeros(nFrames, dtype=bool)
+    seen = np.flatnonzero(~np.isnan(onsets))
+    late = seen[1:][np.diff(onsets[seen] - flipTimes[seen]) >= frameDur / 2]
+    duplicated[late - 1] = True
+
+    return FrameTimingReport(
+        flipTimes=flipTimes,
+        expected=expected,
+        onsets=onsets,
+        frameDur=frameDur,
+        isTransition=isTransition,
+        nDropped=nDropped,
+        duplicated=duplicated,
+    )
@@ -0,0 +1,230 @@
+"""
+Streaming detection of voice onsets from the raw press/release edges of a TPad voice key, so that
+onsets (and so response times) are ready as soon as a trial ends rather than worked out from the
+raw edges afterwards.
+
+Each press starts an utterance and each release ends it, except that:
+
+- A press which comes less than `debounce` after a release continues the same utterance (so a
+  voice key flickering around its threshold mid-word doesn't split the word).
+- Utterances shorter than `minDuration` (from first press to last release) are discarded, as are
+  repeated presses or releases.
+
+An onset is recorded as soon as its utterance has lasted `minDuration`, and its offset is filled
+in once the utterance has ended (i.e. `debounce` after its last release). How long an utterance
+has lasted is judged by the events received, not the current time: a release (or a press which
+bridges a gap) can still be on its way from the TPad, so an utterance only counts as having
+lasted until the latest event known to have arrived. Each event is handled in constant time.
+"""
+
+
+class VoiceOnset:
+    """
+    A detected utterance on a voice key.
+
+    Parameters
+    ----------
+    channel : int
+        Voice key channel (numbered from 0)
+    onset : float
+        Time (s) of the first press of the utterance
+    offset : float or None
+        Time (s) of the last release of the utterance, or None if it hasn't ended yet
+    """
+    __slots__ = ("channel", "onset", "offset")
+
+    def __init__(self, channel, onset, offset=None):
+        self.channel = channel
+        self.onset = onset
+        self.offset = offset
+
+    @property
+    def duration(self):
+        """
+        Time (s) from onset to offset, or None if the utterance hasn't ended yet
+        """
+        if self.offset is None:
+            return None
+        return self.offset - self.onset
+
+    def __repr__(self):
+        return f"<VoiceOnset: channel={self.channel}, onset={self.onset}, offset={self.offset}>"
+
+    def __eq__(self, other):
+        if not isinstance(other, VoiceOnset):
+            return NotImplemented
+        return (self.channel, self.onset, self.offset) == (other.channel, other.onset, other.offset)
+
+
+class _Utterance:
+    """
+    State of the utterance currently in progress on one channel.
+    """
+    __slots__ = ("start", "pressed", "release", "record")
+
+    def __init__(self):
+        # time of the first press, None if no utterance is in progress
+        self.start = None
+        # whether the voice key is currently pressed
+        self.pressed = False
+        # time of the last release, if released and waiting to see whether it's bridged
+        self.release = None
+        # onset record, once the utterance has lasted long enough to count
+        self.record = None
+
+
+class OnsetDetector:
+    """
+    Turns press/release edges from voice key channels into voice onsets, one event at a time.
+
+    Parameters
+    ----------
+    debounce : float
+        Gaps (s) between a release and the next press shorter than this are bridged, so both
+        belong to the same utterance
+    minDuration : float
+        Minimum time (s) from first press to last release for an utterance to count
+    """
+    def __init__(self, debounce=0.05, minDuration=0.1):
+        self.debounce = debounce
+        self.minDuration = minDuration
+        # onsets detected and not yet taken by `getOnsets`
+        self.onsets = []
+        # utterance in progress on each channel
+        self._utterances = {}
+        # time of the latest event received
+        self.latest = None
+
+    def addEvent(self, t, channel, value):
+        """
+        Handle one edge from a voice key.
+
+        Parameters
+        ----------
+        t : float
+            Time (s) of the edge
+        channel : int
+            Voice key channel (numbered from 0)
+        value : bool
+            True for a press (sound above threshold), False for a release
+        """
+        if self.latest is None or t > self.latest:
+            self.latest = t
+        utt = self._utterances.get(channel)
+        if utt is None:
+            utt = self._utterances[channel] = _Utterance()
+        if value:
+            # ignore repeated presses
+            if utt.pressed:
+                return
+            if utt.start is not None:
+                if t - utt.release < self.debounce:
+                    # bridge the gap, continuing the same utterance
+                    utt.pressed = True
+                    utt.release = None
+                    self._confirm(utt, channel, t)
+                    return
+                # last utterance is over
+                self._finish(utt)
+            # start a new utterance
+            utt.start = t
+            utt.pressed = True
+            self._confirm(utt, channel, t)
+        else:
+            # ignore releases without a press
+            if not utt.pressed:
+                return
+            utt.pressed = False
+            utt.release = t
+            self._confirm(utt, channel, t)
+
+    def addBatch(self, t, channel, value):
+        """
+        Handle a batch of edges, in time order (e.g. the columns of a `TPadEventBatch`).
+
+        Parameters
+        ----------
+        t : np.ndarray
+            Time (s) of each edge
+        channel : np.ndarray
+            Voice key channel of each edge (numbered from 0)
+        value : np.ndarray
+            Whether each edge is a press
+        """
+        for thisT, thisChannel, thisValue in zip(t.tolist(), channel.tolist(), value.tolist()):
+            self.addEvent(thisT, thisChannel, thisValue)
+
+    def update(self, until=None):
+        """
+        Bring utterances up to date with the events received so far, recording onsets of any
+        which have now lasted long enough and ending any whose last release is now more than
+        `debounce` ago.
+
+        Parameters
+        ----------
+        until : float or None
+            Time (s) up to which every event is known to have been received (e.g. the time of
+            the latest event from any device on the same TPad, as a TPad sends events in order),
+            on the same clock as event times. This shouldn't be the current time, as events can
+            still be on their way. If None (or earlier), the latest voice key event received is
+            used.
+        """
+        if until is None or (self.latest is not None and self.latest > until):
+            until = self.latest
+        if until is None:
+            return
+        for channel, utt in self._utterances.items():
+            if utt.start is None:
+                continue
+            if utt.pressed:
+                self._confirm(utt, channel, until)
+            elif until - utt.release >= self.debounce:
+                self._finish(utt)
+
+    def _confirm(self, utt, channel, now):
+        # record the onset once the utterance has lasted long enough
+        if utt.record is None and now - utt.start >= self.minDuration:
+            utt.record = VoiceOnset(channel, utt.start)
+            self.onsets.append(utt.record)
+
+    def _finish(self, utt):
+        # fill in the offset (if the utterance counted) and reset
+        if utt.record is not None:
+            utt.record.offset = utt.release
+        utt.start = utt.release = utt.record = None
+
+    def getOnsets(self, channel=None, clear=True):
+        """
+        Get onsets detected so far, in the order they were detected.
+
+        Parameters
+        ----------
+        channel : int or None
+            Channel to get onsets from, or None for all channels
+        clear : bool
+            Whether to remove the returned onsets, so they aren't returned again
+
+        Returns
+        -------
+        list[VoiceOnset]
+            Detected onsets (the offset of an utterance still in progress is None, and is filled
+            in once it ends)
+        """
+        if channel is None:
+            onsets = self.onsets
+            if clear:
+                self.onsets = []
+            return list(onsets)
+        onsets = [onset for onset in self.onsets if onset.channel == channel]
+        if clear:
+            self.onsets = [onset for onset in self.onsets if onset.channel != channel]
+
+        return onsets
+
+    def reset(self):
+        """
+        Forget all onsets and any utterances in progress, e.g. at the start of a trial.
+        """
+        self.onsets = []
+        self._utterances = {}
+        self.latest = None
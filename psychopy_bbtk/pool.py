@@ -0,0 +1,257 @@
+"""
+Manage many TPads at once, e.g. a testing room with a rig per participant: discover them once,
+open them concurrently, read them all in parallel (each on its own reader thread) and merge their
+events into one time-ordered feed.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import heapq
+import itertools
+
+from psychopy import logging
+
+from psychopy_bbtk.buffers import TPadEvent
+from psychopy_bbtk.tpad import DeviceNotConnectedError, TPad
+
+
+class PooledEvent(TPadEvent):
+    """
+    An event from a TPad in a `TPadPool`, tagged with the port of the TPad it came from.
+
+    Parameters
+    ----------
+    t : float
+        Time (s) of the event
+    port : str
+        Port of the TPad which sent the event
+    device : str
+        Device code, see `psychopy_bbtk.tpad.channelCodes`
+    channel : int
+        Channel number
+    state : str
+        State code, see `psychopy_bbtk.tpad.stateCodes`
+    """
+    __slots__ = ("port",)
+
+    def __init__(self, t, port, device, channel, state):
+        TPadEvent.__init__(self, t, device, channel, state)
+        self.port = port
+
+    def __repr__(self):
+        return (
+            f"<PooledEvent: t={self.t}, port={self.port}, device={self.device}, "
+            f"channel={self.channel}, state={self.state}>"
+        )
+
+    def __eq__(self, other):
+        if not isinstance(other, PooledEvent):
+            return NotImplemented
+        return self.port == other.port and TPadEvent.__eq__(self, other)
+
+
+class TPadPool:
+    """
+    A group of TPads, opened concurrently and read in parallel.
+
+    Parameters
+    ----------
+    ports : list[str] or None
+        Ports of the TPads to open, or None to open every TPad found
+    padClass : type
+        Class of TPad to open (e.g. `psychopy_bbtk.emulator.EmulatedTPad` for testing)
+    maxWorkers : int or None
+        Maximum number of TPads to open (or close) at once, or None for all of them
+    bufferSize : int
+        Maximum number of events for each TPad's reader thread (and each TPad's tap, see
+        `TPad.addTap`) to hold between calls to `getEvents`
+    **kwargs
+        Any other arguments to open each TPad with (see `TPad`). TPads in a pool are always read
+        in a thread, so `threaded` can't be given.
+    """
+    def __init__(self, ports=None, padClass=TPad, maxWorkers=None, bufferSize=4096, **kwargs):
+        if "threaded" in kwargs:
+            raise TypeError(
+                "TPadPool always opens TPads with threaded=True, so `threaded` can't be given."
+            )
+        self.padClass = padClass
+        self.maxWorkers = maxWorkers
+        self.bufferSize = bufferSize
+        self._kwargs = kwargs
+        # discover once, rather than once per TPad
+        self.available = padClass._detectComPort()
+        if ports is None:
+            ports = list(self.available)
+        self.ports = list(ports)
+        # open TPads by port, the taps which their events are read from, and errors from any which
+        # failed to open
+        self.pads = {}
+        self.taps = {}
+        self.errors = {}
+        # clock which event times are relative to
+        self.clock = logging.defaultClock
+        # events not yet returned by getEvents, as a heap ordered by time then arrival
+        self._pending = []
+        self._counter = itertools.count()
+        # number of events each TPad's tap had dropped when last warned about
+        self._dropped = {}
+
+    def __enter__(self):
+        self.open()
+
+        return self
+
+    def __exit__(self, excType, excVal, excTb):
+        self.close()
+
+    def __len__(self):
+        return len(self.pads)
+
+    def __iter__(self):
+        return iter(self.pads.values())
+
+    def __getitem__(self, port):
+        return self.pads[port]
+
+    def _map(self, func, items):
+        """
+        Call a function on each of some items concurrently, returning a dict of results and a
+        dict of errors (both keyed by item)
+        """
+        results = {}
+        errors = {}
+        if not items:
+            return results, errors
+        with ThreadPoolExecutor(max_workers=self.maxWorkers or len(items)) as executor:
+            futures = {item: executor.submit(func, item) for item in items}
+            for item, future in futures.items():
+                try:
+                    results[item] = future.result()
+                except (Exception, DeviceNotConnectedError) as err:
+                    # (DeviceNotConnectedError is a BaseException in some versions of PsychoPy)
+                    errors[item] = err
+
+        return results, errors
+
+    def _openPad(self, port):
+        pad = self.padClass(
+            port=port, possiblePorts=self.available, threaded=True, bufferSize=self.bufferSize,
+            **self._kwargs
+        )
+        # read events via a tap, so that events dispatched elsewhere (e.g. by a node) still
+        # reach the merged feed
+        self.taps[port] = pad.addTap(capacity=self.bufferSize)
+
+        return pad
+
+    def open(self):
+        """
+        Open every TPad which isn't already open, all at once. TPads which fail to open are
+        logged and their errors kept in `errors`, rather than stopping the rest from opening.
+
+        Returns
+        -------
+        dict[str:TPad]
+            All open TPads, by port
+        """
+        ports = [port for port in self.ports if port not in self.pads]
+        pads, errors = self._map(self._openPad, ports)
+        self.pads.update(pads)
+        self.errors.update(errors)
+        for port, err in errors.items():
+            logging.warning(f"TPadPool could not open TPad on {port}: {err}")
+
+        return self.pads
+
+    def close(self):
+        """
+        Close every TPad, all at once.
+        """
+        self._map(lambda port: self.pads[port].close(), list(self.pads))
+        self.pads = {}
+        self.taps = {}
+
+    def makeNodes(self, nodeClass, **kwargs):
+        """
+        Make a node (e.g. `TPadButtonGroup`) on every TPad. If any TPad fails to make one, the
+        nodes made on the others are detached again before the error is raised.
+
+        Parameters
+        ----------
+        nodeClass : type
+            Class of node to make
+        **kwargs
+            Arguments to make each node with, other than `pad`
+
+        Returns
+        -------
+        dict[str:BaseDevice]
+            The new nodes, by port
+        """
+        nodes, errors = self._map(
+            lambda port: nodeClass(self.pads[port], **kwargs), list(self.pads)
+        )
+        # if any failed, detach the rest (so they don't carry on receiving events) and raise the
+        # first error
+        for port, err in errors.items():
+            for other, node in nodes.items():
+                self.pads[other].removeNode(node)
+            raise err
+
+        return nodes
+
+    def resetTimers(self, clock=logging.defaultClock):
+        """
+        Reset the timer of every TPad, all at once, so their events share a time base.
+
+        Parameters
+        ----------
+        clock : psychopy.clock.Clock
+            Clock to relate event times to
+        """
+        self.clock = clock
+        self._map(lambda port: self.pads[port].resetTimer(clock=clock), list(self.pads))
+
+    def getEvents(self, holdback=0):
+        """
+        Dispatch events from every TPad to its nodes, and return them merged into one feed in
+        time order. This includes any events which were dispatched elsewhere since the last call
+        (e.g. by calling `getResponses` on a node).
+
+        Parameters
+        ----------
+        holdback : float
+            Time (s) to hold back the newest events for. Events from different TPads are only
+            guaranteed to be merged in order if they arrive within this time of one another, so
+            set this to the largest expected transport latency if strict ordering across TPads
+            matters more than getting events straight away.
+
+        Returns
+        -------
+        list[PooledEvent]
+            Events, in time order, tagged with the port of the TPad they came from
+        """
+        pending = self._pending
+        for port, pad in self.pads.items():
+            # send whatever the reader thread has parsed to the TPad's nodes, then take
+            # everything dispatched since last time
+            pad.dispatchMessages()
+            tap = self.taps[port]
+            events = tap.popAll()
+            # warn if events were dropped since last time
+            if tap.dropped > self._dropped.get(port, 0):
+                logging.warning(
+                    f"TPadPool tap on {port} was full, dropped "
+                    f"{tap.dropped - self._dropped.get(port, 0)} event(s). Consider calling "
+                    f"getEvents more often or increasing bufferSize."
+                )
+                self._dropped[port] = tap.dropped
+            for device, state, channel, t in events:
+                heapq.heappush(pending, (t, next(self._counter), port, device, channel, state))
+        # return everything older than the holdback
+        cutoff = self.clock.getTime() - holdback if holdback else float("inf")
+        merged = []
+        while pending and pending[0][0] <= cutoff:
+            t, _, port, device, channel, state = heapq.heappop(pending)
+            merged.append(PooledEvent(t, port, device, channel, state))
+
+        return merged
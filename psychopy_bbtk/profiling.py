@@ -0,0 +1,303 @@
+"""
+Tools for profiling BBTK devices: the round-trip latency of commands, e.g. when commissioning a
+rig, and counters for how much work is done dispatching messages during an experiment.
+"""
+
+import json
+import time
+
+import numpy as np
+
+
+class LatencyProfile:
+    """
+    Distribution of round-trip times from sending a command to a device to receiving its reply.
+
+    Parameters
+    ----------
+    samples : list[int]
+        Round trip time (ns) of each successful attempt
+    command : str
+        Command which was sent
+    mode : int or None
+        Mode the device was in while profiling
+    failures : int
+        Number of attempts which got no reply
+    port : str or None
+        Port the device is connected to
+    timestamp : float or None
+        Unix time at which the profile was made, uses the current time if None
+    """
+    def __init__(self, samples, command, mode=None, failures=0, port=None, timestamp=None):
+        self.samples = np.asarray(samples, dtype=np.int64)
+        self.command = command
+        self.mode = mode
+        self.failures = failures
+        self.port = port
+        if timestamp is None:
+            timestamp = time.time()
+        self.timestamp = timestamp
+
+    def __len__(self):
+        return len(self.samples)
+
+    def __repr__(self):
+        stats = self.getStats()
+        if not len(self):
+            return f"<LatencyProfile: {self.command}, no replies from {self.failures} attempts>"
+        return (
+            f"<LatencyProfile: {self.command}, n={stats['n']}, median={stats['median']:.6f}s, "
+            f"p99={stats['p99']:.6f}s>"
+        )
+
+    @property
+    def mean(self):
+        """
+        Mean round trip time (s), or None if there were no replies.
+        """
+        if not len(self):
+            return None
+        return float(self.samples.mean()) / 1e9
+
+    def getStats(self):
+        """
+        Summarise the distribution of round trip times.
+
+        Returns
+        -------
+        dict
+            With keys `n`, `failures` and (in s, or None if there were no replies) `min`, `mean`,
+            `median`, `p95`, `p99`, `max` and `std`
+        """
+        stats = {'n': len(self), 'failures': self.failures}
+        if not len(self):
+            for key in ("min", "mean", "median", "p95", "p99", "max", "std"):
+                stats[key] = None
+            return stats
+        secs = self.samples / 1e9
+        stats.update({
+            'min': float(secs.min()),
+            'mean': float(secs.mean()),
+            'median': float(np.median(secs)),
+            'p95': float(np.percentile(secs, 95)),
+            'p99': float(np.percentile(secs, 99)),
+            'max': float(secs.max()),
+            'std': float(secs.std()),
+        })
+
+        return stats
+
+    def getHistogram(self, bins=20):
+        """
+        Get a histogram of round trip times.
+
+        Parameters
+        ----------
+        bins : int or list[float]
+            Number of bins, or bin edges (s)
+
+        Returns
+        -------
+        np.ndarray
+            Count in each bin
+        np.ndarray
+            Bin edges (s)
+        """
+        return np.histogram(self.samples / 1e9, bins=bins)
+
+    def getJSON(self, asString=True, bins=20):
+        """
+        Get this profile as JSON, e.g. to track a rig's latency over time.
+
+        Parameters
+        ----------
+        asString : bool
+            If True, returns a JSON string, otherwise returns a dict
+        bins : int
+            Number of histogram bins to include
+
+        Returns
+        -------
+        str or dict
+            The profile, including raw samples (ns), summary stats and histogram
+        """
+        counts, edges = self.getHistogram(bins=bins) if len(self) else ([], [])
+        profile = {
+            'command': self.command,
+            'mode': self.mode,
+            'port': self.port,
+            'timestamp': self.timestamp,
+            'failures': self.failures,
+            'samples_ns': self.samples.tolist(),
+            'stats': self.getStats(),
+            'histogram': {
+                'counts': list(map(int, counts)),
+                'edges': list(map(float, edges)),
+            },
+        }
+        if asString:
+            return json.dumps(profile, indent=2)
+
+        return profile
+
+    def save(self, filename):
+        """
+        Save this profile as a JSON file.
+
+        Parameters
+        ----------
+        filename : str or pathlib.Path
+            File to save to
+        """
+        with open(filename, "w") as f:
+            f.write(self.getJSON(asString=True))
+
+    @classmethod
+    def fromJSON(cls, profile):
+        """
+        Recreate a profile from the output of `getJSON`.
+
+        Parameters
+        ----------
+        profile : str or dict
+            JSON string or dict, as made by `getJSON`
+
+        Returns
+        -------
+        LatencyProfile
+            Recreated profile
+        """
+        if isinstance(profile, str):
+            profile = json.loads(profile)
+
+        return cls(
+            samples=profile['samples_ns'],
+            command=profile['command'],
+            mode=profile.get('mode'),
+            failures=profile.get('failures', 0),
+            port=profile.get('port'),
+            timestamp=profile.get('timestamp'),
+        )
+
+    @classmethod
+    def load(cls, filename):
+        """
+        Load a profile saved by `save`.
+
+        Parameters
+        ----------
+        filename : str or pathlib.Path
+            File to load from
+
+        Returns
+        -------
+        LatencyProfile
+            Loaded profile
+        """
+        with open(filename, "r") as f:
+            return cls.fromJSON(f.read())
+
+
+class DispatchStats:
+    """
+    Cumulative counters and histograms describing the work done reading and dispatching messages
+    from a TPad. Each update is a handful of integer additions, so stats are cheap enough to
+    collect for a whole session and read out at the end of it with `getStats`.
+
+    Histograms use power-of-2 buckets: bucket `i` counts values `v` with `2**(i-1) <= v < 2**i`
+    (bucket 0 counts zeros).
+    """
+    # names of the cumulative counters
+    counters = (
+        "dispatches",  # calls to dispatchMessages which ran
+        "reentrancySkips",  # calls to dispatchMessages skipped as a dispatch was in progress
+        "reads",  # reads of data from the serial port
+        "bytesRead",  # bytes read from the serial port
+        "linesParsed",  # complete lines which were valid messages
+        "unparsable",  # complete lines which weren't valid messages
+        "partialLines",  # reads which ended partway through a line
+        "eventsRouted",  # events stored and routed to nodes
+    )
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """
+        Set all counters and histograms back to zero.
+        """
+        for name in self.counters:
+            setattr(self, name, 0)
+        # total and longest time spent dispatching
+        self.dispatchNs = 0
+        self.maxDispatchNs = 0
+        # histograms
+        self.dispatchHist = [0] * 64
+        self.readHist = [0] * 64
+
+    def addRead(self, nBytes, nLines, nMessages, partial):
+        """
+        Record a read of data from the serial port.
+
+        Parameters
+        ----------
+        nBytes : int
+            Number of bytes read
+        nLines : int
+            Number of complete lines in the read (including any finished from the last read)
+        nMessages : int
+            Number of those lines which were valid messages
+        partial : bool
+            Whether the read ended partway through a line
+        """
+        self.reads += 1
+        self.bytesRead += nBytes
+        self.readHist[nBytes.bit_length()] += 1
+        self.linesParsed += nMessages
+        self.unparsable += nLines - nMessages
+        if partial:
+            self.partialLines += 1
+
+    def addDispatch(self, ns):
+        """
+        Record a call to dispatchMessages.
+
+        Parameters
+        ----------
+        ns : int
+            How long (ns) the dispatch took
+        """
+        self.dispatches += 1
+        self.dispatchNs += ns
+        if ns > self.maxDispatchNs:
+            self.maxDispatchNs = ns
+        self.dispatchHist[min(ns.bit_length(), 63)] += 1
+
+    @staticmethod
+    def _histToDict(hist):
+        # label each non-empty bucket by its upper edge
+        return {(2 ** i if i else 0): count for i, count in enumerate(hist) if count}
+
+    def getStats(self):
+        """
+        Get the current value of all counters and histograms.
+
+        Returns
+        -------
+        dict
+            With a key for each of `counters`, plus:
+            - `dispatchNs`/`maxDispatchNs`/`meanDispatchNs`: Total, longest and mean time (ns)
+              spent in dispatchMessages
+            - `dispatchHist`: Number of dispatches by duration (ns), keyed by bucket upper edge
+            - `readHist`: Number of reads by size (bytes), keyed by bucket upper edge
+        """
+        stats = {name: getattr(self, name) for name in self.counters}
+        stats.update({
+            'dispatchNs': self.dispatchNs,
+            'maxDispatchNs': self.maxDispatchNs,
+            'meanDispatchNs': self.dispatchNs / self.dispatches if self.dispatches else None,
+            'dispatchHist': self._histToDict(self.dispatchHist),
+            'readHist': self._histToDict(self.readHist),
+        })
+
+        return stats
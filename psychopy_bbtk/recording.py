@@ -0,0 +1,130 @@
+"""
+Save and load BBTK event recordings as compact binary files.
+
+Recordings are saved as a `.npy` file holding a structured array of `eventDtype` (one 10 byte row
+per change of state, in time order). As the format is NumPy's own, files can be reopened as a
+`numpy.memmap` and sliced by time window without reading the whole file into memory, which keeps
+multi-GB validation archives usable.
+"""
+
+from pathlib import Path
+
+import numpy as np
+
+from psychopy_bbtk import eventDtype, evtChannels
+
+# lookup from channel name to index, for converting dicts from BlackBoxToolkit.getEvents
+_channelLookup = {name: n for n, name in evtChannels.items()}
+
+
+def eventsFromDicts(events):
+    """
+    Convert events from the list of dicts returned by `BlackBoxToolkit.getEvents` into a
+    structured array.
+
+    Parameters
+    ----------
+    events : list[dict]
+        Events as returned by `BlackBoxToolkit.getEvents` (the initial state entry, with an empty
+        `evt`, is skipped)
+
+    Returns
+    -------
+    np.ndarray
+        Structured array of `eventDtype`
+    """
+    rows = []
+    for evt in events:
+        if not evt['evt']:
+            continue
+        name, state = evt['evt'].rsplit("_", 1)
+        rows.append((evt['time'], _channelLookup[name], state == "on"))
+
+    return np.array(rows, dtype=eventDtype)
+
+
+def saveEvents(filename, events):
+    """
+    Save a BBTK recording to a binary file.
+
+    Parameters
+    ----------
+    filename : str or pathlib.Path
+        File to save to, ".npy" is appended if it has no extension (any other extension is
+        kept)
+    events : np.ndarray or list[dict]
+        Events as returned by `BlackBoxToolkit.getEvents` (either as a structured array or as a
+        list of dicts)
+
+    Returns
+    -------
+    pathlib.Path
+        Path of the saved file
+    """
+    filename = Path(filename)
+    if not filename.suffix:
+        filename = filename.with_suffix(".npy")
+    # convert dicts to a structured array
+    if not isinstance(events, np.ndarray):
+        events = eventsFromDicts(events)
+    if events.dtype != eventDtype:
+        raise TypeError(
+            f"BBTK recordings must have dtype {eventDtype}, not {events.dtype}"
+        )
+    # write to a handle, as np.save would otherwise append ".npy" to any other extension
+    with open(filename, "wb") as f:
+        np.save(f, events, allow_pickle=False)
+
+    return filename
+
+
+def loadEvents(filename, mmap=True):
+    """
+    Load a BBTK recording saved by `saveEvents`.
+
+    Parameters
+    ----------
+    filename : str or pathlib.Path
+        File to load from
+    mmap : bool
+        If True (default), the file is memory-mapped (read-only) rather than read into memory, so
+        only the parts which are used are ever read from disk.
+
+    Returns
+    -------
+    np.ndarray or np.memmap
+        Structured array of `eventDtype`
+    """
+    events = np.load(filename, mmap_mode="r" if mmap else None, allow_pickle=False)
+    if events.dtype != eventDtype:
+        raise TypeError(
+            f"{filename} is not a BBTK recording (dtype is {events.dtype}, not {eventDtype})"
+        )
+
+    return events
+
+
+def eventsBetween(events, start=None, stop=None):
+    """
+    Get the events in a time window, by binary search (so on a memory-mapped recording only a few
+    pages are read to find the window).
+
+    Parameters
+    ----------
+    events : np.ndarray or np.memmap
+        Structured array of `eventDtype`, in time order
+    start : float or None
+        Time (s) from which to get events (inclusive), or None to get from the first event.
+    stop : float or None
+        Time (s) until which to get events (exclusive), or None to get until the last event.
+
+    Returns
+    -------
+    np.ndarray or np.memmap
+        View of the events in the given window
+    """
+    times = events['time']
+    lo = 0 if start is None else int(np.searchsorted(times, start, side="left"))
+    hi = len(events) if stop is None else int(np.searchsorted(times, stop, side="left"))
+
+    return events[lo:max(lo, hi)]
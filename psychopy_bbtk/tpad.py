@@ -3,8 +3,24 @@ from psychopy.hardware.base import BaseDevice, BaseResponseDevice
 from psychopy.hardware.manager import DeviceManager, ManagedDeviceError
 from psychopy import logging
 from psychopy.tools import systemtools as st
+from psychopy_bbtk.buffers import EventRingBuffer, EventStore, EventTap
+from psychopy_bbtk import calibration
+from psychopy_bbtk.calibration import (
+    applyThresholds, calibrateOptos, getDisplayKey, thresholdCache, toLevel, verifyOptos,
+    verifyVoiceKeys
+)
+from psychopy_bbtk.clocksync import ClockSync
+from psychopy_bbtk.discovery import getTPadProfiles
+from psychopy_bbtk.frametiming import analyseFrameTiming
+from psychopy_bbtk.onsets import OnsetDetector
+from psychopy_bbtk.profiling import DispatchStats, LatencyProfile
+import collections
+import contextlib
+import functools
+import numpy as np
 import re
 import sys
+import threading
 import time
 
 # import hardware classes in a version-safe way
@@ -33,13 +49,33 @@ except ImportError:
         def __init__(self, msg, deviceClass=None, context=None, *args):
             ConnectionError.__init__(self, msg)
 
-# check whether FTDI driver is installed
-hasDriver = False
-try:
-    import ftd2xx
-    hasDriver = True
-except FileNotFoundError:
-    pass
+
+@functools.lru_cache(maxsize=None)
+def checkDriver():
+    """
+    Check whether the FTDI driver is installed. This loads the driver library, so is only done
+    when first needed (i.e. when looking for a TPad) rather than on import.
+
+    Returns
+    -------
+    bool
+        True if the driver is installed
+    """
+    try:
+        import ftd2xx
+    except (ImportError, OSError):
+        # ftd2xx isn't installed, or is installed but can't find the driver library
+        return False
+
+    return True
+
+
+def __getattr__(name):
+    # hasDriver used to be checked on import, so is still available as an attribute
+    if name == "hasDriver":
+        return checkDriver()
+
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 # possible values for self.channel
@@ -84,19 +120,445 @@ def splitTPadMessage(message):
     return re.match(messageFormat, message).groups()
 
 
-class TPadLightSensorGroup(lightsensor.BaseLightSensorGroup):
+# compiled byte-level pattern which matches either a whole valid message or a whole line of
+# anything else (so unparsable lines are consumed without derailing the rest of the buffer)
+messagePattern = re.compile(
+    messageFormat.encode("utf-8") + rb"|[^\n]*\n"
+)
+# compiled byte-level pattern which matches the start of a message cut off partway, so a reply
+# sent in the middle of a message can be told apart from it
+partialPattern = re.compile(
+    r"[{channels}](?: (?:[{states}](?: (?:[{buttons}](?: \d*\r?)?)?)?)?)?".format(
+        channels="".join(re.escape(key) for key in channelCodes),
+        states="".join(re.escape(key) for key in stateCodes),
+        buttons="".join(re.escape(key) for key in buttonCodes)
+    ).encode("utf-8")
+)
+# lookups from raw bytes to parsed values (single-byte bytes objects are cached by Python, so
+# these lookups don't allocate)
+_deviceLookup = {key.encode("utf-8"): key for key in channelCodes}
+_stateLookup = {key.encode("utf-8"): key for key in stateCodes}
+_channelLookup = {str(n).encode("utf-8"): n for n in range(10)}
+_channelLookup[b"["] = 1
+_channelLookup[b"]"] = 2
+
+
+def parseTPadBytes(data):
+    """
+    Parse raw bytes from a TPad in a single pass, without decoding them to str or splitting them
+    into lines first.
+
+    Parameters
+    ----------
+    data : bytes, bytearray or memoryview
+        Raw data from the serial port. Any unfinished line at the end of the data is ignored, so
+        it's up to the caller to keep it and prepend it to the next read.
+
+    Yields
+    ------
+    tuple[str, str, int, int]
+        `(device, state, channel, ms)` for each valid message, where `device` and `state` are
+        single character codes (see `channelCodes` and `stateCodes`), `channel` is the channel
+        number and `ms` is the TPad's timestamp in milliseconds.
+    """
+    for match in messagePattern.finditer(data):
+        device, state, channel, ms = match.groups()
+        # if the line matched the catch-all, it's not a valid message
+        if device is None:
+            logging.debug(f"Received unparsable message from TPad: {repr(match.group(0))}")
+            continue
+
+        yield _deviceLookup[device], _stateLookup[state], _channelLookup[channel], int(ms)
+
+
+class TPadEventBatch:
+    """
+    Columnar batch of all the events from one device (e.g. all button events) received by a TPad
+    in a single dispatch.
+
+    Parameters
+    ----------
+    device : str
+        Device code for all events in the batch, see `channelCodes`
+    t : np.ndarray
+        Time (s) of each event
+    channel : np.ndarray
+        Channel number of each event, as reported by the TPad
+    value : np.ndarray
+        State of each event (True for pressed/on, False for released/off)
+    """
+    __slots__ = ("device", "t", "channel", "value")
+
+    def __init__(self, device, t, channel, value):
+        self.device = device
+        self.t = t
+        self.channel = channel
+        self.value = value
+
+    def __len__(self):
+        return len(self.t)
+
+    def __repr__(self):
+        return f"<TPadEventBatch: device={self.device}, {len(self)} events>"
+
+    @classmethod
+    def fromEvents(cls, device, events):
+        """
+        Make a batch from a list of parsed messages.
+
+        Parameters
+        ----------
+        device : str
+            Device code for all events in the batch, see `channelCodes`
+        events : list[tuple]
+            List of `(device, state, channel, time)` tuples
+
+        Returns
+        -------
+        TPadEventBatch
+            Batch containing the given events
+        """
+        _, states, channels, times = zip(*events)
+
+        return cls(
+            device=device,
+            t=np.array(times, dtype=float),
+            channel=np.array(channels, dtype=np.uint8),
+            value=np.array(states) == "P",
+        )
+
+    @classmethod
+    def concatenate(cls, device, batches):
+        """
+        Join several batches from the same device into one.
+
+        Parameters
+        ----------
+        device : str
+            Device code for all events in the batches, see `channelCodes`
+        batches : list[TPadEventBatch]
+            Batches to join, in time order
+
+        Returns
+        -------
+        TPadEventBatch
+            Batch containing the events from all given batches
+        """
+        if not batches:
+            return cls(
+                device=device,
+                t=np.zeros(0, dtype=float),
+                channel=np.zeros(0, dtype=np.uint8),
+                value=np.zeros(0, dtype=bool),
+            )
+
+        return cls(
+            device=device,
+            t=np.concatenate([batch.t for batch in batches]),
+            channel=np.concatenate([batch.channel for batch in batches]),
+            value=np.concatenate([batch.value for batch in batches]),
+        )
+
+    def iterMessages(self):
+        """
+        Iterate through the events in this batch as `(device, state, channel, time)` tuples, as
+        accepted by the `parseMessage` method of TPad nodes.
+        """
+        for t, channel, value in zip(self.t.tolist(), self.channel.tolist(), self.value.tolist()):
+            yield self.device, "P" if value else "R", channel, t
+
+
+class TPadBatchMixin:
+    """
+    Lets a TPad node receive all of its events from a dispatch as one `TPadEventBatch`, rather
+    than as one response object per event. Response objects are only built when something asks
+    for `.responses` (e.g. `getResponses`), unless the node has callbacks or listeners, which
+    need each response as it arrives.
+
+    Everything which depends on when an event was received is still done on receipt: muting
+    (`muteOutsidePsychopy`), updating `state`, logging and noting the threshold each event was
+    detected against. Building responses later only creates the objects. Each batch is logged as
+    one summary at level EXP, and each event is only logged (in the same format as
+    `receiveMessage`) if something is logging at level DEBUG.
+    """
+    # offset between the channel numbers reported by the TPad and the channel indices of this node
+    channelOffset = 0
+
+    @property
+    def responses(self):
+        # build responses for any batches received since last time
+        self._buildResponses()
+
+        return self._responses
+
+    @responses.setter
+    def responses(self, value):
+        # setting responses (e.g. when clearing them) also discards any unbuilt ones
+        self._pendingBatches = []
+        self._responses = value
+
+    def receiveBatch(self, batch):
+        """
+        Receive a batch of events from the parent TPad.
+
+        Parameters
+        ----------
+        batch : TPadEventBatch
+            Events to receive, all from the device this node handles
+
+        Returns
+        -------
+        bool
+            True if the batch was received, False if it was empty or this node is muted
+        """
+        if not len(batch):
+            return False
+        # disregard any messages received while the PsychoPy window isn't in focus (for security)
+        if self.muteOutsidePsychopy and not st.isRegisteredApp():
+            return False
+        # update state to the last value of each channel in the batch
+        channels = batch.channel.astype(int) - self.channelOffset
+        for channel in np.unique(channels).tolist():
+            self.state[channel] = bool(batch.value[channels == channel][-1])
+        if self.callbacks or self.listeners:
+            # callbacks and listeners need each response as it comes, so build them now
+            for message in batch.iterMessages():
+                self.receiveMessage(
+                    self.parseMessage(message)
+                )
+        else:
+            # log now, so the log shows when events arrived (each event is only formatted if it
+            # would be logged, as doing so costs far more than receiving it)
+            logging.exp(
+                f"Device responses: {len(batch)} from {type(self).__name__} "
+                f"(t={batch.t[0]:.4f} to {batch.t[-1]:.4f})"
+            )
+            if logging.root.lowestTarget <= logging.DEBUG:
+                for message in batch.iterMessages():
+                    logging.debug(f"Device response: {self.parseMessage(message)}")
+            # keep the batch (and the thresholds it was detected against) until responses are
+            # asked for
+            threshold = getattr(self, "threshold", None)
+            if threshold is not None:
+                threshold = list(threshold)
+            self._pendingBatches.append((batch, threshold))
+
+        return True
+
+    def _buildResponses(self):
+        """
+        Build response objects for any batches which haven't been built yet.
+        """
+        if not self._pendingBatches:
+            return
+        # take batches first, so that nothing which reads self.responses builds them again
+        batches, self._pendingBatches = self._pendingBatches, []
+        for batch, threshold in batches:
+            for message in batch.iterMessages():
+                resp = self.parseMessage(message)
+                # use the threshold in force when the event was received, not the current one
+                if threshold is not None and resp.channel < len(threshold):
+                    resp.threshold = threshold[resp.channel]
+                # muting, state, logging, callbacks and listeners were all handled on receipt,
+                # so just store
+                self._responses.append(resp)
+
+    def popBatch(self):
+        """
+        Get all events received since responses were last built or cleared, as a single
+        `TPadEventBatch`, without building any response objects.
+
+        Returns
+        -------
+        TPadEventBatch
+            Columnar batch of events (channels are as reported by the TPad)
+        """
+        # make sure parent dispatches messages
+        self.dispatchMessages()
+        # take pending batches
+        batches, self._pendingBatches = self._pendingBatches, []
+
+        return TPadEventBatch.concatenate(self.deviceCodes[0], [batch for batch, _ in batches])
+
+
+class TPadCalibrationMixin:
+    """
+    Lets a TPad sensor group set thresholds on several channels at once, and keep its calibration
+    (thresholds and, for optos, position) between sessions by storing it against the identity of
+    its TPad (see `TPad.getIdentity`).
+    """
+    # name which this group's calibration is stored under
+    calibrationKey = None
+    # command to set a threshold on the TPad
+    thresholdCommand = None
+
+    def setThresholds(self, thresholds, settle=0.1):
+        """
+        Set thresholds on several channels at once, in one command session: every threshold
+        command is sent together, then all the replies are read back together after a single
+        settle, rather than switching mode and settling once per channel.
+
+        Parameters
+        ----------
+        thresholds : dict[int:float]
+            Threshold (0-1) for each channel (numbered from 0), channels set to None are skipped
+        settle : float
+            Time (s) to wait for the sensors to settle before reading replies
+
+        Returns
+        -------
+        dict[int:bool or None]
+            Whether each sensor is above its new threshold, None for any which didn't reply
+        """
+        thresholds = {
+            channel: threshold for channel, threshold in thresholds.items()
+            if threshold is not None
+        }
+        if not thresholds:
+            return {}
+        replies = {}
+        with self.parent.commandSession() as session:
+            for channel, threshold in thresholds.items():
+                replies[channel] = session.send(
+                    f"{self.thresholdCommand}{channel + 1} {toLevel(threshold)}"
+                )
+            session.flush(settle=settle)
+        # store thresholds
+        for channel, threshold in thresholds.items():
+            self.threshold[channel] = threshold
+
+        return {channel: reply.measurement for channel, reply in replies.items()}
+
+    def setThreshold(self, threshold, channel=None):
+        # if given several channels, set them all at once
+        if channel is None:
+            channel = list(range(self.channels))
+        if isinstance(channel, (list, tuple)):
+            if not isinstance(threshold, (list, tuple)):
+                threshold = [threshold] * len(channel)
+            # store given thresholds, even if None
+            for thisThreshold, thisChannel in zip(threshold, channel):
+                self.threshold[thisChannel] = thisThreshold
+            detected = self.setThresholds(dict(zip(channel, threshold)))
+
+            return [detected.get(thisChannel) for thisChannel in channel]
+
+        self.threshold[channel] = threshold
+
+        return self._setThreshold(threshold, channel=channel)
+
+    def _setThreshold(self, threshold, channel=None):
+        """
+        Set the threshold (0-1) of one channel, returning whether the sensor is above it.
+        """
+        if threshold is None:
+            return
+
+        # with this threshold, is the sensor returning True?
+        return self.setThresholds({channel: threshold})[channel]
+
+    def getCalibration(self):
+        """
+        Get the stored calibration of this sensor group.
+
+        Returns
+        -------
+        dict
+            Stored values (empty if there are none)
+        """
+        return self.parent.getCalibration(self.calibrationKey)
+
+    def saveCalibration(self, values):
+        """
+        Store values in the calibration of this sensor group, and save to disk.
+
+        Parameters
+        ----------
+        values : dict
+            Values to store
+        """
+        self.parent.saveCalibration(self.calibrationKey, values)
+
+    def _loadThresholds(self, thresholds):
+        """
+        Set stored thresholds on the TPad, all in one round of commands, keeping them only if
+        every channel replied.
+
+        Parameters
+        ----------
+        thresholds : list[float or None] or None
+            Stored threshold (0-1) for each channel, None for any which weren't calibrated
+
+        Returns
+        -------
+        bool
+            True if the stored thresholds are now in use
+        """
+        thresholds = {
+            channel: value for channel, value in enumerate(thresholds or [])
+            if value is not None and channel < self.channels
+        }
+        if not thresholds:
+            return False
+        readings = applyThresholds(self.parent, thresholds, command=self.thresholdCommand)
+        if any(value is None for value in readings.values()):
+            logging.warning(
+                f"{self.calibrationKey} on {self.parent.portString} didn't reply when checking "
+                f"stored thresholds, so they won't be used."
+            )
+            return False
+        for channel, value in thresholds.items():
+            self.threshold[channel] = value
+        logging.info(
+            f"Using stored thresholds for {self.calibrationKey} on {self.parent.portString}: "
+            f"{thresholds}"
+        )
+
+        return True
+
+    def _mergeThresholds(self, stored, thresholds):
+        """
+        Merge newly found thresholds into a stored list of thresholds (one per channel).
+        """
+        merged = list(stored or [])
+        merged += [None] * (self.channels - len(merged))
+        for channel, value in thresholds.items():
+            merged[channel] = value
+
+        return merged
+
+
+class TPadLightSensorGroup(
+    TPadCalibrationMixin, TPadBatchMixin, lightsensor.BaseLightSensorGroup
+):
+    # device codes (see `channelCodes`) of messages which this node should receive
+    deviceCodes = ("C",)
+    # optos are numbered from 1
+    channelOffset = 1
+    # calibration is stored under this name, and thresholds set with this command
+    calibrationKey = "TPadLightSensorGroup"
+    thresholdCommand = "AAO"
+
     def __init__(self, pad, channels, threshold=None, pos=None, size=None, units=None):
         _requestedPad = pad
         # get associated tpad
         self.parent = TPad.resolve(pad)
         # reference self in pad
-        self.parent.nodes.append(self)
+        self.parent.addNode(self)
+        # get the last calibration of this rig (if any)
+        stored = self.getCalibration()
+        # use stored position if not given one
+        if pos is None and stored.get('pos') is not None:
+            pos, size, units = stored['pos'], stored.get('size'), stored.get('units')
         # initialise base class
         lightsensor.BaseLightSensorGroup.__init__(
             self, channels=channels, threshold=threshold, pos=pos, size=size, units=units
         )
         # set to data collection mode
         self.parent.setMode(3)
+        # use stored thresholds (for the display last calibrated against) if not given any
+        if threshold is None:
+            self._loadThresholds(stored.get('thresholds', {}).get(stored.get('display')))
 
     def isSameDevice(self, other):
         """
@@ -138,34 +600,15 @@ class TPadLightSensorGroup(lightsensor.BaseLightSensorGroup):
 
         return devices
 
-    def _setThreshold(self, threshold, channel):
-        if threshold is None:
-            return
-        # enter command mode
-        self.parent.setMode(0)
-        # send command to set threshold
-        self.parent.sendMessage(f"AAO{channel+1} {int(threshold * 255)}")
-        # force a sleep for diode to settle
-        time.sleep(0.1)
-        # get 0 or 1 according to light level
-        resp = self.parent.awaitResponse(timeout=0.1)
-        # with this threshold, is the sensor returning True?
-        measurement = None
-        if resp is not None:
-            if resp.strip() == "1":
-                measurement = True
-            if resp.strip() == "0":
-                measurement = False
-        # store threshold
-        self.threshold[channel] = threshold
-        # return to sampling mode
-        self.parent.setMode(3)
-
-        return measurement
-
     def resetTimer(self, clock=logging.defaultClock):
         self.parent.resetTimer(clock=clock)
 
+    def close(self):
+        """
+        Detach from the parent TPad, so this node no longer receives messages.
+        """
+        self.parent.removeNode(self)
+
     def dispatchMessages(self):
         """
         Dispatch messages from parent TPad to this light sensor group
@@ -175,7 +618,7 @@ class TPadLightSensorGroup(lightsensor.BaseLightSensorGroup):
         bool
             True if request sent successfully
         """
-        self.parent.dispatchMessages()
+        return self.parent.dispatchMessages()
     
     def hasUnfinishedMessage(self):
         """
@@ -215,31 +658,230 @@ class TPadLightSensorGroup(lightsensor.BaseLightSensorGroup):
         return resp
 
     def findSensor(self, win, channel=None, retryLimit=5):
+        from psychopy import layout
+        # if the sensor is still where it was last session, there's no need to search
+        stored = self.getCalibration()
+        if stored.get('pos') is not None and self._checkPosition(win, stored, channel):
+            self.units = stored['units']
+            self.size = stored['size']
+            self.pos = stored['pos']
+            return (
+                layout.Position(self.pos, units=self.units, win=win),
+                layout.Position(self.size, units=self.units, win=win),
+            )
         # set mode to 3
         self.parent.setMode(3)
         self.parent.pause()
         # continue as normal
-        return lightsensor.BaseLightSensorGroup.findSensor(self, win, channel, retryLimit=5)
+        resp = lightsensor.BaseLightSensorGroup.findSensor(self, win, channel, retryLimit=5)
+        # store found position
+        if self.pos is not None and self.size is not None:
+            self.saveCalibration({
+                'pos': [float(val) for val in self.pos],
+                'size': [float(val) for val in self.size],
+                'units': self.units,
+            })
+
+        return resp
+
+    def _checkPosition(self, win, stored, channel=None):
+        """
+        Check whether the sensor is still at a stored position, by showing a white patch there on
+        a black screen.
+        """
+        if channel is None:
+            channel = 0
+        threshold = self.getThreshold(channel)
+        if threshold is None:
+            return False
+        # import visual here - if they're using this function, it's already in the stack
+        from psychopy import visual
+        win.stashAutoDraw()
+        bg = visual.Rect(
+            win,
+            size=(2, 2), pos=(0, 0), units="norm",
+            fillColor="black",
+            autoDraw=False
+        )
+        patch = visual.Rect(
+            win,
+            size=stored['size'], pos=stored['pos'], units=stored['units'],
+            fillColor="white",
+            autoDraw=False
+        )
+
+        def _present(color):
+            bg.draw()
+            if color == "white":
+                patch.draw()
+            win.flip()
+
+        try:
+            found = verifyOptos(self.parent, {channel: threshold}, _present)
+        finally:
+            # reinstate autodraw
+            win.retrieveAutoDraw()
+            win.flip()
+        # clear all the events created by this process
+        self.dispatchMessages()
+        self.clearResponses()
+
+        return found
 
     def findThreshold(self, win, channel=None):
-        # set mode to 0 and lock it so mode doesn't change during setThreshold calls
-        self.parent.setMode(0)
-        self.parent.lockMode()
-        # continue as normal
-        resp = lightsensor.BaseLightSensorGroup.findThreshold(self, win, channel)
-        # set back to mode 3
-        self.parent.unlockMode()
-        self.parent.setMode(3)
+        """
+        Find the best threshold for one or all optos, by showing a black then a white screen and
+        searching for the level each opto reads under both. All optos are calibrated together in
+        one command session, starting from the levels found last time on the same port and
+        display (see `psychopy_bbtk.calibration`).
 
-        return resp
+        If thresholds for this TPad and display were stored by a previous session, they're
+        checked first with one probe on white and one on black, and only if that fails are the
+        optos calibrated again. Thresholds found are stored for next time.
+
+        Parameters
+        ----------
+        win : psychopy.visual.Window
+            Window the optos are placed on
+        channel : int or None
+            Channel to calibrate, or None for all of them
+
+        Returns
+        -------
+        float, list[float] or None
+            Threshold (0-1) found for the channel (or a list of thresholds if calibrating all
+            channels), None for any channel which didn't respond to the screen
+        """
+        if channel is None:
+            channels = list(range(self.channels))
+        else:
+            channels = [channel]
+        # import visual here - if they're using this function, it's already in the stack
+        from psychopy import visual
+        # box to cover screen
+        win.stashAutoDraw()
+        bg = visual.Rect(
+            win,
+            size=(2, 2), pos=(0, 0), units="norm",
+            autoDraw=False
+        )
+
+        def _present(color):
+            bg.fillColor = color
+            bg.draw()
+            win.flip()
+
+        port = self.parent.portString
+        display = getDisplayKey(win)
+        # thresholds and levels stored for this display by a previous session
+        stored = self.getCalibration()
+        storedThresholds = stored.get('thresholds', {}).get(display) or []
+        storedLevels = stored.get('levels', {}).get(display, {})
+        previous = {
+            thisChannel: storedThresholds[thisChannel] for thisChannel in channels
+            if thisChannel < len(storedThresholds) and storedThresholds[thisChannel] is not None
+        }
+        try:
+            if len(previous) == len(channels) and verifyOptos(self.parent, previous, _present):
+                # stored thresholds still work, so use them
+                thresholds = previous
+            else:
+                # calibrate, starting from stored levels if there are none from this session
+                for thisChannel in channels:
+                    levels = storedLevels.get(str(thisChannel))
+                    if levels and thresholdCache.get(port, display, thisChannel) is None:
+                        thresholdCache.set(port, display, thisChannel, levels)
+                thresholds = calibrateOptos(self.parent, channels, _present, display=display)
+        finally:
+            # reinstate autodraw
+            win.retrieveAutoDraw()
+            win.flip()
+        # store for next time
+        for thisChannel in channels:
+            levels = thresholdCache.get(port, display, thisChannel)
+            if levels is not None:
+                storedLevels[str(thisChannel)] = levels
+        self.saveCalibration({
+            'display': display,
+            'thresholds': {
+                **stored.get('thresholds', {}),
+                display: self._mergeThresholds(storedThresholds, thresholds),
+            },
+            'levels': {**stored.get('levels', {}), display: storedLevels},
+        })
+        # store found thresholds (0 for any which failed, as it's what the TPad is now set to)
+        for thisChannel, threshold in thresholds.items():
+            self.threshold[thisChannel] = threshold or 0
+        # clear all the events created by this process
+        self.dispatchMessages()
+        self.clearResponses()
+
+        if channel is None:
+            return [thresholds[thisChannel] for thisChannel in channels]
+        return thresholds[channel]
+
+    def getFrameTiming(
+            self, flipTimes, channel=0, expected=None, initial=None, frameDur=None, minLatency=0
+    ):
+        """
+        Analyse the timing of a run of frames, by matching the edges this opto saw to the times
+        returned by `win.flip()` (see `psychopy_bbtk.frametiming.analyseFrameTiming`). Edges are
+        read from the parent TPad's store of events, so this can be called whether or not
+        responses have been taken since.
+
+        Parameters
+        ----------
+        flipTimes : list[float] or np.ndarray
+            Time (s) returned by `win.flip()` for each frame of the run, using the clock last
+            given to `resetTimer` (by default, the same clock as `win.flip()`)
+        channel : int
+            Channel of the opto placed on the window
+        expected : list[bool] or np.ndarray or None
+            Whether each frame should leave the patch under the opto light (True) or dark
+            (False). If None, frames are taken to alternate, starting with light.
+        initial : bool or None
+            Whether the patch was light before the first flip. If None, the first frame is
+            taken to be a transition.
+        frameDur : float or None
+            Duration (s) of one refresh. If None, uses the median interval between flips.
+        minLatency : float
+            Shortest possible time (s) from a flip to the opto seeing it
+
+        Returns
+        -------
+        psychopy_bbtk.frametiming.FrameTimingReport
+            Timing of each frame
+        """
+        flipTimes = np.asarray(flipTimes, dtype=float)
+        # make sure all events so far are stored
+        self.dispatchMessages()
+        # get events from the first flip on
+        events = self.parent.messages.getArrays(start=flipTimes[0] if len(flipTimes) else None)
+        device = np.frombuffer(events['device'], dtype=np.uint8)
+        channels = np.frombuffer(events['channel'], dtype=np.uint8)
+        # keep only edges from this opto
+        mask = (device == ord(self.deviceCodes[0])) & (channels == channel + self.channelOffset)
+
+        return analyseFrameTiming(
+            flipTimes,
+            edgeTimes=np.frombuffer(events['t'], dtype=float)[mask],
+            edgeValues=np.frombuffer(events['state'], dtype=np.uint8)[mask] == ord("P"),
+            expected=expected,
+            initial=initial,
+            frameDur=frameDur,
+            minLatency=minLatency,
+        )
 
 
-class TPadButtonGroup(button.BaseButtonGroup):
+class TPadButtonGroup(TPadBatchMixin, button.BaseButtonGroup):
+    # device codes (see `channelCodes`) of messages which this node should receive
+    deviceCodes = ("A",)
+
     def __init__(self, pad, channels=9):
         # get associated tpad
         self.parent = TPad.resolve(pad)
         # reference self in pad
-        self.parent.nodes.append(self)
+        self.parent.addNode(self)
         # initialise base class
         button.BaseButtonGroup.__init__(self, channels=channels)
         # set to data collection mode
@@ -280,7 +922,7 @@ class TPadButtonGroup(button.BaseButtonGroup):
         bool
             True if request sent successfully
         """
-        self.parent.dispatchMessages()
+        return self.parent.dispatchMessages()
     
     def hasUnfinishedMessage(self):
         """
@@ -331,68 +973,170 @@ class TPadButtonGroup(button.BaseButtonGroup):
     def resetTimer(self, clock=logging.defaultClock):
         self.parent.resetTimer(clock=clock)
 
+    def close(self):
+        """
+        Detach from the parent TPad, so this node no longer receives messages.
+        """
+        self.parent.removeNode(self)
+
 
-class TPadSoundSensorGroup(BaseSoundSensorGroup):
-    def __init__(self, pad, channels=1, threshold=None):
+class TPadSoundSensorGroup(TPadCalibrationMixin, TPadBatchMixin, BaseSoundSensorGroup):
+    # device codes (see `channelCodes`) of messages which this node should receive
+    deviceCodes = ("M",)
+    # voice keys are numbered from 1
+    channelOffset = 1
+    # calibration is stored under this name, and thresholds set with this command
+    calibrationKey = "TPadSoundSensorGroup"
+    thresholdCommand = "AAVK"
+
+    def __init__(self, pad, channels=1, threshold=None, debounce=0.05, minDuration=0.1):
         _requestedPad = pad
         # get associated tpad
         self.parent = TPad.resolve(pad)
         # reference self in pad
-        self.parent.nodes.append(self)
+        self.parent.addNode(self)
+        # turns raw press/release edges into voice onsets as they're dispatched
+        self.onsetDetector = OnsetDetector(debounce=debounce, minDuration=minDuration)
         # initialise base class
         BaseSoundSensorGroup.__init__(
             self, channels=channels, threshold=threshold
         )
         # set to data collection mode
         self.parent.setMode(3)
+        # use stored thresholds if not given any
+        if threshold is None:
+            self._loadThresholds(self.getCalibration().get('thresholds'))
+
+    def findThreshold(self, speaker, channel=None, samplingWindow=0.5):
+        """
+        Find the best threshold for one or all voice keys with a given speaker (see
+        `BaseSoundSensorGroup.findThreshold`).
+
+        If thresholds for this TPad were stored by a previous session, they're checked first
+        with one probe while the test sound plays from the speaker and one in silence (every
+        voice key should be above its threshold only while the sound plays), and only if that
+        fails are the voice keys calibrated again. Thresholds found are stored for next time.
+
+        Parameters
+        ----------
+        speaker : psychopy.hardware.speaker.SpeakerDevice
+            Speaker to find best threshold for.
+        channel : int or None
+            Channel to calibrate, or None for all of them
+        samplingWindow : float
+            How long (s) to wait for a response after playing the test noise
+
+        Returns
+        -------
+        float or list[float]
+            Threshold (0-1) found for the channel, or a list of thresholds if calibrating all
+            channels
+        """
+        if channel is None:
+            channels = list(range(self.channels))
+        else:
+            channels = [channel]
+        # check thresholds stored by a previous session
+        stored = self.getCalibration().get('thresholds') or []
+        previous = {
+            thisChannel: stored[thisChannel] for thisChannel in channels
+            if thisChannel < len(stored) and stored[thisChannel] is not None
+        }
+        if len(previous) == len(channels):
+            from psychopy import sound
+            # sound to check with (the same one as the base class calibrates with)
+            snd = sound.Sound("voicekeyThresholdStim.wav", speaker=speaker, secs=5, loops=-1)
+
+            def _play(condition):
+                if condition == "sound":
+                    snd.play()
+                else:
+                    snd.stop()
+
+            try:
+                found = verifyVoiceKeys(self.parent, previous, _play, settle=samplingWindow)
+            finally:
+                snd.stop()
+            # clear all the events created by this process
+            self.dispatchMessages()
+            self.clearResponses()
+            if found:
+                # stored thresholds still work, so use them
+                for thisChannel, value in previous.items():
+                    self.threshold[thisChannel] = value
+                if channel is None:
+                    return [previous[thisChannel] for thisChannel in channels]
+                return previous[channel]
+        # calibrate each channel (calling the base class per channel, so it doesn't come back
+        # here for each one)
+        thresholds = {}
+        for thisChannel in channels:
+            thresholds[thisChannel] = BaseSoundSensorGroup.findThreshold(
+                self, speaker, channel=thisChannel, samplingWindow=samplingWindow
+            )
+        # store for next time
+        self.saveCalibration({'thresholds': self._mergeThresholds(stored, thresholds)})
+
+        if channel is None:
+            return [thresholds[thisChannel] for thisChannel in channels]
+        return thresholds[channel]
     
     def resetTimer(self, clock=logging.defaultClock):
         self.parent.resetTimer(clock=clock)
-    
-    def _setThreshold(self, threshold, channel=None):
+
+    def close(self):
+        """
+        Detach from the parent TPad, so this node no longer receives messages.
+        """
+        self.parent.removeNode(self)
+
+    def receiveBatch(self, batch):
+        if not TPadBatchMixin.receiveBatch(self, batch):
+            return False
+        # detect onsets as events arrive
+        self.onsetDetector.addBatch(
+            batch.t, batch.channel.astype(int) - self.channelOffset, batch.value
+        )
+
+        return True
+
+    def getOnsets(self, channel=None, clear=True):
         """
-        Device-specific threshold setting method. This will be called by `setThreshold` and should 
-        be overloaded by child classes of BaseSoundSensor.
+        Get voice onsets detected since they were last cleared (see
+        `psychopy_bbtk.onsets.OnsetDetector`), after dispatching any new events. Utterances are
+        judged against the latest event received from the TPad rather than the current time, so
+        one which is still going is only returned once it's lasted long enough by that measure.
 
         Parameters
         ----------
-        threshold : int
-            Threshold at which to register a SoundSensor response, with 0 being the lowest possible 
-            volume and 255 being the highest.
-        channel : int
-            Channel to set the threshold for (if applicable to device)
+        channel : int or None
+            Channel to get onsets from, or None for all channels
+        clear : bool
+            Whether to remove the returned onsets, so they aren't returned again
 
         Returns
-        ------
-        bool
-            True if current decibel level is above the threshold.
+        -------
+        list[psychopy_bbtk.onsets.VoiceOnset]
+            Detected onsets, with times according to the clock last given to `resetTimer`
         """
-        if threshold is None:
-            return
-        # enter command mode
-        self.parent.setMode(0)
-        # send command to set threshold
-        self.parent.sendMessage(f"AAVK{channel+1} {int(threshold * 255)}")
-        # force a sleep for diode to settle
-        time.sleep(0.1)
-        # get 0 or 1 according to light level
-        resp = self.parent.awaitResponse(timeout=0.1)
-        # with this threshold, is the sensor returning True?
-        measurement = None
-        if resp is not None:
-            if resp.strip() == "1":
-                measurement = True
-            if resp.strip() == "0":
-                measurement = False
-        # store threshold
-        self.threshold[channel] = threshold
-        # return to sampling mode
-        self.parent.setMode(3)
+        self.dispatchMessages()
+        # bring utterances in progress up to date with the latest event from the TPad (events
+        # before it have all arrived, as the TPad sends them in order, but any after it could
+        # still be on their way)
+        messages = self.parent.messages
+        self.onsetDetector.update(messages[-1].t if len(messages) else None)
+
+        return self.onsetDetector.getOnsets(channel=channel, clear=clear)
+
+    def clearOnsets(self):
+        """
+        Forget all detected onsets and any utterances in progress, e.g. at the start of a trial.
+        """
+        self.dispatchMessages()
+        self.onsetDetector.reset()
 
-        return measurement
-    
     def dispatchMessages(self):
-        self.parent.dispatchMessages()
+        return self.parent.dispatchMessages()
     
     def hasUnfinishedMessage(self):
         """
@@ -463,8 +1207,242 @@ class TPadSoundSensorGroup(BaseSoundSensorGroup):
         return devices
 
 
+class TPadReply:
+    """
+    Reply to a command sent in a `TPadCommandSession`, which is filled in when the session is
+    flushed.
+
+    Parameters
+    ----------
+    command : str
+        Command which this is the reply to
+    """
+    __slots__ = ("command", "value")
+
+    def __init__(self, command):
+        self.command = command
+        # reply as a stripped string, or None if not (yet) received
+        self.value = None
+
+    def __repr__(self):
+        return f"<TPadReply: {self.command} -> {self.value!r}>"
+
+    @property
+    def measurement(self):
+        """
+        Reply interpreted as a 0/1 measurement (e.g. whether a sensor is above threshold), or
+        None if the reply was anything else.
+        """
+        if self.value == "1":
+            return True
+        if self.value == "0":
+            return False
+
+
+class TPadNodeList(list):
+    """
+    List of the nodes attached to a TPad, which tells the TPad to rebuild its routing table
+    whenever it's changed (so nodes added to or removed from `TPad.nodes` directly are routed
+    just like those added by `addNode`).
+
+    Parameters
+    ----------
+    pad : TPad
+        TPad whose nodes these are
+    nodes : list
+        Initial nodes
+    """
+    def __init__(self, pad, nodes=()):
+        list.__init__(self, nodes)
+        self.pad = pad
+
+    def _changed(self):
+        self.pad._rebuildRoutes()
+
+    def append(self, node):
+        list.append(self, node)
+        self._changed()
+
+    def extend(self, nodes):
+        list.extend(self, nodes)
+        self._changed()
+
+    def insert(self, i, node):
+        list.insert(self, i, node)
+        self._changed()
+
+    def remove(self, node):
+        list.remove(self, node)
+        self._changed()
+
+    def pop(self, i=-1):
+        node = list.pop(self, i)
+        self._changed()
+
+        return node
+
+    def clear(self):
+        list.clear(self)
+        self._changed()
+
+    def __setitem__(self, i, value):
+        list.__setitem__(self, i, value)
+        self._changed()
+
+    def __delitem__(self, i):
+        list.__delitem__(self, i)
+        self._changed()
+
+    def __iadd__(self, nodes):
+        list.__iadd__(self, nodes)
+        self._changed()
+
+        return self
+
+
+class TPadPortLock:
+    """
+    Re-entrant lock on a TPad's serial port, which keeps count of how many threads are waiting
+    for it. A thread which holds the port for most of the time (i.e. the reader thread) can check
+    `waiting` and step aside, as Python's locks don't otherwise guarantee that a waiting thread
+    ever gets a turn.
+    """
+    def __init__(self):
+        self._lock = threading.RLock()
+        # thread currently holding the lock, and how many times it's acquired it
+        self._owner = None
+        self._count = 0
+        # number of threads currently blocked waiting for the lock (and a lock to count them
+        # under, so two threads starting to wait at once can't lose a count)
+        self.waiting = 0
+        self._countLock = threading.Lock()
+
+    def acquire(self, blocking=True, timeout=-1):
+        # take straight away if free
+        if self._lock.acquire(blocking=False):
+            self._taken()
+            return True
+        if not blocking:
+            return False
+        # otherwise, wait, counting this thread as waiting
+        with self._countLock:
+            self.waiting += 1
+        try:
+            acquired = self._lock.acquire(timeout=timeout)
+        finally:
+            with self._countLock:
+                self.waiting -= 1
+        if acquired:
+            self._taken()
+
+        return acquired
+
+    def _taken(self):
+        self._owner = threading.get_ident()
+        self._count += 1
+
+    def release(self):
+        self._count -= 1
+        if not self._count:
+            self._owner = None
+        self._lock.release()
+
+    def isHeld(self):
+        """
+        Is the lock held by the calling thread?
+        """
+        return self._owner == threading.get_ident()
+
+    def __enter__(self):
+        self.acquire()
+
+        return self
+
+    def __exit__(self, *args):
+        self.release()
+
+
+class TPadCommandSession:
+    """
+    Group of commands sent to a TPad in command mode (mode 0). Commands are written as soon as
+    they're sent, without waiting for each reply, and replies are matched to commands in order
+    when the session is flushed. Make one with `TPad.commandSession`.
+
+    Parameters
+    ----------
+    pad : TPad
+        TPad to send commands to
+    """
+    def __init__(self, pad):
+        self.pad = pad
+        # replies not yet received, in the order their commands were sent
+        self._pending = []
+
+    def send(self, command, expectReply=True):
+        """
+        Write a command to the TPad without waiting for a reply.
+
+        Parameters
+        ----------
+        command : str
+            Command to send
+        expectReply : bool
+            Whether the TPad replies to this command
+
+        Returns
+        -------
+        TPadReply
+            Object which will hold the reply once the session is flushed
+        """
+        reply = TPadReply(command)
+        message = command.encode("utf-8")
+        if not message.endswith(self.pad.eol):
+            message += self.pad.eol
+        self.pad.com.write(message)
+        logging.debug(f"Sent {self.pad.name} message: {repr(message)}")
+        if expectReply:
+            self._pending.append(reply)
+
+        return reply
+
+    def flush(self, settle=0, timeout=0.1):
+        """
+        Read replies to all commands sent since the last flush.
+
+        Parameters
+        ----------
+        settle : float
+            Time (s) to wait before reading, e.g. to let a sensor settle after a new threshold.
+        timeout : float
+            Time (s) to wait for each reply before giving up on it.
+
+        Returns
+        -------
+        list[TPadReply]
+            Replies, in the order their commands were sent
+        """
+        self.pad.com.flush()
+        if settle:
+            time.sleep(settle)
+        replies, self._pending = self._pending, []
+        self.pad.com.timeout = timeout
+        for reply in replies:
+            line = self.pad.com.read_until(self.pad.eol)
+            if line.endswith(self.pad.eol):
+                reply.value = line.decode("utf-8").strip()
+            else:
+                logging.warn(
+                    f"TPad on {self.pad.portString} didn't reply to `{reply.command}` within "
+                    f"{timeout}s."
+                )
+
+        return replies
+
+
 class TPad(sd.SerialDevice):
     name = b"TPad"
+    # most bytes to read and dispatch before sending a command (about 1/3s of continuous events)
+    maxDrainBytes = 4096
 
     def __init__(
             self, port=None, baudrate=115200,
@@ -472,17 +1450,22 @@ class TPad(sd.SerialDevice):
             parity="N",  # 'N'one, 'E'ven, 'O'dd, 'M'ask,
             eol=b"\r\n",
             maxAttempts=1, pauseDuration=1/1000,
-            checkAwake=True
+            checkAwake=True,
+            threaded=False, bufferSize=4096,
+            messageCapacity=100000, messageMaxAge=None,
+            correctDrift=False, collectStats=False,
+            possiblePorts=None, calibrationStore=None
     ):
-        # error if there's no ftdi driver
-        if not hasDriver:
-            raise ModuleNotFoundError(
-                "Could not connect to BBTK device as your computer is missing a necessary "
-                "hardware driver. You should be able to find the correct driver for your operating "
-                "system here: https://ftdichip.com/drivers/vcp-drivers/"
-            )
-        # get ports with a TPad connected
-        possiblePorts = self._detectComPort()
+        # no port open yet (so cleanup still works if we fail to find one)
+        self.com = None
+        # get ports with a TPad connected (unless already known, e.g. from one discovery for
+        # several TPads)
+        if possiblePorts is None:
+            possiblePorts = self._detectComPort()
+            # if the TPad isn't among them, it may have been plugged in since ports were cached,
+            # so list them again
+            if not possiblePorts or (port is not None and port not in possiblePorts):
+                possiblePorts = self._detectComPort(refresh=True)
         # error if there are none
         if not possiblePorts:
             raise DeviceNotConnectedError(
@@ -499,24 +1482,59 @@ class TPad(sd.SerialDevice):
         if port not in possiblePorts:
             raise DeviceNotConnectedError(
                 (
-                    "Could not find a TPad on {port}, but did find TPad(s) on: {possiblePorts}.",
+                    "Could not find a TPad on {port}, but did find TPad(s) on: {possiblePorts}."
                 ).format(port=port, possiblePorts=possiblePorts),
                 deviceClass=TPad
             )
         # initial value for last timer reset
         self._lastTimerReset = logging.defaultClock._timeAtLastReset
-        # dict of responses by timestamp
-        self.messages = {}
-        # indicator that a message dispatch is currently in progress (prevents threaded 
-        # dispatch loops from tripping over one another)
-        self._dispatchInProgress = False
+        # clock which TPad times are converted to, and estimate of drift between it and the TPad
+        # (only applied to times if `correctDrift` is True, see `psychopy_bbtk.clocksync`)
+        self._clock = logging.defaultClock
+        self.clockSync = ClockSync(correct=correctDrift)
+        self.clockSync.reset(anchor=self._lastTimerReset)
+        # time-ordered store of received events, bounded so it can't grow forever
+        self.messages = EventStore(capacity=messageCapacity, maxAge=messageMaxAge)
+        # lock held while messages are dispatched (so threads sharing this TPad never interleave
+        # reads or route the same event twice), and the thread currently holding it
+        self._dispatchLock = threading.Lock()
+        self._dispatchOwner = None
         # attribute to store last line in case of splicing
-        self._lastLine = ""
-        # nodes
+        self._lastLine = b""
+        # TPad time (ms) of the last event received since the timer was reset, and what's needed
+        # to convert events timed before the last reset which arrive after it (see `_parseData`)
+        self._lastDeviceMs = None
+        self._lastEpoch = None
+        # counters for the work done dispatching (if requested)
+        self.stats = DispatchStats() if collectStats else None
+        # nodes, and a table of which nodes to dispatch each device code to (rebuilt whenever
+        # nodes change)
+        self._routes = {code: () for code in channelCodes}
         self.nodes = []
+        # taps which every dispatched event is copied into (see `addTap`)
+        self._taps = ()
         # attribute to keep track of mode state
         self._mode = None
         self._modeLock = False
+        # command session currently in progress (if any)
+        self._session = None
+        # lock held whenever the serial port is read from or a command is in flight, so that a
+        # reader thread can't swallow replies to commands
+        self._comLock = TPadPortLock()
+        # events read while a command held the port, waiting to be dispatched (they're never
+        # routed there and then, as a node's callback could need the port)
+        self._deferred = collections.deque()
+        # reader thread and the buffer it fills (only used in threaded mode)
+        self._reader = None
+        self._readerStop = threading.Event()
+        self._eventBuffer = None
+        # function called by the reader thread when it's buffered new events
+        self.onRead = None
+        # firmware version (from `isAwake`), and where calibrations of this TPad are saved
+        self.firmware = None
+        if calibrationStore is None:
+            calibrationStore = calibration.calibrationStore
+        self.calibrationStore = calibrationStore
         # initialise serial
         sd.SerialDevice.__init__(
             self, port=port, baudrate=baudrate,
@@ -528,26 +1546,27 @@ class TPad(sd.SerialDevice):
         )
         # reset timer
         self.resetTimer()
+        # start reading in the background, if requested
+        if threaded:
+            self.startReader(bufferSize=bufferSize)
 
     @staticmethod
-    def getAvailableDevices():
-        import serial.tools.list_ports
-
-        profiles = []
-
-        # iterate through serial devices via pyserial
-        for device in serial.tools.list_ports.comports():
-            print(device.pid, device.vid)
-            # filter only for those which look like a tpad
-            if device.vid == 1027 and device.pid in (1000, 1001, 1002, 1003, 1004):
-                # construct profile
-                profiles.append({
-                    'deviceName': f"TPad@{device.device}",
-                    'deviceClass': "psychopy_bbtk.tpad.TPad",
-                    'port': device.device
-                })
-        
-        return profiles
+    def getAvailableDevices(refresh=False):
+        """
+        Get profiles of all connected TPads. Ports are listed via a cache (see
+        `psychopy_bbtk.discovery.portCache`), so calling this often is cheap.
+
+        Parameters
+        ----------
+        refresh : bool
+            If True, list ports again rather than using the cache
+
+        Returns
+        -------
+        list[dict]
+            Profile of each TPad
+        """
+        return getTPadProfiles(refresh=refresh)
 
     @classmethod
     def resolve(cls, requested):
@@ -602,65 +1621,551 @@ class TPad(sd.SerialDevice):
             node.addListener(listener)
     
     def sendMessage(self, message, autoLog=True):
-        # dispatch any messages on the buffer to completion before sending message
-        maxIter = 5
-        while maxIter >= 0 and (self.com.in_waiting or self._lastLine):
-            self.dispatchMessages()
-            self.pause()
-        
-        return sd.SerialDevice.sendMessage(self, message, autoLog)
+        """
+        Send a command to the TPad, first reading any messages already waiting (to be dispatched
+        on the next dispatch) so they aren't mistaken for its reply. This never waits for more
+        data to arrive and reads at most `maxDrainBytes`, so the time taken is small and
+        predictable even while events are streaming in data collection mode.
 
-    def dispatchMessages(self):
-        # do nothing if there's already a dispatch in progress
-        if self._dispatchInProgress:
+        Parameters
+        ----------
+        message : str, bytes, int, list or tuple
+            Command to send, converted to bytes as by `SerialDevice.sendMessage` (an int is a
+            single byte, a list or tuple is a sequence of bytes). An end-of-line is appended if
+            not present.
+        autoLog : bool
+            If True, the command sent will be logged at level DEBUG
+        """
+        with self._comLock:
+            # dispatch anything already buffered
+            self._drain(self.maxDrainBytes)
+            # convert to bytes with an end-of-line
+            if isinstance(message, str):
+                message = message.encode("utf-8")
+            if isinstance(message, int):
+                message = bytes(bytearray([message]))
+            if isinstance(message, (list, tuple)):
+                message = bytes(bytearray(message))
+            if not message.endswith(self.eol):
+                message += self.eol
+            # send (writing directly rather than via SerialDevice.sendMessage, which would discard
+            # anything which arrived since the drain)
+            self.com.write(message)
+            self.com.flush()
+        if autoLog:
+            logging.debug(f"Sent {self.name} message: {repr(message)}")
+
+    def _drain(self, maxBytes=None):
+        """
+        Dispatch whatever is already waiting on the serial port, in one bulk read, without
+        waiting for anything more to arrive.
+
+        Parameters
+        ----------
+        maxBytes : int or None
+            Maximum number of bytes to read, anything more is left for the next dispatch. None for
+            no limit.
+        """
+        if self.isReaderRunning:
+            # reader thread is already draining the port
             return
-        # mark that a dispatch has begun
-        self._dispatchInProgress = True
-        # get data from box
-        data = self.getResponse(length=-1, timeout=1/10000)
-        # handle line splicing
-        if data:
-            # split into lines
-            data = data.splitlines(keepends=True)
-            # prepend last unfinished line to first line of this dispatch
-            data[0] = self._lastLine + data[0]
-            # if last line wasn't finished, store it for next dispatch
-            if not data[-1].endswith("\r\n"):
-                self._lastLine = data.pop(-1)
-            else:
-                self._lastLine = ""
-        # parse lines
-        for line in data:
-            if re.match(messageFormat, line):
-                # if line fits format, split into attributes
-                device, state, channel, time = splitTPadMessage(line)
-                # integerise number
-                channel = int(channel)
-                # get time in s using defaultClock units
-                time = float(time) / 1000 + self._lastTimerReset
-                # store in array
-                parts = (device, state, channel, time)
-                # store message
-                self.messages[time] = line
-                # choose object to dispatch to
-                for node in self.nodes:
-                    # if device is A, dispatch only to buttons
-                    if device == "A" and not isinstance(node, TPadButtonGroup):
-                        continue
-                    # if device is C, dispatch only to sensors
-                    if device == "C" and not isinstance(node, TPadLightSensorGroup):
-                        continue
-                    # if device is M, dispatch only to voice keys
-                    if device == "M" and not isinstance(node, TPadSoundSensorGroup):
-                        continue
-                    # dispatch to node
-                    message = node.parseMessage(parts)
-                    node.receiveMessage(message)
+        with self._comLock:
+            nBytes = self.com.in_waiting
+            if maxBytes is not None:
+                nBytes = min(nBytes, maxBytes)
+            if not nBytes:
+                return
+            data = self.com.read(nBytes)
+            self._deferEvents(
+                self._parseData(data, received=self._clock.getTime(format=float))
+            )
+
+    def awaitResponse(self, multiline=False, timeout=None, expected=None):
+        with self._comLock:
+            if multiline:
+                return sd.SerialDevice.awaitResponse(self, multiline=multiline, timeout=timeout)
+            # wait for the first line which isn't an event, holding any events which arrive first
+            # for dispatch rather than mistaking them for the reply
+            if timeout is None:
+                timeout = 1
+            if isinstance(expected, str):
+                expected = expected.encode("utf-8")
+            resp = self._awaitReply(time.perf_counter_ns(), timeout, expected=expected)
+        if resp is None:
+            return None
+
+        return resp.decode("utf-8")
+
+    def dispatchMessages(self, blocking=True):
+        """
+        Read any messages from the TPad and dispatch them to nodes.
+
+        This is safe to call from several threads sharing one TPad: dispatches are serialised by
+        a lock, so each event is dispatched exactly once and in order. A dispatch which is
+        already in progress on the same thread (e.g. a node's callback calling
+        `dispatchMessages`) is never re-entered. If called while this thread has a command in
+        flight (e.g. from `setMode`), anything waiting on the port is read but left to be
+        dispatched later, as the dispatch lock is never waited for while holding the port.
+
+        Parameters
+        ----------
+        blocking : bool
+            If another thread is dispatching, wait for it to finish and then dispatch (True,
+            default), or return straight away without dispatching (False).
+
+        Returns
+        -------
+        bool
+            True if a dispatch ran, False if it was skipped because one was already in progress
+        """
+        stats = self.stats
+        ident = threading.get_ident()
+        # if this thread holds the port, only read from it (taking the dispatch lock here could
+        # deadlock with a dispatching thread whose node is waiting for the port)
+        if self._comLock.isHeld():
+            self._drain()
+            return False
+        # skip if this thread is already dispatching, or (if not blocking) any thread is
+        if self._dispatchOwner == ident or not self._dispatchLock.acquire(blocking):
+            if stats is not None:
+                stats.reentrancySkips += 1
+            return False
+        self._dispatchOwner = ident
+        try:
+            if stats is not None:
+                start = time.perf_counter_ns()
+            if self.isReaderRunning:
+                # if reading in a thread, just take whatever it's parsed since last dispatch
+                events = self._eventBuffer.popAll()
+            elif self._comLock.acquire(blocking=False):
+                # otherwise, take anything read by commands, then read from the port now
+                try:
+                    events = self._popDeferred()
+                    data = self.com.read(self.com.in_waiting)
+                    events += self._parseData(
+                        data, received=self._clock.getTime(format=float) if data else None
+                    )
+                finally:
+                    self._comLock.release()
             else:
-                logging.debug(f"Received unparsable message from TPad: {repr(line)}")
-        # mark that a dispatch has finished
-        self._dispatchInProgress = False
-    
+                # if another thread has a command in flight, leave the port alone (anything which
+                # arrives meanwhile is read by the command, and dispatched next time)
+                events = self._popDeferred()
+            # dispatch events
+            self._routeEvents(events)
+            if stats is not None:
+                stats.addDispatch(time.perf_counter_ns() - start)
+        finally:
+            # mark that a dispatch has finished, even if a node raised an error
+            self._dispatchOwner = None
+            self._dispatchLock.release()
+
+        return True
+
+    def tryDispatchMessages(self):
+        """
+        Dispatch messages only if no other thread is currently dispatching, returning straight
+        away otherwise. Equivalent to `dispatchMessages(blocking=False)`.
+
+        Returns
+        -------
+        bool
+            True if a dispatch ran, False if it was skipped because one was already in progress
+        """
+        return self.dispatchMessages(blocking=False)
+
+    def _parseData(self, data, received=None):
+        """
+        Parse raw data from the TPad, splicing it with any unfinished line from the last read.
+
+        Parameters
+        ----------
+        data : bytes
+            Data read from the serial port
+        received : float or None
+            Time (according to the clock last given to `resetTimer`) at which the data was read,
+            used to estimate drift between the TPad's clock and ours.
+
+        Returns
+        -------
+        list[tuple]
+            List of `(device, state, channel, time)` for each parsable line, with time in s
+            according to the clock last given to `resetTimer`
+        """
+        nRead = len(data)
+        # prepend last unfinished line to this read
+        if self._lastLine:
+            data = self._lastLine + data
+        # if last line wasn't finished, store it for next dispatch
+        end = data.rfind(b"\n") + 1
+        self._lastLine = data[end:]
+        # parse complete lines
+        messages = list(parseTPadBytes(data))
+        if self.stats is not None and nRead:
+            self.stats.addRead(
+                nRead, data.count(b"\n", 0, end), len(messages), partial=bool(self._lastLine)
+            )
+        if not messages:
+            return []
+        # convert any events timed before the last timer reset from the reset before
+        events = []
+        if self._lastEpoch is not None:
+            events = self._parseLastEpoch(messages, received)
+            messages = messages[len(events):]
+            if not messages:
+                return events
+        # the newest message in a read arrived most recently, so gives the tightest bound on drift
+        if received is not None:
+            self.clockSync.addSample(messages[-1][3] / 1000, received)
+        self._lastDeviceMs = messages[-1][3]
+        # get time in s using defaultClock units, correcting for drift
+        offset = self.clockSync.offset
+        scale = self.clockSync.scale / 1000
+
+        return events + [
+            (device, state, channel, ms * scale + offset)
+            for device, state, channel, ms in messages
+        ]
+
+    def _parseLastEpoch(self, messages, received):
+        """
+        Convert the first few messages in a read which were timed before the TPad's timer was
+        last reset, but arrived after its reply (e.g. the rest of a message which the reply cut
+        off). These are told apart from messages timed after the reset by the TPad's timer not
+        having gone back since them, and by their being in the future if timed from the reset.
+
+        Parameters
+        ----------
+        messages : list[tuple]
+            Messages parsed from the read, as `(device, state, channel, ms)`
+        received : float or None
+            Time at which the data was read, see `_parseData`
+
+        Returns
+        -------
+        list[tuple]
+            `(device, state, channel, time)` for each leading message which was timed before the
+            reset, with time in s
+        """
+        offset, scale, lastMs = self._lastEpoch
+        newOffset = self.clockSync.offset
+        newScale = self.clockSync.scale / 1000
+        events = []
+        for device, state, channel, ms in messages:
+            # once one message was timed after the reset, so were the rest
+            if ms < lastMs or received is None or ms * newScale + newOffset <= received:
+                self._lastEpoch = None
+                return events
+            events.append((device, state, channel, ms * scale + offset))
+            lastMs = ms
+        self._lastEpoch = (offset, scale, lastMs)
+
+        return events
+
+    def _routeEvents(self, events):
+        """
+        Store parsed messages and send them to any nodes which they're relevant to. Nodes which
+        can receive batches get all of a device's events from this dispatch as a single
+        `TPadEventBatch`.
+
+        Parameters
+        ----------
+        events : list[tuple]
+            Parsed messages, as `(device, state, channel, time)`
+        """
+        if not events:
+            return
+        if self.stats is not None:
+            self.stats.eventsRouted += len(events)
+        # copy to any taps
+        for tap in self._taps:
+            tap.extend(events)
+        # store messages and group by device
+        byDevice = {}
+        for parts in events:
+            device, state, channel, time = parts
+            self.messages.append(time, device, channel, state)
+            byDevice.setdefault(device, []).append(parts)
+        # dispatch to each node subscribed to each device
+        for device, group in byDevice.items():
+            nodes = self._routes.get(device, ())
+            if not nodes:
+                continue
+            batch = TPadEventBatch.fromEvents(device, group)
+            for node in nodes:
+                if isinstance(node, TPadBatchMixin):
+                    node.receiveBatch(batch)
+                else:
+                    for parts in group:
+                        node.receiveMessage(
+                            node.parseMessage(parts)
+                        )
+
+    def _deferEvents(self, events):
+        """
+        Hold events read while this thread has the port, to be dispatched later by
+        `dispatchMessages` (or, if reading in a thread, passed on by the reader thread).
+
+        Parameters
+        ----------
+        events : list[tuple]
+            Parsed messages, as `(device, state, channel, time)`
+        """
+        self._deferred.extend(events)
+
+    def _popDeferred(self):
+        """
+        Remove and return every event held by `_deferEvents`, oldest first.
+
+        Returns
+        -------
+        list[tuple]
+            Parsed messages, as `(device, state, channel, time)`
+        """
+        events = []
+        while self._deferred:
+            events.append(self._deferred.popleft())
+
+        return events
+
+    def addNode(self, node):
+        """
+        Attach a node (e.g. a TPadButtonGroup) to this TPad, so that it receives any messages
+        from the devices listed in its `deviceCodes`.
+
+        Parameters
+        ----------
+        node : TPadButtonGroup, TPadLightSensorGroup or TPadSoundSensorGroup
+            Node to attach
+        """
+        # compare by identity, as == on devices compares the physical device (which is the same
+        # for every node on this TPad)
+        if not any(other is node for other in self.nodes):
+            self.nodes.append(node)
+
+    def removeNode(self, node):
+        """
+        Detach a node from this TPad, so that it no longer receives messages.
+
+        Parameters
+        ----------
+        node : TPadButtonGroup, TPadLightSensorGroup or TPadSoundSensorGroup
+            Node to detach
+        """
+        self.nodes = [other for other in self.nodes if other is not node]
+
+    def addTap(self, capacity=4096, onPush=None):
+        """
+        Add a tap, which every event dispatched from now on is copied into (whichever thread
+        dispatches it), so events can be read alongside the nodes rather than instead of them.
+
+        Parameters
+        ----------
+        capacity : int
+            Maximum number of events for the tap to hold before new events are dropped
+        onPush : callable or None
+            Function to call (from the dispatching thread, with no arguments) each time events
+            are copied into the tap
+
+        Returns
+        -------
+        psychopy_bbtk.buffers.EventTap
+            The new tap, pop events from it as `(device, state, channel, time)`
+        """
+        tap = EventTap(capacity=capacity, onPush=onPush)
+        # replace rather than modify, so a dispatch in progress is never affected
+        self._taps = self._taps + (tap,)
+
+        return tap
+
+    def removeTap(self, tap):
+        """
+        Remove a tap added by `addTap`, so events are no longer copied into it.
+
+        Parameters
+        ----------
+        tap : psychopy_bbtk.buffers.EventTap
+            Tap to remove
+        """
+        self._taps = tuple(other for other in self._taps if other is not tap)
+
+    @property
+    def nodes(self):
+        """
+        Nodes attached to this TPad. Changing this list (or setting it) updates which nodes
+        messages are routed to.
+        """
+        return self._nodes
+
+    @nodes.setter
+    def nodes(self, value):
+        self._nodes = TPadNodeList(self, value)
+        self._rebuildRoutes()
+
+    def _rebuildRoutes(self):
+        """
+        Rebuild the table of which nodes each device code (see `channelCodes`) should be
+        dispatched to, so dispatch is a single lookup per message.
+        """
+        routes = {code: [] for code in channelCodes}
+        for node in self.nodes:
+            for code in getattr(node, "deviceCodes", ()):
+                routes[code].append(node)
+        # store as tuples so a dispatch in progress is never affected by a rebuild
+        self._routes = {code: tuple(nodes) for code, nodes in routes.items()}
+
+    @property
+    def isReaderRunning(self):
+        """
+        Is there a background thread currently reading from this TPad?
+        """
+        return self._reader is not None and self._reader.is_alive()
+
+    def startReader(self, bufferSize=4096, interval=1/1000, onRead=None, timeout=0.005):
+        """
+        Start a background thread which continuously reads from the TPad while it's in data
+        collection mode (mode 3), parsing events into a fixed-size ring buffer. While the reader
+        is running, `dispatchMessages` never touches the serial port, it only pops events which
+        have already been parsed - so serial I/O is kept off the render thread and events can't
+        pile up in the OS buffer during a long frame.
+
+        Parameters
+        ----------
+        bufferSize : int
+            Maximum number of parsed events to hold between dispatches. If the buffer fills up,
+            new events are dropped and a warning is logged on the next dispatch.
+        interval : float
+            How long (s) the reader thread should sleep while the TPad isn't in data collection
+            mode.
+        onRead : callable or None
+            Function to call (from the reader thread, with no arguments) each time new events
+            have been buffered, e.g. to wake up an event loop. Stored as `onRead`, so can be
+            changed while the reader is running.
+        timeout : float
+            Longest time (s) the reader thread blocks waiting for data before checking whether
+            it's been stopped. Reads return as soon as data arrives, so this doesn't add latency,
+            but a command sent from another thread may wait this long for the port.
+        """
+        if onRead is not None:
+            self.onRead = onRead
+        # do nothing if already running
+        if self.isReaderRunning:
+            return
+        # make buffer
+        self._eventBuffer = EventRingBuffer(capacity=bufferSize)
+        # make and start thread
+        self._readerStop.clear()
+        self._reader = threading.Thread(
+            target=self._readerLoop,
+            args=(interval, timeout),
+            name=f"TPadReader@{self.portString}",
+            daemon=True
+        )
+        self._reader.start()
+
+    def stopReader(self, timeout=1):
+        """
+        Stop the background reader thread (if running) and dispatch anything it had already
+        parsed.
+
+        Parameters
+        ----------
+        timeout : float
+            How long (s) to wait for the thread to finish.
+
+        Returns
+        -------
+        bool
+            True if the reader thread has stopped (or wasn't running), False if it's still
+            running after the timeout
+        """
+        if self._reader is None:
+            return True
+        # hold the dispatch lock throughout, so no other thread pops the buffer while it's
+        # emptied (or reads the port before it's emptied)
+        ident = threading.get_ident()
+        dispatching = self._dispatchOwner == ident
+        if not dispatching:
+            self._dispatchLock.acquire()
+            self._dispatchOwner = ident
+        try:
+            # tell thread to stop and wait for it
+            self._readerStop.set()
+            self._reader.join(timeout=timeout)
+            # if it didn't finish, keep hold of it so it can still be stopped later
+            if self._reader.is_alive():
+                logging.warning(
+                    f"TPad reader thread on {self.portString} didn't stop within {timeout}s."
+                )
+                return False
+            # dispatch anything left in the buffer (and anything read by commands since)
+            events = self._eventBuffer.popAll() + self._popDeferred()
+            self._reader = None
+            self._routeEvents(events)
+        finally:
+            if not dispatching:
+                self._dispatchOwner = None
+                self._dispatchLock.release()
+
+        return True
+
+    def _readerLoop(self, interval, timeout):
+        """
+        Body of the background reader thread, see `startReader`.
+        """
+        lastDropped = 0
+        while not self._readerStop.is_set():
+            # let any thread waiting to send a command have the port first
+            if self._comLock.waiting:
+                time.sleep(0)
+                continue
+            data = None
+            # only read in data collection mode, and never while a command is in flight (parsing
+            # too, as commands may finish off a partial line)
+            with self._comLock:
+                # pass on anything read by commands, before anything read after them
+                for evt in self._popDeferred():
+                    self._eventBuffer.push(evt)
+                if self._mode == 3:
+                    # block until something arrives (or the timeout is hit), then take everything
+                    # that's waiting
+                    lastTimeout = self.com.timeout
+                    self.com.timeout = timeout
+                    try:
+                        data = self.com.read(max(self.com.in_waiting, 1))
+                        if data and self.com.in_waiting:
+                            data += self.com.read(self.com.in_waiting)
+                    finally:
+                        self.com.timeout = lastTimeout
+                    if data:
+                        events = self._parseData(data, received=self._clock.getTime(format=float))
+            # if not collecting data, sleep
+            if data is None:
+                self._readerStop.wait(interval)
+                continue
+            # if nothing arrived before the timeout, go round again
+            if not data:
+                continue
+            # store events
+            for evt in events:
+                self._eventBuffer.push(evt)
+            # notify
+            if events and self.onRead is not None:
+                self.onRead()
+            # warn if events were dropped
+            if self._eventBuffer.dropped > lastDropped:
+                logging.warning(
+                    f"TPad reader buffer on {self.portString} was full, dropped "
+                    f"{self._eventBuffer.dropped - lastDropped} event(s). Consider dispatching "
+                    f"more often or increasing bufferSize."
+                )
+                lastDropped = self._eventBuffer.dropped
+
+    def close(self):
+        # stop reading before the port closes
+        self.stopReader()
+        sd.SerialDevice.close(self)
+
     def hasUnfinishedMessage(self):
         """
         We don't wait for an end-of-line from the TPad device before continuing, as 
@@ -687,9 +2192,16 @@ class TPad(sd.SerialDevice):
         return bool(self._lastLine)
 
     @staticmethod
-    def _detectComPort():
+    def _detectComPort(refresh=False):
+        # error if there's no ftdi driver
+        if not checkDriver():
+            raise ModuleNotFoundError(
+                "Could not connect to BBTK device as your computer is missing a necessary "
+                "hardware driver. You should be able to find the correct driver for your operating "
+                "system here: https://ftdichip.com/drivers/vcp-drivers/"
+            )
         # find available devices
-        available = TPad.getAvailableDevices()
+        available = TPad.getAvailableDevices(refresh=refresh)
         # get all available ports
         return [profile['port'] for profile in available]
 
@@ -701,21 +2213,97 @@ class TPad(sd.SerialDevice):
         # skip if already in desired mode
         if self._mode == mode:
             return
-        # store requested mode
-        self._mode = mode
-        # exit out of whatever mode we're in (effectively set it to 0)
-        self.com.write(b"X")
-        self.awaitResponse(timeout=0.1)
-        if mode > 0:
-            # set mode
-            self.sendMessage(f"MOD{mode}")
+        with self._comLock:
+            # store requested mode
+            self._mode = mode
+            # exit out of whatever mode we're in (effectively set it to 0)
+            self.com.write(b"X")
             self.awaitResponse(timeout=0.1)
+            if mode > 0:
+                # set mode
+                self.sendMessage(f"MOD{mode}")
+                self.awaitResponse(timeout=0.1)
+
+    @contextlib.contextmanager
+    def commandSession(self):
+        """
+        Context manager which puts the TPad in command mode (mode 0) once for a group of
+        commands, rather than switching mode for each one. Any `setMode` calls inside the session
+        (e.g. from `_setThreshold`) have no effect, and the TPad is returned to the mode it was in
+        before when the session ends. Sessions can be nested, in which case the innermost one
+        shares the outermost one.
+
+        Usage
+        -----
+        ```
+        with myTPad.commandSession() as session:
+            opto1 = session.send("AAO1 128")
+            opto2 = session.send("AAO2 128")
+            session.flush(settle=0.1)
+        print(opto1.measurement, opto2.measurement)
+        ```
+
+        Yields
+        ------
+        TPadCommandSession
+            Session to send commands through. Any commands not flushed by the end of the session
+            are flushed on exit.
+        """
+        with self._comLock:
+            # if already in a session, share it
+            if self._session is not None:
+                yield self._session
+                return
+            # enter command mode, and start session
+            with self.inMode(0):
+                session = self._session = TPadCommandSession(self)
+                try:
+                    yield session
+                    session.flush()
+                finally:
+                    self._session = None
+
+    @contextlib.contextmanager
+    def inMode(self, mode):
+        """
+        Context manager which puts the TPad in a given mode and locks it there, so any `setMode`
+        calls inside (e.g. from nodes setting thresholds) have no effect. On exit, the TPad goes
+        back to the mode it was in before (only switching if that was a different mode) and the
+        lock is returned to how it was, so an outer `lockMode` or `inMode` still holds. Blocks
+        use of the serial port by other threads while inside.
+
+        Parameters
+        ----------
+        mode : int
+            Mode to be in, see `setMode`
+
+        Yields
+        ------
+        TPad
+            This TPad
+        """
+        with self._comLock:
+            lastMode = self.getMode()
+            wasLocked = self._modeLock
+            # switch mode, overriding any lock
+            self._modeLock = False
+            self.setMode(mode)
+            self._modeLock = True
+            try:
+                yield self
+            finally:
+                # return to previous mode and lock state
+                self._modeLock = False
+                if lastMode is not None:
+                    self.setMode(lastMode)
+                self._modeLock = wasLocked
 
     def getMode(self):
         if self._mode is None:
             # if mode not set before, get it from device
-            self.com.write(b"Z")
-            resp = self.awaitResponse(timeout=0.1)
+            with self._comLock:
+                self.com.write(b"Z")
+                resp = self.awaitResponse(timeout=0.1)
             # try to get mode from response
             try:
                 self._mode = int(resp.strip())
@@ -765,52 +2353,86 @@ class TPad(sd.SerialDevice):
         logging.info(
             f"TPad device on {self.portString} is awake, it reports its firmware version as: {resp}"
         )
+        # store firmware version, to tell this TPad apart from others on the same port
+        if resp:
+            self.firmware = " ".join(line.strip() for line in resp if line.strip())
 
         return bool(resp)
 
-    def checkSpeed(self, target=5/1000):
+    def getIdentity(self):
+        """
+        Get a string identifying this TPad, from its port and its firmware version (so that a
+        different TPad plugged into the same port isn't mistaken for this one).
+
+        Returns
+        -------
+        str
+            Identity of this TPad
+        """
+        if self.firmware is None:
+            # if not known yet (e.g. if made with checkAwake=False), ask the TPad
+            self.isAwake()
+
+        return f"{self.portString}|{self.firmware}"
+
+    def getCalibration(self, node):
+        """
+        Get the stored calibration of one of this TPad's sensor groups, see
+        `psychopy_bbtk.calibration.CalibrationStore`.
+
+        Parameters
+        ----------
+        node : str
+            Name of the sensor group, e.g. `TPadLightSensorGroup`
+
+        Returns
+        -------
+        dict
+            Stored values (empty if there are none)
+        """
+        return self.calibrationStore.get(self.getIdentity(), node)
+
+    def saveCalibration(self, node, values):
+        """
+        Store values in the calibration of one of this TPad's sensor groups, see
+        `psychopy_bbtk.calibration.CalibrationStore`.
+
+        Parameters
+        ----------
+        node : str
+            Name of the sensor group, e.g. `TPadLightSensorGroup`
+        values : dict
+            Values to store
+        """
+        self.calibrationStore.update(self.getIdentity(), node, values)
+
+    def checkSpeed(self, target=5/1000, nSamples=25):
         """
         Parameters
         ----------
         target : float
             Target time (s) which a single request should take to return.
+        nSamples : int
+            How many requests to time.
 
         Returns
         -------
         bool
             True if average time to return was less than the target time
-        float
-            Average time taken to return
+        float or None
+            Average time taken to return, or None if the TPad never responded
         """
-        import time
-        # enter command mode
-        self.setMode(0)
-        # repeat 25 times...
-        times = []
-        for n in range(25):
-            # start timing
-            start = time.time()
-            # send commands
-            self.sendMessage("FIRM")
-            # what did we get?
-            resp = self.awaitResponse()
-            # how long did it take?
-            dur = time.time() - start
-            # if we got a response, store how long
-            if resp is not None:
-                times.append(dur)
-            else:
-                # print warning that we got no response
-                logging.warn(
-                    f"Repeatedly sent `FIRM` to TPad and got no response on attempt {n+1}. "
-                )
-            # give the box time to rest
-            time.sleep(0.01)
-        # average times
-        avg = sum(times) / len(times)
+        # time FIRM requests in command mode
+        profile = self.profileLatency(nSamples=nSamples, command="FIRM", mode=0)
+        avg = profile.mean
         # return to data mode
         self.setMode(3)
-        self.awaitResponse()
+        # if we never got a response, we can't be below the target
+        if avg is None:
+            logging.warn(
+                f"Sent `FIRM` to TPad {nSamples} times and never got a response."
+            )
+            return False, None
         # are we below the target?
         valid = avg <= target
         # warn if we are
@@ -822,15 +2444,293 @@ class TPad(sd.SerialDevice):
 
         return valid, avg
 
+    def profileLatency(self, nSamples=100, command=None, mode=0, interval=0.01, timeout=0.1,
+                       quiet=0.01):
+        """
+        Measure the distribution of round trip times from sending a command to the TPad to
+        receiving its reply, using `time.perf_counter_ns`.
+
+        Parameters
+        ----------
+        nSamples : int
+            How many times to send the command.
+        command : str or None
+            Command to send. If None, uses `FIRM` in mode 0 or `Z` (report mode) in mode 3. `R`
+            can be profiled in mode 3, but resets the TPad's timer on every attempt (the resets
+            are recorded as usual so event times remain correct).
+        mode : int or None
+            Mode to profile in: 0 for command mode, 3 to profile in-band during data collection
+            (any events which arrive while waiting for a reply are dispatched as normal, on the
+            next dispatch). None to stay in the current mode.
+        interval : float
+            Time (s) to rest between attempts.
+        timeout : float
+            Time (s) after which to give up waiting for a reply.
+        quiet : float
+            Once the first line of a reply has arrived (which is what's timed), the rest of the
+            reply is read until nothing more arrives for this long (s), so that replies over
+            several lines (e.g. to `FIRM`) aren't mistaken for the reply to the next attempt.
+
+        Returns
+        -------
+        psychopy_bbtk.profiling.LatencyProfile
+            Round trip times, with methods to summarise them and export them as JSON.
+        """
+        # switch to the requested mode, remembering the current one
+        lastMode = self.getMode()
+        if mode is None:
+            mode = lastMode
+        self.setMode(mode)
+        # choose a default command for this mode
+        if command is None:
+            command = "Z" if mode == 3 else "FIRM"
+        message = command.encode("utf-8")
+        # Z is sent as a single character (as in `getMode`), anything else needs an end-of-line
+        if command != "Z" and not message.endswith(self.eol):
+            message += self.eol
+
+        samples = []
+        failures = 0
+        with self._comLock:
+            # make sure nothing already waiting is mistaken for a reply
+            self.dispatchMessages()
+            for n in range(nSamples):
+                # send and time
+                start = time.perf_counter_ns()
+                self.com.write(message)
+                sent = self._clock.getTime(format=float)
+                reply = self._awaitReply(
+                    start, timeout, expected=message.strip() if command == "R" else None
+                )
+                dur = time.perf_counter_ns() - start
+                if reply is None:
+                    failures += 1
+                else:
+                    samples.append(dur)
+                    # read the rest of the reply before sending again
+                    self._awaitReplyEnd(quiet)
+                    # if this reset the timer, record when
+                    if command == "R":
+                        self._applyTimerReset(sent, roundTrip=dur / 1e9)
+                # give the box time to rest
+                time.sleep(interval)
+        # warn about any failures
+        if failures:
+            logging.warn(
+                f"Sent `{command}` to TPad {nSamples} times and got no response on {failures} "
+                f"attempt(s)."
+            )
+        # go back to the mode we were in
+        self.setMode(lastMode)
+
+        return LatencyProfile(
+            samples, command=command, mode=mode, failures=failures, port=self.portString
+        )
+
+    def _awaitReply(self, start, timeout, expected=None):
+        """
+        Wait for a reply to a command, holding any events which arrive in the meantime for the
+        next dispatch.
+
+        Parameters
+        ----------
+        start : int
+            Value of `time.perf_counter_ns` when the command was sent
+        timeout : float
+            Time (s) after which to give up waiting
+        expected : bytes or None
+            Reply expected (if known), so it can be found even if sent partway through a message
+
+        Returns
+        -------
+        bytes or None
+            The first line received which isn't an event, or None if timed out
+        """
+        while True:
+            remaining = timeout - (time.perf_counter_ns() - start) / 1e9
+            if remaining <= 0:
+                return None
+            # block until a whole line arrives (or the timeout is hit)
+            self.com.timeout = remaining
+            line = self.com.read_until(self.eol)
+            if not line.endswith(self.eol):
+                # in data collection mode, keep anything partial so the event isn't lost
+                if self._mode == 3:
+                    self._lastLine += line
+                return None
+            # if this line was an event, go round again
+            reply = self._takeReply(line, expected=expected)
+            if reply is None:
+                continue
+
+            return reply
+
+    def _awaitReplyEnd(self, quiet=0.01):
+        """
+        Read the rest of a reply which may run over several lines, after its first line has been
+        read by `_awaitReply`. Stops once nothing more arrives for `quiet` s or an event arrives
+        (events are held for the next dispatch).
+
+        Parameters
+        ----------
+        quiet : float
+            How long (s) to wait for each further line
+
+        Returns
+        -------
+        list[bytes]
+            Further lines of the reply
+        """
+        lines = []
+        while True:
+            self.com.timeout = quiet
+            line = self.com.read_until(self.eol)
+            if not line.endswith(self.eol):
+                # in data collection mode, keep anything partial so the event isn't lost
+                if self._mode == 3:
+                    self._lastLine += line
+                return lines
+            # an event means the reply is over, so stop
+            reply = self._takeReply(line)
+            if reply is None:
+                return lines
+            lines.append(reply)
+
+    def _takeReply(self, line, expected=None):
+        """
+        Sort a whole line read while waiting for a reply into either an event (held for
+        dispatch) or a reply. A reply can be sent partway through a message, with the rest of
+        the message following it, so if the expected reply is known then the start of a message
+        before it is kept to be finished by the next read.
+
+        Parameters
+        ----------
+        line : bytes
+            Line read from the serial port, ending in an end-of-line
+        expected : bytes or None
+            Reply expected (if known)
+
+        Returns
+        -------
+        bytes or None
+            The reply, or None if the line was an event
+        """
+        data = self._lastLine + line
+        # if the last read was cut off between "\r" and "\n", this line finishes it first
+        end = data.find(b"\n") + 1 - len(self._lastLine)
+        if 0 < end < len(line):
+            self._deferEvents(
+                self._parseData(line[:end], received=self._clock.getTime(format=float))
+            )
+            return self._takeReply(line[end:], expected=expected)
+        isEvent = messagePattern.match(data).group(1) is not None
+        # if the expected reply cut off a message, split it out of the message
+        body = data[:-len(self.eol)]
+        if not isEvent and expected and body.endswith(expected) and body != expected:
+            head = body[:-len(expected)]
+            cut = partialPattern.match(head)
+            if cut is not None and cut.end() == len(head):
+                self._lastLine = head
+                return expected + self.eol
+        # if this line finishes a partial message or is an event, hold it for dispatch
+        if self._lastLine or isEvent:
+            self._deferEvents(
+                self._parseData(line, received=self._clock.getTime(format=float))
+            )
+            return None
+
+        return line
+
     def resetTimer(self, clock=logging.defaultClock):
-        if self.getMode() == 3:
-            # if in mode 3, set using R so as not to disrupt data collection
-            self.sendMessage("R")
-        else:
-            # otherwise, switch to mode 0 and use REST
-            self.setMode(0)
-            self.sendMessage("REST")
-        # store time
-        self._lastTimerReset = clock.getTime(format=float)
-        # get returned val
-        self.awaitResponse(timeout=0.1)
+        with self._comLock:
+            if self.getMode() == 3:
+                # if in mode 3, set using R so as not to disrupt data collection
+                command = "R"
+            else:
+                # otherwise, switch to mode 0 and use REST
+                self.setMode(0)
+                command = "REST"
+            self.sendMessage(command)
+            # get time of reset
+            resetTime = clock.getTime(format=float)
+            # get returned val (any events before it were timed from the last reset, so are
+            # converted as such)
+            self.awaitResponse(timeout=0.1, expected=command)
+            # store time
+            self._clock = clock
+            self._applyTimerReset(resetTime, roundTrip=clock.getTime(format=float) - resetTime)
+
+    def _applyTimerReset(self, resetTime, roundTrip=None):
+        """
+        Convert events from now on as timed from a reset of the TPad's timer, once its reply
+        has been read (events which arrived before the reply are still converted as timed from
+        the reset before).
+
+        Parameters
+        ----------
+        resetTime : float
+            Time (according to the clock given to `resetTimer`) at which the timer was reset
+        roundTrip : float or None
+            Round trip time (s) of the reset command, see `ClockSync.reset`
+        """
+        # events timed before the reset can still arrive after its reply, so keep what's needed
+        # to convert them
+        if self._lastDeviceMs is not None:
+            self._lastEpoch = (
+                self.clockSync.offset, self.clockSync.scale / 1000, self._lastDeviceMs
+            )
+        self._lastDeviceMs = None
+        self._lastTimerReset = resetTime
+        # start a new drift estimate from this reset
+        self.clockSync.reset(anchor=resetTime, roundTrip=roundTrip)
+
+    def getStats(self):
+        """
+        Get counters and histograms describing the work done reading and dispatching messages
+        since stats collection was enabled (with `collectStats=True` or `enableStats`).
+
+        Returns
+        -------
+        dict or None
+            See `psychopy_bbtk.profiling.DispatchStats.getStats`, plus `dropped` (events dropped
+            by the reader thread because its buffer was full). None if stats aren't being
+            collected.
+        """
+        if self.stats is None:
+            return None
+        stats = self.stats.getStats()
+        stats['dropped'] = self._eventBuffer.dropped if self._eventBuffer is not None else 0
+
+        return stats
+
+    def enableStats(self, reset=False):
+        """
+        Start collecting stats on the work done reading and dispatching messages, see `getStats`.
+
+        Parameters
+        ----------
+        reset : bool
+            If stats are already being collected, whether to set them back to zero
+        """
+        if self.stats is None:
+            self.stats = DispatchStats()
+        elif reset:
+            self.stats.reset()
+
+    def disableStats(self):
+        """
+        Stop collecting stats on the work done reading and dispatching messages.
+        """
+        self.stats = None
+
+    def getClockSync(self):
+        """
+        Get the current estimate of drift between this TPad's clock and the clock given to
+        `resetTimer`, for quality assurance.
+
+        Returns
+        -------
+        dict
+            See `psychopy_bbtk.clocksync.ClockSync.getFit`
+        """
+        return self.clockSync.getFit()
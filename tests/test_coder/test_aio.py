@@ -0,0 +1,98 @@
+import asyncio
+import sys
+import threading
+
+import numpy as np
+import pytest
+
+from psychopy_bbtk.aio import AsyncBlackBoxToolkit, AsyncTPad
+from psychopy_bbtk.emulator import EmulatedTPad, TPadEmulator, makeDumpBBTK, makeDumpBytes
+from psychopy_bbtk.tpad import TPadButtonGroup
+
+
+class TestAsyncBlackBoxToolkit:
+    def test_iter_events(self):
+        """
+        Test that iterating asynchronously gives the same events as getEvents
+        """
+        data = makeDumpBytes(500)
+        expected = makeDumpBBTK(data).getEvents(asArray=True)
+
+        async def _collect():
+            async with AsyncBlackBoxToolkit(makeDumpBBTK(data)) as bbtk:
+                return [chunk async for chunk in bbtk.iterEvents(chunkSize=100)]
+
+        assert np.array_equal(np.concatenate(asyncio.run(_collect())), expected)
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="TPadEmulator needs a pseudo-terminal")
+class TestAsyncTPad:
+    def test_concurrent(self):
+        """
+        Test that events from two TPads can be awaited concurrently from one event loop
+        """
+        async def _collect(emulator, nEvents):
+            async with AsyncTPad(EmulatedTPad(port=emulator.port)) as pad:
+                buttons = await pad.makeNode(TPadButtonGroup, channels=10)
+                await pad.resetTimer()
+                emulator.startStream(rate=5000, channels=(1, 2), burst=4, nEvents=nEvents)
+                events = []
+                while len(events) < nEvents:
+                    new = await pad.events(timeout=2)
+                    assert new, "Timed out waiting for events"
+                    events += new
+                # nodes should have received the same events
+                assert len(buttons.responses) == nEvents
+                # should time out cleanly when nothing more arrives
+                assert await pad.events(timeout=0.05) == []
+                return events
+
+        async def _main():
+            return await asyncio.gather(_collect(emulators[0], 500), _collect(emulators[1], 800))
+
+        emulators = [TPadEmulator(), TPadEmulator()]
+        try:
+            eventsA, eventsB = asyncio.run(_main())
+        finally:
+            for emulator in emulators:
+                emulator.close()
+        assert len(eventsA) == 500
+        assert len(eventsB) == 800
+        assert all(evt.device == "A" for evt in eventsA + eventsB)
+
+    def test_other_dispatch(self):
+        """
+        Test that events dispatched by another thread (e.g. polling a node) are still returned
+        """
+        async def _collect(nEvents):
+            async with AsyncTPad(EmulatedTPad(port=emulator.port)) as pad:
+                buttons = await pad.makeNode(TPadButtonGroup, channels=10)
+                await pad.resetTimer()
+                stop = threading.Event()
+
+                def _poll():
+                    while not stop.is_set():
+                        buttons.dispatchMessages()
+                        stop.wait(0.001)
+
+                poller = threading.Thread(target=_poll)
+                poller.start()
+                try:
+                    emulator.startStream(rate=2000, channels=(1, 2), nEvents=nEvents)
+                    events = []
+                    while len(events) < nEvents:
+                        new = await pad.events(timeout=2)
+                        assert new, "Timed out waiting for events"
+                        events += new
+                finally:
+                    stop.set()
+                    poller.join()
+                assert len(buttons.responses) == nEvents
+                return events
+
+        emulator = TPadEmulator()
+        try:
+            events = asyncio.run(_collect(400))
+        finally:
+            emulator.close()
+        assert len(events) == 400
@@ -0,0 +1,88 @@
+import numpy as np
+
+from psychopy_bbtk import decodeEvents, eventsToDicts, evtChannels
+from psychopy_bbtk.emulator import makeDumpBBTK, makeDumpBytes
+
+
+def parseLegacy(data):
+    """
+    Line by line decoding, as done by BlackBoxToolkit.getEvents before it was vectorised
+    """
+    events = []
+    lastState = None
+    for line in data.splitlines(keepends=True):
+        state = line[:12]
+        timeSecs = int(line[-14:-2]) / 10.0**6
+        if lastState is None:
+            events.append({'evt': '', 'state': state, 'time': timeSecs})
+        else:
+            for n in evtChannels:
+                if state[n] != lastState[n]:
+                    if chr(state[n]) == '1':
+                        evt = evtChannels[n] + "_on"
+                    else:
+                        evt = evtChannels[n] + "_off"
+                    events.append({'evt': evt, 'state': state, 'time': timeSecs})
+        lastState = events[-1]['state']
+
+    return events
+
+
+class TestDecodeEvents:
+    def test_matches_legacy(self):
+        """
+        Test that vectorised decoding gives exactly the same events as the old line-by-line
+        decoding
+        """
+        data = makeDumpBytes(5000)
+        events, states, times = decodeEvents(data)
+        assert len(times) == 5000
+        assert len(events) == 4999
+        assert eventsToDicts(states, times) == parseLegacy(data)
+
+    def test_structured(self):
+        """
+        Test the fields of the structured array
+        """
+        data = (
+            b"000000000000,000000001000\r\n"
+            b"000000010000,000000002500\r\n"
+            b"000000010001,000000004000\r\n"
+            b"000000000001,000000005000\r\n"
+        )
+        events, states, times = decodeEvents(data)
+        assert events['time'].tolist() == [0.0025, 0.004, 0.005]
+        assert [evtChannels[ch] for ch in events['channel']] == ["Opto1", "Mic1", "Opto1"]
+        assert events['on'].tolist() == [True, True, False]
+
+    def test_empty(self):
+        """
+        Test that a dump with no data lines decodes to nothing
+        """
+        events, states, times = decodeEvents(b"")
+        assert len(events) == 0
+        assert eventsToDicts(states, times) == []
+
+
+class TestIterEvents:
+    def test_matches_getEvents(self):
+        """
+        Test that streaming events gives the same events as reading the whole dump, even when
+        lines are split between reads
+        """
+        data = makeDumpBytes(2000)
+        expected = makeDumpBBTK(data).getEvents()
+        assert list(makeDumpBBTK(data).iterEvents()) == expected
+        assert expected == parseLegacy(data)
+
+    def test_chunks(self):
+        """
+        Test that chunked streaming yields arrays of the requested size which join up to the
+        whole recording
+        """
+        data = makeDumpBytes(2000)
+        expected = makeDumpBBTK(data).getEvents(asArray=True)
+        chunks = list(makeDumpBBTK(data).iterEvents(chunkSize=256))
+        assert [len(chunk) for chunk in chunks[:-1]] == [256] * (len(chunks) - 1)
+        assert 0 < len(chunks[-1]) <= 256
+        assert np.array_equal(np.concatenate(chunks), expected)
@@ -0,0 +1,127 @@
+import threading
+
+from psychopy_bbtk.buffers import EventRingBuffer, EventStore, EventTap, TPadEvent
+
+
+class TestEventRingBuffer:
+    def test_fifo(self):
+        """
+        Test that items come out of the buffer in the order they went in, including after the
+        indices wrap around
+        """
+        buff = EventRingBuffer(capacity=4)
+        for n in range(10):
+            assert buff.push(n)
+            assert buff.pop() == n
+        assert buff.pop() is None
+        assert len(buff) == 0
+
+    def test_full(self):
+        """
+        Test that pushing to a full buffer drops the new item and counts it, rather than
+        overwriting unread items
+        """
+        buff = EventRingBuffer(capacity=3)
+        for n in range(5):
+            buff.push(n)
+        assert buff.dropped == 2
+        assert buff.popAll() == [0, 1, 2]
+        assert buff.popAll() == []
+
+    def test_threaded(self):
+        """
+        Test that every item pushed by a producer thread is popped exactly once, in order, by a
+        consumer
+        """
+        buff = EventRingBuffer(capacity=64)
+        nItems = 20000
+
+        def _produce():
+            n = 0
+            while n < nItems:
+                if buff.push(n):
+                    n += 1
+
+        producer = threading.Thread(target=_produce)
+        producer.start()
+        received = []
+        while len(received) < nItems:
+            received += buff.popAll()
+        producer.join()
+
+        assert received == list(range(nItems))
+
+
+class TestEventTap:
+    def test_extend(self):
+        """
+        Test that extending a tap pushes every item and calls onPush once, only if anything was
+        pushed
+        """
+        pushes = []
+        tap = EventTap(capacity=4, onPush=lambda: pushes.append(len(tap)))
+        tap.extend([])
+        assert pushes == []
+        tap.extend([0, 1, 2])
+        tap.extend([3, 4])
+        assert pushes == [3, 4]
+        assert tap.dropped == 1
+        assert tap.popAll() == [0, 1, 2, 3]
+
+
+class TestEventStore:
+    def test_simultaneous(self):
+        """
+        Test that events with the same timestamp are all kept
+        """
+        store = EventStore()
+        store.append(1.0, "A", 1, "P")
+        store.append(1.0, "C", 1, "P")
+        store.append(1.0, "A", 1, "R")
+        assert [evt.device for evt in store] == ["A", "C", "A"]
+        assert store[-1] == TPadEvent(1.0, "A", 1, "R")
+
+    def test_out_of_order(self):
+        """
+        Test that an event older than the newest stored event is inserted in time order
+        """
+        store = EventStore()
+        for t in (0.1, 0.3, 0.4):
+            store.append(t, "A", 1, "P")
+        store.append(0.2, "C", 2, "R")
+        assert [evt.t for evt in store] == [0.1, 0.2, 0.3, 0.4]
+        assert store[1] == TPadEvent(0.2, "C", 2, "R")
+
+    def test_capacity(self):
+        """
+        Test that the store never holds more than its capacity, evicting the oldest events first
+        """
+        store = EventStore(capacity=100)
+        for n in range(5000):
+            store.append(n / 1000, "A", 1, "P")
+        assert len(store) == 100
+        assert store.evicted == 4900
+        assert store[0].t == 4.9
+        # evicted events should be compacted out of the arrays
+        assert len(store._t) < 2000
+
+    def test_max_age(self):
+        """
+        Test that events older than maxAge (relative to the newest) are evicted
+        """
+        store = EventStore(maxAge=1.0)
+        for n in range(50):
+            store.append(n / 4, "M", 1, "P")
+        assert store[0].t == 11.25
+        assert store[-1].t == 12.25
+
+    def test_between(self):
+        """
+        Test that time range queries include the start and exclude the stop
+        """
+        store = EventStore()
+        for n in range(10):
+            store.append(float(n), "A", n, "P")
+        assert [evt.channel for evt in store.between(3, 6)] == [3, 4, 5]
+        assert [evt.channel for evt in store.between(stop=2)] == [0, 1]
+        assert list(store.getArrays(start=8)['channel']) == [8, 9]
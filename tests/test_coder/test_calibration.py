@@ -0,0 +1,311 @@
+import sys
+import threading
+import time
+
+import pytest
+
+from psychopy_bbtk.calibration import (
+    CalibrationStore, LevelSearch, ThresholdCache, calibrateOptos, findLevels, maxLevel,
+    verifyOptos
+)
+from psychopy_bbtk.emulator import EmulatedTPad, TPadEmulator
+from psychopy_bbtk.tpad import TPadLightSensorGroup, TPadSoundSensorGroup
+
+
+class FakeProber:
+    """
+    Prober for sensors with fixed levels, which counts how many rounds of probes it's sent
+    """
+    def __init__(self, levels):
+        self.levels = levels
+        self.nProbes = 0
+
+    def probe(self, levels):
+        self.nProbes += 1
+        return {
+            channel: self.levels[channel] >= threshold for channel, threshold in levels.items()
+        }
+
+
+class TestLevelSearch:
+    @pytest.mark.parametrize("level", [-1, 0, 1, 63, 127, 128, 200, 254, maxLevel])
+    def test_bisect(self, level):
+        """
+        Test that a search without a guess finds any level within 9 probes
+        """
+        prober = FakeProber({0: level})
+        assert findLevels(prober, [0]) == {0: level}
+        assert prober.nProbes <= 9
+
+    @pytest.mark.parametrize("level,guess", [(100, 100), (100, 98), (100, 103), (0, 5), (250, 255)])
+    def test_guess(self, level, guess):
+        """
+        Test that a search starting from a good guess finds the level in a few probes
+        """
+        prober = FakeProber({0: level})
+        assert findLevels(prober, [0], guesses={0: guess}) == {0: level}
+        assert prober.nProbes <= 6
+
+    @pytest.mark.parametrize("level,guess", [(10, 240), (240, 10), (-1, 128)])
+    def test_bad_guess(self, level, guess):
+        """
+        Test that a search starting from a bad guess still finds the level
+        """
+        prober = FakeProber({0: level})
+        assert findLevels(prober, [0], guesses={0: guess}) == {0: level}
+
+    def test_interleaved(self):
+        """
+        Test that channels are searched together, so searching two takes no more rounds than
+        searching the slowest one
+        """
+        prober = FakeProber({0: 30, 1: 220})
+        assert findLevels(prober, [0, 1]) == {0: 30, 1: 220}
+        assert prober.nProbes <= 9
+
+    def test_search_state(self):
+        """
+        Test that a search is done once the level is bracketed
+        """
+        search = LevelSearch()
+        search.update(100, True)
+        search.update(101, False)
+        assert search.done
+        assert search.level == 100
+        assert search.nextThreshold() is None
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="TPadEmulator needs a pseudo-terminal")
+class TestCalibrateOptos:
+    def setup_method(self):
+        self.emulator = TPadEmulator(lightLevels={1: 0.0, 2: 0.0})
+        self.pad = EmulatedTPad(port=self.emulator.port)
+        self.pad.setMode(3)
+        # light levels each opto sees for each color (opto 3 is unplugged)
+        self.screen = {
+            'black': {1: 0.05, 2: 0.1, 3: 0.0},
+            'white': {1: 0.8, 2: 0.6, 3: 0.0},
+        }
+
+    def teardown_method(self):
+        self.pad.close()
+        self.emulator.close()
+
+    def present(self, color, delay=0):
+        def _show():
+            self.emulator.lightLevels.update(self.screen[color])
+        if delay:
+            threading.Timer(delay, _show).start()
+        else:
+            _show()
+
+    def test_calibrate(self):
+        """
+        Test that thresholds land between black and white in one session, leaving the TPad in
+        data collection mode
+        """
+        self.emulator.commands.clear()
+        thresholds = calibrateOptos(self.pad, [0, 1, 2], self.present, cache=ThresholdCache())
+        for channel in (0, 1):
+            black = self.screen['black'][channel + 1]
+            white = self.screen['white'][channel + 1]
+            assert black < thresholds[channel] < white
+        assert thresholds[2] is None
+        # only one trip into command mode and back
+        modes = [cmd for cmd in self.emulator.commands if cmd.startswith("MOD")]
+        assert modes == ["MOD3"]
+        assert self.emulator.mode == self.pad.getMode() == 3
+
+    def test_cache(self):
+        """
+        Test that recalibrating starts from the cached levels and takes fewer probes
+        """
+        cache = ThresholdCache()
+        calibrateOptos(self.pad, [0, 1], self.present, cache=cache)
+        self.emulator.commands.clear()
+        calibrateOptos(self.pad, [0, 1], self.present, cache=cache)
+        cachedProbes = sum(cmd.startswith("AAO") for cmd in self.emulator.commands)
+        self.emulator.commands.clear()
+        calibrateOptos(self.pad, [0, 1], self.present, cache=None)
+        fullProbes = sum(cmd.startswith("AAO") for cmd in self.emulator.commands)
+        assert cachedProbes < fullProbes
+        # cached under this port only
+        assert cache.get(self.pad.portString, "", 0) is not None
+        assert cache.get("COM99", "", 0) is None
+
+    def test_settle(self):
+        """
+        Test that recalibration waits for the optos to see a change of screen which takes a while
+        to show, and is still quick
+        """
+        cache = ThresholdCache()
+        calibrateOptos(self.pad, [0, 1], self.present, cache=cache)
+        start = time.perf_counter()
+        thresholds = calibrateOptos(
+            self.pad, [0, 1], lambda color: self.present(color, delay=0.03), cache=cache
+        )
+        assert time.perf_counter() - start < 1
+        assert self.screen['black'][1] < thresholds[0] < self.screen['white'][1]
+        assert self.screen['black'][2] < thresholds[1] < self.screen['white'][2]
+
+    def test_verify(self):
+        """
+        Test that good thresholds pass verification, and ones which don't separate black from
+        white fail it
+        """
+        thresholds = calibrateOptos(self.pad, [0, 1], self.present, cache=ThresholdCache())
+        assert verifyOptos(self.pad, thresholds, self.present)
+        # too high to see white
+        assert not verifyOptos(self.pad, {0: 0.9, 1: thresholds[1]}, self.present)
+        # too low to tell black apart
+        assert not verifyOptos(self.pad, {0: thresholds[0], 1: 0.01}, self.present)
+
+
+class TestCalibrationStore:
+    def test_roundtrip(self, tmp_path):
+        """
+        Test that stored calibrations are saved to disk and read back by a new store
+        """
+        filename = tmp_path / "calibrations.json"
+        store = CalibrationStore(filename)
+        store.update("COM3|TPad 1.0", "TPadLightSensorGroup", {'thresholds': {"": [0.3, None]}})
+        store.update("COM3|TPad 1.0", "TPadLightSensorGroup", {'pos': [0.9, -0.9]})
+        loaded = CalibrationStore(filename).get("COM3|TPad 1.0", "TPadLightSensorGroup")
+        assert loaded == {'thresholds': {"": [0.3, None]}, 'pos': [0.9, -0.9]}
+        # other rigs and sensor groups are separate
+        assert store.get("COM3|TPad 2.0", "TPadLightSensorGroup") == {}
+        assert store.get("COM3|TPad 1.0", "TPadSoundSensorGroup") == {}
+        # forget
+        store.remove("COM3|TPad 1.0")
+        assert CalibrationStore(filename).get("COM3|TPad 1.0", "TPadLightSensorGroup") == {}
+
+    def test_corrupt(self, tmp_path):
+        """
+        Test that an unreadable store is treated as empty rather than raising
+        """
+        filename = tmp_path / "calibrations.json"
+        filename.write_text("{not json")
+        store = CalibrationStore(filename)
+        assert store.get("COM3|TPad 1.0", "TPadLightSensorGroup") == {}
+        store.update("COM3|TPad 1.0", "TPadLightSensorGroup", {'pos': [0, 0]})
+        assert CalibrationStore(filename).get("COM3|TPad 1.0", "TPadLightSensorGroup")
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="TPadEmulator needs a pseudo-terminal")
+class TestStoredCalibration:
+    def setup_method(self):
+        self.emulator = TPadEmulator(
+            firmware="TPad emulator 2.1", lightLevels={1: 0.6, 2: 0.2}, soundLevels={1: 0.0}
+        )
+        self.pads = []
+
+    def teardown_method(self):
+        for pad in self.pads:
+            pad.close()
+        self.emulator.close()
+
+    def makePad(self, store):
+        pad = EmulatedTPad(port=self.emulator.port, calibrationStore=store)
+        self.pads.append(pad)
+        return pad
+
+    def test_identity(self, tmp_path):
+        """
+        Test that a TPad is identified by its port and firmware
+        """
+        pad = self.makePad(CalibrationStore(tmp_path / "calibrations.json"))
+        assert pad.getIdentity() == f"{self.emulator.port}|TPad emulator 2.1"
+
+    def test_load_thresholds(self, tmp_path):
+        """
+        Test that stored opto thresholds and position are used by a new sensor group, in one
+        round of commands
+        """
+        store = CalibrationStore(tmp_path / "calibrations.json")
+        pad = self.makePad(store)
+        pad.saveCalibration("TPadLightSensorGroup", {
+            'display': "0:800x600:",
+            'thresholds': {"0:800x600:": [0.4, 0.1]},
+            'pos': [0.9, -0.9], 'size': [0.1, 0.1], 'units': "norm",
+        })
+        self.emulator.commands.clear()
+        light = TPadLightSensorGroup(pad, channels=2)
+        assert light.getThreshold(0) == 0.4
+        assert light.getThreshold(1) == 0.1
+        assert list(light.pos) == [0.9, -0.9]
+        assert ["AAO1 102", "AAO2 26"] == [
+            cmd for cmd in self.emulator.commands if cmd in ("AAO1 102", "AAO2 26")
+        ]
+        # given thresholds override stored ones
+        pad.removeNode(light)
+        light = TPadLightSensorGroup(pad, channels=2, threshold=0.5)
+        assert light.getThreshold(0) == 0.5
+
+    def test_other_rig(self, tmp_path):
+        """
+        Test that thresholds stored for a TPad with other firmware on the same port aren't used
+        """
+        store = CalibrationStore(tmp_path / "calibrations.json")
+        store.update(f"{self.emulator.port}|TPad emulator 1.0", "TPadSoundSensorGroup", {
+            'thresholds': [0.3],
+        })
+        pad = self.makePad(store)
+        voice = TPadSoundSensorGroup(pad, channels=1)
+        assert voice.getThreshold(0) != 0.3
+
+    def playSound(self, monkeypatch, level=0.5):
+        """
+        Make test sounds raise the level heard by the emulated voice key while they play
+        """
+        emulator = self.emulator
+
+        class Sound:
+            def __init__(self, *args, **kwargs):
+                pass
+
+            def play(self):
+                emulator.soundLevels[1] = level
+
+            def stop(self):
+                emulator.soundLevels[1] = 0.0
+
+        monkeypatch.setattr("psychopy.sound.Sound", Sound)
+
+    def test_sound_threshold(self, tmp_path, monkeypatch):
+        """
+        Test that stored voice key thresholds which tell the test sound from silence are used
+        without calibrating again
+        """
+        self.playSound(monkeypatch)
+        store = CalibrationStore(tmp_path / "calibrations.json")
+        pad = self.makePad(store)
+        pad.saveCalibration("TPadSoundSensorGroup", {'thresholds': [0.3]})
+        voice = TPadSoundSensorGroup(pad, channels=1)
+        assert voice.getThreshold(0) == 0.3
+        # the stored threshold is good, so isn't calibrated again
+        assert voice.findThreshold(speaker=None) == [0.3]
+        assert self.emulator.mode == 3
+        assert self.emulator.soundLevels[1] == 0.0
+
+    def test_sound_threshold_too_high(self, tmp_path, monkeypatch):
+        """
+        Test that a stored voice key threshold which doesn't hear the test sound is calibrated
+        again, even though it passes in silence
+        """
+        self.playSound(monkeypatch)
+        calibrated = []
+
+        def _findThreshold(group, speaker, channel=None, samplingWindow=0.5):
+            calibrated.append(channel)
+            return 0.25
+
+        monkeypatch.setattr(
+            "psychopy_bbtk.tpad.BaseSoundSensorGroup.findThreshold", _findThreshold
+        )
+        store = CalibrationStore(tmp_path / "calibrations.json")
+        pad = self.makePad(store)
+        pad.saveCalibration("TPadSoundSensorGroup", {'thresholds': [0.9]})
+        voice = TPadSoundSensorGroup(pad, channels=1)
+        assert voice.findThreshold(speaker=None) == [0.25]
+        assert calibrated == [0]
+        assert pad.getCalibration("TPadSoundSensorGroup")['thresholds'] == [0.25]
@@ -0,0 +1,119 @@
+import random
+import sys
+import time
+
+import pytest
+
+from psychopy_bbtk.clocksync import ClockSync
+from psychopy_bbtk.emulator import EmulatedTPad, TPadEmulator
+from psychopy_bbtk.tpad import TPadButtonGroup
+
+
+class TestClockSync:
+    def simulate(self, sync, skew, duration=600, rate=50, seed=0):
+        """
+        Feed a ClockSync with messages from a TPad whose clock runs `skew` fast, which reach us
+        after a random latency of at least 1ms
+        """
+        rng = random.Random(seed)
+        t = 0
+        while t < duration:
+            t += rng.expovariate(rate)
+            deviceTime = t * (1 + skew)
+            latency = 0.001 + rng.expovariate(1 / 0.004)
+            sync.addSample(deviceTime, sync.anchor + t + latency)
+
+    def test_skew(self):
+        """
+        Test that a 100ppm skew is recovered to within a few ppm and used to convert times
+        """
+        sync = ClockSync()
+        sync.reset(anchor=10.0)
+        self.simulate(sync, skew=100e-6)
+        fit = sync.getFit()
+        # device clock runs fast, so the delay shrinks as device time goes on
+        assert abs(fit['skew'] - (-100e-6)) < 5e-6
+        assert abs(fit['latency'] - 0.001) < 0.0005
+        assert fit['jitter'] < 0.0005
+        # converting the device time for 500s should give close to 500s after the anchor
+        assert abs(sync.toHost(500 * (1 + 100e-6)) - 510.0) < 0.0025
+
+    def test_not_enough_data(self):
+        """
+        Test that no skew is applied until there are enough windows to trust the fit
+        """
+        sync = ClockSync(minPoints=10)
+        self.simulate(sync, skew=100e-6, duration=5)
+        assert sync.skew == 0
+        assert sync.toHost(1.0) == 1.0
+
+    def test_correct_off(self):
+        """
+        Test that the fit is made but not applied when correct is False
+        """
+        sync = ClockSync(correct=False)
+        self.simulate(sync, skew=100e-6)
+        assert sync.skew != 0
+        assert sync.scale == 1.0
+
+    def test_quality(self):
+        """
+        Test that a fit too uncertain to trust isn't applied, even with plenty of windows
+        """
+        sync = ClockSync(maxSkewError=5e-6)
+        # a message every few seconds, so each window's fastest arrival is just any arrival
+        self.simulate(sync, skew=100e-6, duration=60, rate=0.5)
+        fit = sync.getFit()
+        assert fit['nPoints'] >= sync.minPoints
+        assert fit['skewError'] > 5e-6
+        assert sync.skew == 0
+
+    def test_continuity(self):
+        """
+        Test that applying a new skew doesn't change the conversion of the newest time already
+        converted, so times carry on from it
+        """
+        sync = ClockSync(minPoints=10, maxSkew=1e-2, maxSkewError=1e-2)
+        sync.reset(anchor=10.0)
+        # one window short of applying the fit
+        self.simulate(sync, skew=100e-6, duration=9.5)
+        assert sync.skew == 0
+        last = sync._lastDeviceTime
+        before = sync.toHost(last)
+        # finish the last window, applying the fit
+        sync.addSample(10.01, sync.anchor + 10.01 + 0.001)
+        assert sync.skew != 0
+        assert sync.toHost(last) == pytest.approx(before, abs=1e-12)
+        assert sync.toHost(10.01) > before
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="TPadEmulator needs a pseudo-terminal")
+class TestTPadDrift:
+    def test_monotonic(self):
+        """
+        Test that event times from a drifting TPad never go backwards while skew corrections are
+        applied
+        """
+        emulator = TPadEmulator(skew=400e-6)
+        pad = EmulatedTPad(port=emulator.port, correctDrift=True)
+        try:
+            # fit over short windows, so corrections are applied during the test
+            pad.clockSync = ClockSync(window=0.05, minPoints=5, maxSkew=2e-3, maxSkewError=1e-3)
+            buttons = TPadButtonGroup(pad, channels=10)
+            pad.resetTimer()
+            skews = set()
+            emulator.startStream(rate=4000, channels=(1, 2), burst=4, splitProb=0.3, nEvents=8000)
+            while not emulator.awaitStream(timeout=0.001):
+                pad.dispatchMessages()
+                skews.add(pad.clockSync.skew)
+            time.sleep(0.05)
+            pad.dispatchMessages()
+            # skew was updated several times
+            assert len(skews) > 2
+            times = [resp.t for resp in buttons.responses]
+            assert len(times) == 8000
+            # (to within float rounding)
+            assert all(b >= a - 1e-9 for a, b in zip(times, times[1:]))
+        finally:
+            pad.close()
+            emulator.close()
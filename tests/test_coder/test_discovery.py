@@ -0,0 +1,87 @@
+import importlib.util
+import sys
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from psychopy_bbtk import discovery
+from psychopy_bbtk.discovery import PortCache, getTPadProfiles
+from psychopy_bbtk.emulator import TPadEmulator
+from psychopy_bbtk.tpad import TPad
+
+
+class ListPorts:
+    """
+    Port lister which counts how many times it's called
+    """
+    def __init__(self):
+        self.calls = 0
+
+        # ports currently "plugged in"
+        self.ports = []
+
+    def __call__(self):
+        self.calls += 1
+        return list(self.ports)
+
+
+class TestPortCache:
+    def test_ttl(self):
+        """
+        Test that ports are only listed again once the cache has expired
+        """
+        listPorts = ListPorts()
+        cache = PortCache(ttl=0.1, listPorts=listPorts)
+        for n in range(10):
+            cache.getPorts()
+        assert listPorts.calls == 1
+        time.sleep(0.15)
+        cache.getPorts()
+        assert listPorts.calls == 2
+
+    def test_invalidate(self):
+        """
+        Test that invalidating or refreshing lists ports again straight away
+        """
+        listPorts = ListPorts()
+        cache = PortCache(ttl=60, listPorts=listPorts)
+        cache.getPorts()
+        cache.invalidate()
+        cache.getPorts()
+        cache.getPorts(refresh=True)
+        assert listPorts.calls == 3
+
+    def test_watch(self):
+        """
+        Test that watching keeps the cache fresh in the background
+        """
+        if importlib.util.find_spec("pyudev") is not None:
+            pytest.skip("With pyudev installed, watching uses hotplug events rather than polling")
+        listPorts = ListPorts()
+        cache = PortCache(ttl=60, listPorts=listPorts)
+        cache.watch(interval=0.02)
+        try:
+            time.sleep(0.2)
+        finally:
+            cache.stopWatching()
+        assert listPorts.calls > 2
+
+    @pytest.mark.skipif(sys.platform == "win32", reason="TPadEmulator needs a pseudo-terminal")
+    def test_plugged_in(self, monkeypatch):
+        """
+        Test that a TPad plugged in since ports were cached is still found
+        """
+        listPorts = ListPorts()
+        monkeypatch.setattr(discovery, "portCache", PortCache(ttl=60, listPorts=listPorts))
+        monkeypatch.setattr("psychopy_bbtk.tpad.checkDriver", lambda: True)
+        # cache ports before the TPad is plugged in
+        assert getTPadProfiles() == []
+        emulator = TPadEmulator()
+        listPorts.ports.append(SimpleNamespace(vid=1027, pid=1000, device=emulator.port))
+        try:
+            pad = TPad(port=emulator.port)
+            pad.close()
+        finally:
+            emulator.close()
+        assert listPorts.calls == 2
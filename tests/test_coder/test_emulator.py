@@ -0,0 +1,440 @@
+import io
+import sys
+import threading
+import time
+
+import pytest
+from psychopy import logging
+
+from psychopy_bbtk.emulator import EmulatedTPad, TPadEmulator, makeEventBytes
+from psychopy_bbtk.tpad import (
+    TPadButtonGroup, TPadLightSensorGroup, TPadSoundSensorGroup, parseTPadBytes
+)
+
+pytestmark = pytest.mark.skipif(
+    sys.platform == "win32", reason="TPadEmulator needs a pseudo-terminal"
+)
+
+
+@pytest.fixture
+def emulator():
+    emulator = TPadEmulator(lightLevels={1: 0.6, 2: 0.2})
+    yield emulator
+    emulator.close()
+
+
+def awaitMessages(pad, n, timeout=5):
+    """
+    Dispatch until the pad has received `n` events or the timeout is hit
+    """
+    start = time.time()
+    while len(pad.messages) < n and time.time() - start < timeout:
+        pad.dispatchMessages()
+        time.sleep(0.001)
+
+    return len(pad.messages)
+
+
+class TestTPadEmulator:
+    def test_connect(self, emulator):
+        """
+        Test that a TPad can be made on an emulator, without any hardware or driver
+        """
+        pad = EmulatedTPad(port=emulator.port)
+        try:
+            assert pad.OK
+            assert pad.getMode() == 0
+            assert emulator.commands[:3] == ["X", "FIRM", "REST"]
+        finally:
+            pad.close()
+
+    def test_send_types(self, emulator):
+        """
+        Test that commands can be sent as an int or a list/tuple of bytes, as well as str/bytes
+        """
+        pad = EmulatedTPad(port=emulator.port)
+        try:
+            pad.sendMessage(ord("Z"))
+            assert pad.awaitResponse().strip() == "0"
+            pad.sendMessage(list(b"MOD3"))
+            assert pad.awaitResponse().strip() == "3"
+            pad.sendMessage(tuple(b"X"))
+            assert pad.awaitResponse().strip() == "0"
+            assert emulator.commands[-3:] == ["Z", "MOD3", "X"]
+        finally:
+            pad.close()
+
+    def test_make_events(self):
+        """
+        Test that generated events parse back as alternating presses and releases
+        """
+        events = list(parseTPadBytes(makeEventBytes(10, channels=(1,), rate=100)))
+        assert [evt[1] for evt in events] == ["P", "R"] * 5
+        assert [evt[3] for evt in events] == list(range(0, 100, 10))
+
+    def test_no_pty(self, monkeypatch):
+        """
+        Test that the emulator raises an ordinary OSError where there are no pseudo-terminals
+        """
+        monkeypatch.setattr("psychopy_bbtk.emulator.tty", None)
+        with pytest.raises(OSError, match="pseudo-terminal"):
+            TPadEmulator()
+
+    def test_routing(self, emulator):
+        """
+        Test that events from the emulator are routed to the right nodes, including when lines
+        are split between reads
+        """
+        pad = EmulatedTPad(port=emulator.port)
+        try:
+            buttons = TPadButtonGroup(pad, channels=10)
+            light = TPadLightSensorGroup(pad, channels=2)
+            emulator.startStream(
+                rate=5000, devices=("A", "C"), channels=(1, 2), burst=8, splitProb=0.5,
+                nEvents=2000, seed=0
+            )
+            assert awaitMessages(pad, 2000) == 2000
+            nButtons = sum(evt.device == "A" for evt in pad.messages)
+            assert len(buttons.responses) == nButtons
+            assert len(light.responses) == 2000 - nButtons
+            assert {resp.channel for resp in light.responses} == {0, 1}
+        finally:
+            pad.close()
+
+    def test_receipt(self, emulator, monkeypatch):
+        """
+        Test that responses built after the fact carry the threshold in force when their event
+        was received, and that muted nodes ignore events entirely
+        """
+        pad = EmulatedTPad(port=emulator.port)
+        try:
+            light = TPadLightSensorGroup(pad, channels=2, threshold=0.5)
+            emulator.emit("C", 1, True)
+            assert awaitMessages(pad, 1) == 1
+            # change threshold before responses are built
+            light.setThreshold(0.2, channel=0)
+            resp, = light.responses
+            assert resp.threshold == 0.5
+            # mute, as if PsychoPy weren't in focus
+            light.clearResponses()
+            light.muteOutsidePsychopy = True
+            monkeypatch.setattr("psychopy_bbtk.tpad.st.isRegisteredApp", lambda: False)
+            emulator.emit("C", 1, False)
+            assert awaitMessages(pad, 2) == 2
+            assert light.responses == []
+            assert light.state[0] is True
+        finally:
+            pad.close()
+
+    def test_receipt_log(self, emulator):
+        """
+        Test that a batch is logged as one summary, and that each event is only logged (in the
+        same format as unbatched responses) when logging at level DEBUG
+        """
+        pad = EmulatedTPad(port=emulator.port)
+        try:
+            buttons = TPadButtonGroup(pad, channels=10)
+            for level in (logging.EXP, logging.DEBUG):
+                buttons.clearResponses()
+                pad.messages.clear()
+                stream = io.StringIO()
+                target = logging.LogFile(stream, level=level)
+                try:
+                    emulator.emit("A", 1, True)
+                    emulator.emit("A", 2, True)
+                    assert awaitMessages(pad, 2) == 2
+                    logging.flush()
+                finally:
+                    logging.root.removeTarget(target)
+                lines = [line for line in stream.getvalue().splitlines() if "Device" in line]
+                assert sum("Device responses: " in line for line in lines) >= 1
+                perEvent = [line for line in lines if "Device response: " in line]
+                if level == logging.DEBUG:
+                    assert [line.split("\t")[-1] for line in perEvent] == [
+                        f"Device response: {resp}" for resp in buttons.responses
+                    ]
+                else:
+                    assert perEvent == []
+        finally:
+            pad.close()
+
+    def test_node_list(self, emulator):
+        """
+        Test that nodes added to or removed from `nodes` directly are routed accordingly, and
+        that closed nodes stop receiving events
+        """
+        pad = EmulatedTPad(port=emulator.port)
+        try:
+            buttons = TPadButtonGroup(pad, channels=10)
+            pad.nodes.clear()
+            emulator.emit("A", 1, True)
+            assert awaitMessages(pad, 1) == 1
+            assert buttons.responses == []
+            # add back directly
+            pad.nodes.append(buttons)
+            emulator.emit("A", 1, False)
+            assert awaitMessages(pad, 2) == 2
+            assert len(buttons.responses) == 1
+            # closed nodes are detached
+            buttons.close()
+            assert not any(node is buttons for node in pad.nodes)
+            emulator.emit("A", 1, True)
+            assert awaitMessages(pad, 3) == 3
+            assert len(buttons.responses) == 1
+        finally:
+            pad.close()
+
+    def test_reader_thread(self, emulator):
+        """
+        Test that a reader thread receives every event while the main thread isn't reading
+        """
+        pad = EmulatedTPad(port=emulator.port, threaded=True, bufferSize=8192)
+        try:
+            buttons = TPadButtonGroup(pad, channels=10)
+            emulator.startStream(rate=10000, channels=range(1, 10), burst=16, nEvents=5000)
+            assert emulator.awaitStream(timeout=5)
+            time.sleep(0.1)
+            pad.dispatchMessages()
+            assert len(buttons.responses) == 5000
+            assert pad._eventBuffer.dropped == 0
+        finally:
+            pad.close()
+
+    def test_stop_reader(self, emulator):
+        """
+        Test that a reader thread which doesn't stop in time is kept hold of, so it can still be
+        stopped later, and that commands get the port while it's reading
+        """
+        pad = EmulatedTPad(port=emulator.port, threaded=True)
+        try:
+            TPadButtonGroup(pad, channels=10)
+            # commands aren't starved of the port by the reader
+            start = time.perf_counter()
+            for n in range(10):
+                pad.resetTimer()
+            assert time.perf_counter() - start < 1
+            # hold the port so the reader can't finish
+            with pad._comLock:
+                time.sleep(0.05)
+                assert not pad.stopReader(timeout=0.05)
+                assert pad.isReaderRunning
+            assert pad.stopReader()
+            assert not pad.isReaderRunning
+        finally:
+            pad.close()
+
+    def test_light_threshold(self, emulator):
+        """
+        Test that setting an opto threshold reads back whether the light is above it, and
+        returns the TPad to data collection mode
+        """
+        pad = EmulatedTPad(port=emulator.port)
+        try:
+            light = TPadLightSensorGroup(pad, channels=2)
+            assert light._setThreshold(0.5, channel=0) is True
+            assert light._setThreshold(0.5, channel=1) is False
+            assert emulator.mode == pad.getMode() == 3
+        finally:
+            pad.close()
+
+    def test_sound_thresholds(self, emulator):
+        """
+        Test that thresholds on all voice keys are set in one trip to command mode, reading back
+        whether each is above its threshold
+        """
+        emulator.soundLevels.update({1: 0.4, 2: 0.4})
+        pad = EmulatedTPad(port=emulator.port)
+        try:
+            voice = TPadSoundSensorGroup(pad, channels=2)
+            emulator.commands.clear()
+            assert voice.setThresholds({0: 0.3, 1: 0.5}) == {0: True, 1: False}
+            assert emulator.commands == ["X", "AAVK1 76", "AAVK2 128", "X", "MOD3"]
+            assert voice.getThreshold(0) == 0.3
+            assert voice.getThreshold(1) == 0.5
+            # setting several via setThreshold takes the same path
+            emulator.commands.clear()
+            assert voice.setThreshold(0.35, channel=[0, 1]) == [True, True]
+            assert emulator.commands.count("MOD3") == 1
+        finally:
+            pad.close()
+
+    def test_mode_lock(self, emulator):
+        """
+        Test that setting thresholds inside a locked mode doesn't switch mode, and leaves the lock
+        in place
+        """
+        pad = EmulatedTPad(port=emulator.port)
+        try:
+            voice = TPadSoundSensorGroup(pad, channels=2)
+            with pad.inMode(0):
+                emulator.commands.clear()
+                voice.setThresholds({0: 0.3, 1: 0.5})
+                voice.setThreshold(0.2, channel=0)
+                pad.setMode(3)
+                assert not any(cmd.startswith("MOD") or cmd == "X" for cmd in emulator.commands)
+                assert emulator.mode == 0
+            assert emulator.mode == pad.getMode() == 3
+            # an outer lock still holds afterwards
+            pad.lockMode()
+            voice.setThresholds({0: 0.3})
+            pad.setMode(0)
+            assert emulator.mode == 3
+            pad.unlockMode()
+        finally:
+            pad.close()
+
+    def test_stats(self, emulator):
+        """
+        Test that dispatch stats count every byte, event and unparsable line
+        """
+        pad = EmulatedTPad(port=emulator.port, collectStats=True)
+        try:
+            TPadButtonGroup(pad, channels=10)
+            pad.stats.reset()
+            data = makeEventBytes(100, channels=(1, 2), seed=0)
+            # split a line across writes, and send a line which isn't a message
+            emulator.write(data[:15])
+            time.sleep(0.05)
+            pad.dispatchMessages()
+            emulator.write(data[15:] + b"nonsense\r\n")
+            assert awaitMessages(pad, 100) == 100
+            time.sleep(0.05)
+            pad.dispatchMessages()
+            stats = pad.getStats()
+            assert stats['bytesRead'] == len(data) + len(b"nonsense\r\n")
+            assert stats['linesParsed'] == stats['eventsRouted'] == 100
+            assert stats['unparsable'] == 1
+            assert stats['partialLines'] >= 1
+            assert sum(stats['dispatchHist'].values()) == stats['dispatches']
+        finally:
+            pad.close()
+
+    def test_concurrent_dispatch(self, emulator):
+        """
+        Test that two threads dispatching from one pad get every event exactly once, in order
+        """
+        pad = EmulatedTPad(port=emulator.port)
+        try:
+            buttons = TPadButtonGroup(pad, channels=10)
+            emulator.startStream(
+                rate=10000, channels=(1,), burst=8, splitProb=0.5, nEvents=4000, seed=0
+            )
+
+            def _dispatch():
+                awaitMessages(pad, 4000)
+
+            threads = [threading.Thread(target=_dispatch) for n in range(2)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            assert len(pad.messages) == 4000
+            # presses and releases on one channel should strictly alternate
+            assert [resp.value for resp in buttons.responses] == [True, False] * 2000
+            # a non-blocking dispatch should skip while another dispatch holds the lock
+            with pad._dispatchLock:
+                assert not pad.tryDispatchMessages()
+            assert pad.tryDispatchMessages()
+        finally:
+            pad.close()
+
+    def test_reset_while_streaming(self, emulator):
+        """
+        Test that resetting the timer during data collection doesn't give events which arrived
+        before the reset (including one cut off by the reply) times from after it
+        """
+        pad = EmulatedTPad(port=emulator.port)
+        clock = logging.defaultClock
+        try:
+            TPadButtonGroup(pad, channels=10)
+            # reply slowly, so events arrive while waiting for each reset's reply
+            emulator.replyDelay = 0.002
+            start = clock.getTime()
+            emulator.startStream(rate=5000, channels=(1, 2), burst=4, splitProb=0.5, nEvents=3000)
+            future = 0
+            for n in range(20):
+                time.sleep(0.01)
+                pad.resetTimer()
+                pad.dispatchMessages()
+                # no event can have happened after it was dispatched (give or take the time it
+                # takes the TPad to act on a reset)
+                if len(pad.messages) and pad.messages[-1].t > clock.getTime() + 0.001:
+                    future += 1
+            assert future == 0
+            assert awaitMessages(pad, 3000) == 3000
+            times = [evt.t for evt in pad.messages]
+            assert start - 0.001 <= min(times) and max(times) <= clock.getTime() + 0.001
+        finally:
+            pad.close()
+
+    def test_callback_error(self, emulator):
+        """
+        Test that an error raised by a node's callback doesn't stop later dispatches
+        """
+        pad = EmulatedTPad(port=emulator.port)
+        try:
+            buttons = TPadButtonGroup(pad, channels=10)
+
+            def _raise():
+                raise RuntimeError("Callback failed")
+
+            buttons.registerCallback(lambda resp: True, _raise)
+            emulator.emit("A", 1, state=True)
+            time.sleep(0.05)
+            with pytest.raises(RuntimeError):
+                pad.dispatchMessages()
+            buttons.clearCallbacks()
+            emulator.emit("A", 1, state=False)
+            time.sleep(0.05)
+            assert pad.dispatchMessages()
+            assert [resp.value for resp in buttons.responses] == [True, False]
+        finally:
+            pad.close()
+
+    def test_commands_while_streaming(self, emulator):
+        """
+        Test that sending commands during data collection doesn't lose any events
+        """
+        pad = EmulatedTPad(port=emulator.port)
+        try:
+            TPadButtonGroup(pad, channels=10)
+            emulator.startStream(rate=5000, channels=(1, 2), burst=4, splitProb=0.5, nEvents=3000)
+            for n in range(20):
+                pad.resetTimer()
+                time.sleep(0.01)
+            assert awaitMessages(pad, 3000) == 3000
+            assert emulator.commands.count("R") == 20
+        finally:
+            pad.close()
+
+    def test_callback_commands(self, emulator):
+        """
+        Test that a command sent during a dispatch (e.g. by a node's callback) doesn't deadlock
+        with another thread whose command is waiting for a reply while events arrive
+        """
+        pad = EmulatedTPad(port=emulator.port)
+        try:
+            TPadButtonGroup(pad, channels=10)
+            # reply slowly, so events arrive while commands are waiting for replies
+            emulator.replyDelay = 0.05
+            emulator.startStream(rate=2000, channels=(1, 2), burst=4, nEvents=1000)
+
+            def _dispatch():
+                # hold the dispatch lock as a dispatch would, then send a command from inside it
+                with pad._dispatchLock:
+                    time.sleep(0.02)
+                    pad.resetTimer()
+
+            threads = [
+                threading.Thread(target=target, daemon=True)
+                for target in (pad.resetTimer, _dispatch)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join(timeout=5)
+            assert not any(thread.is_alive() for thread in threads)
+            assert emulator.commands.count("R") == 2
+            assert awaitMessages(pad, 1000) == 1000
+        finally:
+            pad.close()
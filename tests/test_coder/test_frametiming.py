@@ -0,0 +1,166 @@
+import sys
+import time
+
+import numpy as np
+import pytest
+
+from psychopy_bbtk.emulator import EmulatedTPad, TPadEmulator
+from psychopy_bbtk.frametiming import analyseFrameTiming
+from psychopy_bbtk.tpad import TPadLightSensorGroup
+
+# refresh duration of the simulated display
+frameDur = 1 / 60
+
+
+def simulate(nFrames, latency=0.01, skip=(), hold=(), hide=()):
+    """
+    Simulate flips of an alternating light/dark patch and the edges an opto would see.
+
+    Parameters
+    ----------
+    nFrames : int
+        Number of frames to flip
+    latency : float
+        Time (s) from each flip to the opto seeing it
+    skip : list[int]
+        Frames whose flip comes a refresh late (dropped frames)
+    hold : list[int]
+        Frames which stay on screen for an extra refresh without their flips knowing
+        (duplicated frames)
+    hide : list[int]
+        Frames which never reach the screen (missed frames)
+    """
+    flips = []
+    onsets = []
+    t = 0
+    delay = 0
+    for i in range(nFrames):
+        if i in skip:
+            t += frameDur
+        flips.append(t)
+        onsets.append(t + latency + delay)
+        if i in hold:
+            delay += frameDur
+        t += frameDur
+    flips = np.array(flips)
+    # edges are alternately light and dark, except for hidden frames
+    expected = np.arange(nFrames) % 2 == 0
+    shown = np.ones(nFrames, dtype=bool)
+    shown[list(hide)] = False
+    # a hidden frame also means the frame after it isn't a change from what's on screen
+    for i in hide:
+        if i + 1 < nFrames:
+            shown[i + 1] = False
+
+    return flips, np.array(onsets)[shown], expected[shown]
+
+
+class TestAnalyseFrameTiming:
+    def test_clean(self):
+        """
+        Test that a run with no timing problems gives the right latency for every frame
+        """
+        flips, edges, values = simulate(600, latency=0.012)
+        report = analyseFrameTiming(flips, edges, values)
+        assert len(report) == 600
+        assert np.allclose(report.latency, 0.012)
+        stats = report.getStats()
+        assert (stats['nDropped'], stats['nMissed'], stats['nDuplicated']) == (0, 0, 0)
+        assert stats['latencyMean'] == pytest.approx(0.012)
+        assert stats['latencyStd'] == pytest.approx(0, abs=1e-9)
+        assert stats['frameDur'] == pytest.approx(frameDur)
+
+    def test_dropped(self):
+        """
+        Test that flips which came a refresh late are counted as dropped frames, without
+        affecting latency
+        """
+        flips, edges, values = simulate(100, skip=[10, 50])
+        report = analyseFrameTiming(flips, edges, values)
+        assert np.flatnonzero(report.dropped).tolist() == [10, 50]
+        assert report.getStats()['nDropped'] == 2
+        assert report.getStats()['nDuplicated'] == 0
+        assert np.allclose(report.latency, 0.01)
+
+    def test_duplicated(self):
+        """
+        Test that a frame held on screen for an extra refresh is marked as duplicated
+        """
+        flips, edges, values = simulate(100, hold=[20])
+        report = analyseFrameTiming(flips, edges, values)
+        assert np.flatnonzero(report.duplicated).tolist() == [20]
+        assert report.getStats()['nDropped'] == 0
+        # frames after it are seen a frame late
+        assert report.latency[21] == pytest.approx(0.01 + frameDur)
+
+    def test_missed(self):
+        """
+        Test that frames the opto never saw are marked as missed, and don't throw off the
+        matching of the frames after them
+        """
+        flips, edges, values = simulate(100, hide=[30])
+        report = analyseFrameTiming(flips, edges, values)
+        assert np.flatnonzero(report.missed).tolist() == [30, 31]
+        assert np.isnan(report.latency[30])
+        assert np.allclose(report.latency[32:], 0.01)
+        assert report.getStats()['nTransitions'] == 100
+
+    def test_expected(self):
+        """
+        Test that frames which don't change the patch aren't transitions, and those which do are
+        still matched
+        """
+        flips = np.arange(8) * frameDur
+        expected = [True, True, False, False, False, True, True, False]
+        edges = flips[[0, 2, 5, 7]] + 0.02
+        report = analyseFrameTiming(flips, edges, [True, False, True, False], expected=expected)
+        assert np.flatnonzero(report.isTransition).tolist() == [0, 2, 5, 7]
+        assert np.allclose(report.latency[[0, 2, 5, 7]], 0.02)
+        assert report.getStats()['nMissed'] == 0
+        with pytest.raises(ValueError):
+            analyseFrameTiming(flips, edges, [True, False, True, False], expected=[True])
+
+    def test_long_latency(self):
+        """
+        Test that displays with more than two frames of latency are matched correctly when given
+        a minimum latency
+        """
+        flips, edges, values = simulate(100, latency=0.05)
+        report = analyseFrameTiming(flips, edges, values, minLatency=0.04)
+        assert np.allclose(report.latency[3:], 0.05)
+
+    def test_empty(self):
+        """
+        Test that a run in which the opto saw nothing doesn't error
+        """
+        report = analyseFrameTiming(np.arange(10) * frameDur, [], [])
+        stats = report.getStats()
+        assert stats['nMissed'] == 10
+        assert stats['latencyMean'] is None
+        assert "no transitions" in repr(report)
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="TPadEmulator needs a pseudo-terminal")
+class TestLightSensorFrameTiming:
+    def test_frame_timing(self):
+        """
+        Test that opto edges received by a TPad are matched to flips on the same clock
+        """
+        emulator = TPadEmulator()
+        pad = EmulatedTPad(port=emulator.port)
+        try:
+            light = TPadLightSensorGroup(pad, channels=2, threshold=0.5)
+            # flips (relative to the TPad's timer), seen by opto 1 10ms later
+            times = np.arange(1, 21) * 0.05
+            for i, t in enumerate(times):
+                emulator.emit("C", 1, i % 2 == 0, t=t + 0.01)
+                # noise on the other opto
+                emulator.emit("C", 2, i % 2 == 0, t=t + 0.03)
+            time.sleep(0.1)
+            report = light.getFrameTiming(times + pad._lastTimerReset, channel=0)
+            stats = report.getStats()
+            assert stats['nMissed'] == 0
+            assert stats['latencyMean'] == pytest.approx(0.01, abs=0.002)
+        finally:
+            pad.close()
+            emulator.close()
@@ -0,0 +1,102 @@
+import json
+import subprocess
+import sys
+
+import pytest
+
+# modules which plugin discovery and Builder shouldn't need
+heavyModules = [
+    "ftd2xx",
+    "psychopy.hardware.serialdevice",
+    "psychopy.hardware.lightsensor",
+    "psychopy.hardware.soundsensor",
+    "psychopy.hardware.manager",
+    "psychopy_bbtk.tpad",
+]
+
+
+def checkImport(statement):
+    """
+    Run an import statement in a fresh interpreter, returning which of `heavyModules` it loaded
+    """
+    script = (
+        "import json, sys\n"
+        f"{statement}\n"
+        f"loaded = [name for name in {heavyModules!r} if name in sys.modules]\n"
+        "print(json.dumps({'loaded': loaded}))\n"
+    )
+    proc = subprocess.run(
+        [sys.executable, "-c", script], capture_output=True, text=True, timeout=120
+    )
+    assert proc.returncode == 0, proc.stderr
+    # PsychoPy may log to stdout too, so find the line with the result
+    line = next(line for line in proc.stdout.splitlines() if line.startswith('{"loaded"'))
+
+    return json.loads(line)['loaded']
+
+
+def measureImports(*modules):
+    """
+    Import some modules one after another in a fresh interpreter with `-X importtime`, returning
+    the cumulative time (us) taken by each. Each module's time excludes anything already imported
+    by the ones before it.
+    """
+    script = "".join(f"import {name}\n" for name in modules)
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", script],
+        capture_output=True, text=True, timeout=120
+    )
+    assert proc.returncode == 0, proc.stderr
+    # lines are "import time: <self> | <cumulative> | <indented module name>"
+    times = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line.split("|")
+        name = name.strip()
+        if name in modules and name not in times:
+            times[name] = int(cumulative)
+
+    return times
+
+
+class TestLazyImport:
+    def test_package(self):
+        """
+        Test that importing the package (as PsychoPy does to read plugin metadata) doesn't load
+        the hardware stack, which importing the TPad module does
+        """
+        assert checkImport("import psychopy_bbtk") == []
+        assert "psychopy_bbtk.tpad" in checkImport("import psychopy_bbtk.tpad")
+
+    def test_package_time(self):
+        """
+        Test that importing the package takes a small fraction of the time taken to import the
+        TPad module. Both are timed in the same interpreter, so the comparison holds however fast
+        the machine is. numpy is imported first, as both need it.
+        """
+        times = measureImports("numpy", "psychopy_bbtk", "psychopy_bbtk.tpad")
+        # about 1/30 when measured, against 1/10 when the package loaded the hardware stack
+        assert times["psychopy_bbtk"] < times["psychopy_bbtk.tpad"] / 20, times
+
+    def test_discovery(self):
+        """
+        Test that listing TPads (as Builder does for its port choices) doesn't load the hardware
+        stack
+        """
+        loaded = checkImport(
+            "from psychopy_bbtk.discovery import getTPadProfiles; getTPadProfiles()"
+        )
+        assert loaded == []
+
+    def test_lazy_attribute(self):
+        """
+        Test that lazily imported attributes are still available from the package
+        """
+        import psychopy_bbtk
+        from psychopy_bbtk.bbtk import BlackBoxToolkit
+
+        assert psychopy_bbtk.BlackBoxToolkit is BlackBoxToolkit
+        assert "BlackBoxToolkit" in dir(psychopy_bbtk)
+        with pytest.raises(AttributeError):
+            psychopy_bbtk.NotAThing
@@ -0,0 +1,167 @@
+import sys
+import time
+
+import numpy as np
+import pytest
+
+from psychopy_bbtk.emulator import EmulatedTPad, TPadEmulator
+from psychopy_bbtk.onsets import OnsetDetector, VoiceOnset
+from psychopy_bbtk.tpad import TPadSoundSensorGroup
+
+
+def feed(detector, edges, channel=0):
+    """
+    Feed a detector alternating presses and releases at the given times
+    """
+    for i, t in enumerate(edges):
+        detector.addEvent(t, channel, i % 2 == 0)
+
+
+class TestOnsetDetector:
+    def test_pairing(self):
+        """
+        Test that each press/release pair becomes one onset
+        """
+        detector = OnsetDetector(debounce=0.05, minDuration=0.1)
+        feed(detector, [1.0, 1.5, 2.0, 2.3])
+        detector.update(3.0)
+        assert detector.getOnsets() == [VoiceOnset(0, 1.0, 1.5), VoiceOnset(0, 2.0, 2.3)]
+        assert detector.getOnsets() == []
+
+    def test_debounce(self):
+        """
+        Test that a release followed quickly by a press is bridged into one utterance
+        """
+        detector = OnsetDetector(debounce=0.05, minDuration=0.1)
+        feed(detector, [1.0, 1.2, 1.23, 1.5, 1.6, 1.8])
+        detector.update(3.0)
+        onsets = detector.getOnsets()
+        assert onsets == [VoiceOnset(0, 1.0, 1.5), VoiceOnset(0, 1.6, 1.8)]
+        assert onsets[0].duration == pytest.approx(0.5)
+
+    def test_min_duration(self):
+        """
+        Test that clicks shorter than the minimum duration are dropped, even once bridged into
+        something too short
+        """
+        detector = OnsetDetector(debounce=0.05, minDuration=0.1)
+        feed(detector, [1.0, 1.02, 1.04, 1.06, 2.0, 2.2])
+        detector.update(3.0)
+        assert detector.getOnsets() == [VoiceOnset(0, 2.0, 2.2)]
+
+    def test_incremental(self):
+        """
+        Test that an onset is available as soon as it's lasted long enough, before it's released,
+        and its offset is filled in once it ends
+        """
+        detector = OnsetDetector(debounce=0.05, minDuration=0.1)
+        detector.addEvent(1.0, 0, True)
+        detector.update(1.05)
+        assert detector.getOnsets(clear=False) == []
+        detector.update(1.1)
+        onset, = detector.getOnsets()
+        assert onset.onset == 1.0 and onset.offset is None
+        detector.addEvent(1.4, 0, False)
+        # not over until the debounce has passed
+        detector.update(1.42)
+        assert onset.offset is None
+        detector.update(1.5)
+        assert onset.offset == 1.4
+
+    def test_pending(self):
+        """
+        Test that utterances are only judged against events received, as a release could still
+        be on its way
+        """
+        detector = OnsetDetector(debounce=0.05, minDuration=0.1)
+        detector.addEvent(1.0, 0, True)
+        detector.update()
+        assert detector.getOnsets(clear=False) == []
+        # an event on another channel means nothing before it is still on its way
+        detector.addEvent(1.2, 1, True)
+        detector.update()
+        onset, = detector.getOnsets(channel=0)
+        assert onset.onset == 1.0 and onset.offset is None
+        # as does a time given, if later
+        detector.addEvent(1.3, 0, False)
+        detector.update(1.32)
+        assert onset.offset is None
+        detector.update(1.35)
+        assert onset.offset == 1.3
+
+    def test_channels(self):
+        """
+        Test that channels are paired separately, and repeated edges are ignored
+        """
+        detector = OnsetDetector(debounce=0.05, minDuration=0.1)
+        detector.addBatch(
+            np.array([1.0, 1.1, 1.2, 1.3, 1.5, 1.6]),
+            np.array([0, 1, 0, 0, 1, 0]),
+            np.array([True, True, True, False, False, False]),
+        )
+        detector.update(3.0)
+        assert detector.getOnsets(channel=1) == [VoiceOnset(1, 1.1, 1.5)]
+        assert detector.getOnsets(channel=0) == [VoiceOnset(0, 1.0, 1.3)]
+        assert detector.getOnsets() == []
+
+    def test_reset(self):
+        """
+        Test that resetting forgets onsets and utterances in progress
+        """
+        detector = OnsetDetector(debounce=0.05, minDuration=0.1)
+        feed(detector, [1.0, 1.5, 2.0])
+        detector.reset()
+        detector.update(3.0)
+        assert detector.getOnsets() == []
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="TPadEmulator needs a pseudo-terminal")
+class TestSoundSensorOnsets:
+    def test_onsets(self):
+        """
+        Test that voice key events dispatched from a TPad come out as onsets
+        """
+        emulator = TPadEmulator()
+        pad = EmulatedTPad(port=emulator.port)
+        try:
+            voice = TPadSoundSensorGroup(pad, channels=1, debounce=0.02, minDuration=0.05)
+            voice.clearOnsets()
+            # a word with a flicker in the middle, then a click
+            for state, t in [(True, 0.1), (False, 0.2), (True, 0.21), (False, 0.4),
+                             (True, 0.5), (False, 0.51)]:
+                emulator.emit("M", 1, state, t=t)
+            time.sleep(0.1)
+            onsets = voice.getOnsets()
+            assert len(onsets) == 1
+            assert onsets[0].duration == pytest.approx(0.3, abs=0.002)
+        finally:
+            pad.close()
+            emulator.close()
+
+    def test_pending_release(self):
+        """
+        Test that an utterance whose release hasn't arrived yet isn't given as an onset just
+        because time has passed
+        """
+        emulator = TPadEmulator()
+        pad = EmulatedTPad(port=emulator.port)
+        try:
+            voice = TPadSoundSensorGroup(pad, channels=1, debounce=0.02, minDuration=0.05)
+            voice.clearOnsets()
+            # a click, whose release is held up on the way
+            emulator.emit("M", 1, True, t=0.1)
+            time.sleep(0.2)
+            assert voice.getOnsets(clear=False) == []
+            emulator.emit("M", 1, False, t=0.11)
+            time.sleep(0.05)
+            assert voice.getOnsets() == []
+            # a word, confirmed by an event from another device
+            emulator.emit("M", 1, True, t=0.2)
+            emulator.emit("A", 1, True, t=0.3)
+            time.sleep(0.05)
+            onset, = voice.getOnsets()
+            assert onset.onset == pytest.approx(0.2 + pad._lastTimerReset, abs=0.002)
+            assert onset.offset is None
+        finally:
+            pad.close()
+            emulator.close()
@@ -0,0 +1,131 @@
+import sys
+import time
+
+import pytest
+
+from psychopy_bbtk.emulator import EmulatedTPad, TPadEmulator
+from psychopy_bbtk.pool import TPadPool
+from psychopy_bbtk.tpad import DeviceNotConnectedError, TPadButtonGroup
+
+pytestmark = pytest.mark.skipif(
+    sys.platform == "win32", reason="TPadEmulator needs a pseudo-terminal"
+)
+
+
+class TestTPadPool:
+    def test_merged_feed(self):
+        """
+        Test that events from several TPads come out as one time-ordered feed, tagged by port
+        """
+        emulators = [TPadEmulator() for n in range(3)]
+        try:
+            with TPadPool(ports=[emu.port for emu in emulators], padClass=EmulatedTPad) as pool:
+                assert len(pool) == 3 and not pool.errors
+                nodes = pool.makeNodes(TPadButtonGroup, channels=10)
+                pool.resetTimers()
+                for n, emu in enumerate(emulators):
+                    emu.startStream(rate=2000, channels=(1, 2), burst=2, nEvents=200 * (n + 1))
+                events = []
+                start = time.time()
+                while len(events) < 1200 and time.time() - start < 5:
+                    events += pool.getEvents()
+                    time.sleep(0.01)
+            # every event should arrive, from the right port
+            for n, emu in enumerate(emulators):
+                assert sum(evt.port == emu.port for evt in events) == 200 * (n + 1)
+                assert len(nodes[emu.port].responses) == 200 * (n + 1)
+            assert len(events) == 1200
+        finally:
+            for emu in emulators:
+                emu.close()
+
+    def test_node_dispatch(self):
+        """
+        Test that events dispatched by nodes between calls to getEvents still reach the feed
+        """
+        emulators = [TPadEmulator() for n in range(2)]
+        try:
+            with TPadPool(ports=[emu.port for emu in emulators], padClass=EmulatedTPad) as pool:
+                nodes = pool.makeNodes(TPadButtonGroup, channels=10)
+                pool.resetTimers()
+                for emu in emulators:
+                    emu.startStream(rate=2000, channels=(1, 2), nEvents=200)
+                events = []
+                start = time.time()
+                while len(events) < 400 and time.time() - start < 5:
+                    # dispatch via the nodes, as an experiment polling its buttons would
+                    for node in nodes.values():
+                        node.dispatchMessages()
+                    time.sleep(0.005)
+                    events += pool.getEvents()
+            for emu in emulators:
+                assert sum(evt.port == emu.port for evt in events) == 200
+                assert len(nodes[emu.port].responses) == 200
+        finally:
+            for emu in emulators:
+                emu.close()
+
+    def test_threaded_kwarg(self):
+        """
+        Test that giving `threaded` is rejected with a clear error
+        """
+        with pytest.raises(TypeError, match="threaded"):
+            TPadPool(ports=[], padClass=EmulatedTPad, threaded=False)
+
+    def test_holdback(self):
+        """
+        Test that events are merged in time order across TPads and calls when held back
+        """
+        emulators = [TPadEmulator() for n in range(2)]
+        try:
+            with TPadPool(ports=[emu.port for emu in emulators], padClass=EmulatedTPad) as pool:
+                pool.makeNodes(TPadButtonGroup, channels=10)
+                pool.resetTimers()
+                for emu in emulators:
+                    emu.startStream(rate=1000, channels=(1,), nEvents=100)
+                events = []
+                start = time.time()
+                while len(events) < 200 and time.time() - start < 5:
+                    events += pool.getEvents(holdback=0.05)
+                    time.sleep(0.005)
+            assert len(events) == 200
+            times = [evt.t for evt in events]
+            assert times == sorted(times)
+        finally:
+            for emu in emulators:
+                emu.close()
+
+    def test_open_error(self):
+        """
+        Test that a TPad failing to open doesn't stop the rest
+        """
+        emulator = TPadEmulator()
+        try:
+            pool = TPadPool(ports=[emulator.port, "/dev/nonexistent"], padClass=EmulatedTPad)
+            with pool:
+                assert list(pool.pads) == [emulator.port]
+                err = pool.errors["/dev/nonexistent"]
+                assert isinstance(err, DeviceNotConnectedError)
+                assert "/dev/nonexistent" in str(err)
+        finally:
+            emulator.close()
+
+    def test_node_error(self):
+        """
+        Test that if a node can't be made on one TPad, those made on the others are detached
+        """
+        emulators = [TPadEmulator() for n in range(3)]
+        try:
+            with TPadPool(ports=[emu.port for emu in emulators], padClass=EmulatedTPad) as pool:
+
+                def _makeNode(pad, **kwargs):
+                    if pad.portString == emulators[1].port:
+                        raise ValueError("Could not make node")
+                    return TPadButtonGroup(pad, **kwargs)
+
+                with pytest.raises(ValueError):
+                    pool.makeNodes(_makeNode, channels=10)
+                assert not any(pad.nodes for pad in pool)
+        finally:
+            for emu in emulators:
+                emu.close()
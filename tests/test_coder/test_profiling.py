@@ -0,0 +1,106 @@
+import sys
+
+import pytest
+
+from psychopy_bbtk.emulator import EmulatedTPad, TPadEmulator
+from psychopy_bbtk.profiling import DispatchStats, LatencyProfile
+
+
+class TestLatencyProfile:
+    def test_stats(self):
+        """
+        Test that summary stats are given in seconds and cover the whole distribution
+        """
+        profile = LatencyProfile(
+            [n * 1000 for n in range(1, 101)], command="FIRM", mode=0, failures=2
+        )
+        stats = profile.getStats()
+        assert stats['n'] == 100
+        assert stats['failures'] == 2
+        assert stats['min'] == 1e-6
+        assert stats['max'] == 1e-4
+        assert abs(stats['median'] - 50.5e-6) < 1e-12
+        assert stats['p95'] < stats['p99'] < stats['max']
+        counts, edges = profile.getHistogram(bins=10)
+        assert counts.sum() == 100
+
+    def test_no_replies(self):
+        """
+        Test that a profile with no successful attempts doesn't error
+        """
+        profile = LatencyProfile([], command="FIRM", failures=25)
+        assert profile.mean is None
+        assert profile.getStats()['median'] is None
+        assert profile.getJSON(asString=False)['histogram']['counts'] == []
+
+    def test_json_roundtrip(self, tmp_path):
+        """
+        Test that a profile saved as JSON can be loaded again
+        """
+        profile = LatencyProfile([1500, 2500, 1800], command="R", mode=3, port="COM6")
+        profile.save(tmp_path / "latency.json")
+        loaded = LatencyProfile.load(tmp_path / "latency.json")
+        assert loaded.samples.tolist() == [1500, 2500, 1800]
+        assert loaded.command == "R"
+        assert loaded.mode == 3
+        assert loaded.getStats() == profile.getStats()
+
+
+class TestDispatchStats:
+    def test_histograms(self):
+        """
+        Test that values land in the right power-of-2 buckets
+        """
+        stats = DispatchStats()
+        for ns in (0, 1, 3, 1000, 1023, 1024):
+            stats.addDispatch(ns)
+        result = stats.getStats()
+        assert result['dispatches'] == 6
+        assert result['maxDispatchNs'] == 1024
+        assert result['dispatchHist'] == {0: 1, 2: 1, 4: 1, 1024: 2, 2048: 1}
+
+    def test_reads(self):
+        """
+        Test that reads are split into valid, unparsable and partial lines
+        """
+        stats = DispatchStats()
+        stats.addRead(100, nLines=5, nMessages=4, partial=True)
+        stats.addRead(20, nLines=1, nMessages=1, partial=False)
+        result = stats.getStats()
+        assert (result['reads'], result['bytesRead']) == (2, 120)
+        assert (result['linesParsed'], result['unparsable']) == (5, 1)
+        assert result['partialLines'] == 1
+        stats.reset()
+        assert stats.getStats()['bytesRead'] == 0
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="TPadEmulator needs a pseudo-terminal")
+class TestProfileLatency:
+    def setup_method(self):
+        self.emulator = TPadEmulator(firmware="TPad emulator\nversion 1.0", replyDelay=0.005)
+        self.pad = EmulatedTPad(port=self.emulator.port)
+
+    def teardown_method(self):
+        self.pad.close()
+        self.emulator.close()
+
+    def test_multiline(self):
+        """
+        Test that the rest of a reply over several lines isn't taken as the reply to the next
+        attempt
+        """
+        profile = self.pad.profileLatency(nSamples=10, command="FIRM", mode=0, interval=0)
+        assert len(profile) == 10
+        # every sample waited for its own reply
+        assert profile.samples.min() >= 2.5e6
+        assert self.emulator.commands.count("FIRM") == 11
+
+    def test_mode3_default(self):
+        """
+        Test that profiling in data collection mode doesn't reset the TPad's timer by default
+        """
+        self.emulator.commands.clear()
+        profile = self.pad.profileLatency(nSamples=5, mode=3)
+        assert profile.command == "Z"
+        assert len(profile) == 5
+        assert "R" not in self.emulator.commands
@@ -0,0 +1,50 @@
+import numpy as np
+
+from psychopy_bbtk import decodeEvents, eventsToDicts
+from psychopy_bbtk.emulator import makeDumpBytes
+from psychopy_bbtk.recording import eventsBetween, eventsFromDicts, loadEvents, saveEvents
+
+
+class TestRecording:
+    def test_roundtrip(self, tmp_path):
+        """
+        Test that a saved recording loads back identically, memory-mapped
+        """
+        events, states, times = decodeEvents(makeDumpBytes(1000))
+        filename = saveEvents(tmp_path / "recording", events)
+        assert filename.suffix == ".npy"
+        loaded = loadEvents(filename)
+        assert isinstance(loaded, np.memmap)
+        assert np.array_equal(loaded, events)
+
+    def test_other_extension(self, tmp_path):
+        """
+        Test that a file with an extension other than .npy is saved under the name given
+        """
+        events, states, times = decodeEvents(makeDumpBytes(100))
+        filename = saveEvents(tmp_path / "run.dat", events)
+        assert filename == tmp_path / "run.dat"
+        assert filename.exists()
+        assert np.array_equal(loadEvents(filename), events)
+
+    def test_from_dicts(self, tmp_path):
+        """
+        Test that events in the dict format from getEvents save the same as the structured array
+        """
+        events, states, times = decodeEvents(makeDumpBytes(1000))
+        filename = saveEvents(tmp_path / "recording.npy", eventsToDicts(states, times))
+        assert np.array_equal(loadEvents(filename, mmap=False), events)
+        assert np.array_equal(eventsFromDicts(eventsToDicts(states, times)), events)
+
+    def test_between(self, tmp_path):
+        """
+        Test that slicing by time window includes the start and excludes the stop
+        """
+        events, states, times = decodeEvents(makeDumpBytes(1000))
+        loaded = loadEvents(saveEvents(tmp_path / "recording", events))
+        start, stop = events['time'][100], events['time'][200]
+        window = eventsBetween(loaded, start, stop)
+        assert (window['time'] >= start).all() and (window['time'] < stop).all()
+        assert len(window) == ((events['time'] >= start) & (events['time'] < stop)).sum()
+        assert len(eventsBetween(loaded, stop, start)) == 0
+        assert len(eventsBetween(loaded)) == len(events)